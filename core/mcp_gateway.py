@@ -3,7 +3,7 @@
 SIMPLE MCP - MCP Gateway (Core Component)
 
 Purpose: HTTP to MCP protocol bridge with Ollama AI integration
-Technology: Flask HTTP server + MCP direct tools + Ollama AI
+Technology: ASGI (Starlette + uvicorn) or Flask HTTP server + MCP direct tools + Ollama AI
 Architecture: HTTP Request → Ollama AI → MCP Tools → Live API Data → Response
 
 This gateway serves as the main entry point for the MCP system.
@@ -16,11 +16,19 @@ Key Features:
 - Hebrew language support
 - Windows encoding compatibility
 - Error handling and timeout management
+- Async core on one long-lived event loop (no per-request event loops)
+
+Server Modes (GATEWAY_MODE environment variable):
+- asgi (default) - Starlette app served by uvicorn, all requests share one event loop
+- flask - Legacy Flask dev server, requests run on a shared background event loop
 
 Endpoints:
 - GET / - Server status and info
 - POST /api/chat - Main chat endpoint with AI and MCP tools
+- POST /api/chat/stream - Same flow streamed as Server-Sent Events (answer tokens as generated)
+- POST /api/chat/jobs - Same flow as a background job; GET /api/chat/jobs/<id>[/events] for its result or progress
 - GET /api/tools - Available tools listing
+- GET /api/metrics - Ollama load/eval timing and gateway metrics
 
 Created: 2025-08-26
 Author: SIMPLE MCP Project  
@@ -29,19 +37,64 @@ Port: 3001
 """
 
 import asyncio
+import hashlib
+import heapq
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
 import httpx
-import requests
-from flask import Flask, request, jsonify
+import uvicorn
+from collections import Counter, OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
 
 # Initialize Flask app with CORS support
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["Retry-After", "Location"])
 
 # Configuration
 OLLAMA_API_URL = "http://localhost:11434"
+# Ollama instances to balance across (e.g. one pinned to each NUMA node), comma separated
+OLLAMA_BACKENDS = [url.strip().rstrip("/") for url in os.environ.get("OLLAMA_BACKENDS", OLLAMA_API_URL).split(",") if url.strip()]
+OLLAMA_HEALTH_INTERVAL_SECONDS = 15  # Active health and residency check of every backend (0 disables)
+OLLAMA_BACKEND_MAX_FAILURES = 3  # Consecutive failures that take a backend out of rotation
+OLLAMA_BACKEND_EJECT_SECONDS = 30  # How long a failing backend stays out unless a health check passes
+OLLAMA_COLD_BACKEND_PENALTY = 1.0  # Extra load (in full batches) a backend without the model counts as
 OLLAMA_MODEL = "aya"  # Hebrew-capable model
+# Per pipeline stage models, OLLAMA_MODEL for stages not listed. Tool selection is a small
+# classification task a small model does in a fraction of the time: pull one and set
+# OLLAMA_TOOL_SELECTION_MODEL (e.g. qwen2.5:1.5b) to opt in. Its replies that fail
+# validation are escalated to the "tool_selection_escalated" model.
+OLLAMA_STAGE_MODELS = {
+    "tool_selection": os.environ.get("OLLAMA_TOOL_SELECTION_MODEL") or OLLAMA_MODEL,
+    "tool_selection_escalated": OLLAMA_MODEL,
+    "answer": OLLAMA_MODEL,
+    "summary": OLLAMA_MODEL
+}
+OLLAMA_OPTIONS = {
+    "num_thread": 4,
+    "num_gpu": 0,
+    "temperature": 0.7
+}
+OLLAMA_TIMEOUT_SECONDS = 600  # 10 minutes timeout for complex queries
+OLLAMA_KEEP_ALIVE = "30m"  # How long Ollama keeps the model loaded after each request
+OLLAMA_WARM_INTERVAL_SECONDS = 240  # Idle ping that keeps the model resident (0 disables)
+OLLAMA_MAX_CONNECTIONS = 32  # Pooled keep-alive connections to Ollama
+OLLAMA_NUM_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", 2))  # Sequences each Ollama server decodes together (its OLLAMA_NUM_PARALLEL)
+OLLAMA_TOOL_CALLING = "format"  # "format" (JSON-schema constrained output, any model) or "tools" (native tool calls, tools-capable models only)
 BASE_URL = "https://jsonplaceholder.typicode.com"
+GATEWAY_MODE = os.environ.get("GATEWAY_MODE", "asgi")  # "asgi" or "flask"
+GATEWAY_PORT = 3001
 
 # === MCP TOOLS - Direct Integration ===
 # These tools implement the same functionality as the MCP server
@@ -139,42 +192,1114 @@ async def get_post_comments_tool(post_id: int):
             ]
         }
 
-# === HTTP ENDPOINTS ===
+# === TOOL REGISTRY ===
+# One description per tool: the tools listing, the Ollama tool definitions,
+# the constrained-output schema and dispatch are all generated from it.
+# Compound questions are planned as a list of calls that run concurrently.
 
-@app.route('/api/chat', methods=['POST'])
-def chat_with_ai():
+TOOL_CALLS_MAX = 5  # Most tool calls planned for one question
+TOOL_FANOUT_LIMIT = 3  # Tool calls of one question running at the same time
+
+TOOL_REGISTRY = {
+    "get_posts": {
+        "function": get_posts_tool,
+        "description": "Get blog posts with limit parameter",
+        "parameters": {
+            "type": "object",
+            "properties": {"limit": {"type": "integer", "minimum": 1, "maximum": 100, "description": "How many posts to return"}},
+            "required": []
+        }
+    },
+    "get_user_info": {
+        "function": get_user_info_tool,
+        "description": "Get user information by user_id",
+        "parameters": {
+            "type": "object",
+            "properties": {"user_id": {"type": "integer", "minimum": 1, "description": "User id"}},
+            "required": ["user_id"]
+        }
+    },
+    "search_posts_by_user": {
+        "function": search_posts_by_user_tool,
+        "description": "Get all posts by specific user_id",
+        "parameters": {
+            "type": "object",
+            "properties": {"user_id": {"type": "integer", "minimum": 1, "description": "User id"}},
+            "required": ["user_id"]
+        }
+    },
+    "get_post_comments": {
+        "function": get_post_comments_tool,
+        "description": "Get post with comments by post_id",
+        "parameters": {
+            "type": "object",
+            "properties": {"post_id": {"type": "integer", "minimum": 1, "description": "Post id"}},
+            "required": ["post_id"]
+        }
+    }
+}
+
+def ollama_tool_definitions():
+    """Tool definitions for Ollama's /api/chat "tools" field"""
+    return [
+        {
+            "type": "function",
+            "function": {"name": name, "description": tool["description"], "parameters": tool["parameters"]}
+        }
+        for name, tool in TOOL_REGISTRY.items()
+    ]
+
+def tool_call_schema():
     """
-    Main chat endpoint that integrates Ollama AI with MCP tools
-    
-    Flow:
-    1. Receive user message
-    2. Detect language (Hebrew/English)
-    3. Send to Ollama AI with tool instructions
-    4. Parse AI response for tool usage
-    5. Execute MCP tools if needed
-    6. Send results back to Ollama for formatting
-    7. Return final response to user
+    JSON schema for Ollama's "format" field: the model can only answer with
+    one well-formed tool call, a list of them or a plain answer, never free
+    text around JSON
     """
+    calls = [
+        {
+            "type": "object",
+            "properties": {"tool": {"const": name}, "parameters": tool["parameters"]},
+            "required": ["tool", "parameters"]
+        }
+        for name, tool in TOOL_REGISTRY.items()
+    ]
+    several = {
+        "type": "object",
+        "properties": {
+            "use_tool": {"const": True},
+            "tool_calls": {"type": "array", "items": {"anyOf": calls}, "minItems": 2, "maxItems": TOOL_CALLS_MAX}
+        },
+        "required": ["use_tool", "tool_calls"]
+    }
+    tool_calls = [
+        {
+            "type": "object",
+            "properties": {
+                "use_tool": {"const": True},
+                "tool": {"const": name},
+                "parameters": tool["parameters"]
+            },
+            "required": ["use_tool", "tool", "parameters"]
+        }
+        for name, tool in TOOL_REGISTRY.items()
+    ]
+    answer = {
+        "type": "object",
+        "properties": {"use_tool": {"const": False}, "answer": {"type": "string"}},
+        "required": ["use_tool", "answer"]
+    }
+    return {"anyOf": tool_calls + [several, answer]}
+
+# === LOCAL ID VALIDATION ===
+# The model often guesses user/post ids that do not exist. Ids are checked
+# against the known users/posts before calling the upstream, so a bad guess
+# is answered immediately instead of costing a 404 and another AI round trip.
+
+KNOWN_IDS_TTL_SECONDS = 300
+
+# Tool parameter -> (collection, English name, Hebrew name)
+ID_PARAMETERS = {
+    "user_id": ("users", "user", "משתמש"),
+    "post_id": ("posts", "post", "פוסט")
+}
+
+class KnownIds:
+    """Valid user/post ids, refreshed from the API every few minutes"""
+
+    def __init__(self):
+        self.ids = {}
+        self.loaded_at = None
+
+    async def refresh_if_stale(self):
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < KNOWN_IDS_TTL_SECONDS:
+            return
+        async with httpx.AsyncClient() as client:
+            responses = await asyncio.gather(
+                *(client.get(f"{BASE_URL}/{collection}") for collection, _, _ in ID_PARAMETERS.values())
+            )
+        for parameter, response in zip(ID_PARAMETERS, responses):
+            response.raise_for_status()
+            self.ids[parameter] = sorted(item["id"] for item in response.json())
+        self.loaded_at = time.monotonic()
+
+known_ids = KnownIds()
+
+def _describe_ids(ids):
+    """Compact description of valid ids, e.g. 1-10"""
+    if ids and ids[-1] - ids[0] + 1 == len(ids):
+        return f"{ids[0]}-{ids[-1]}"
+    return ", ".join(str(i) for i in ids[:20]) + ("..." if len(ids) > 20 else "")
+
+async def validate_tool_ids(parameters, is_hebrew=False):
+    """
+    Check id parameters locally before any upstream call
+
+    Returns:
+        A user-facing message when an id is invalid, otherwise None
+    """
+    if not any(name in parameters for name in ID_PARAMETERS):
+        return None
     try:
-        data = request.json
-        user_message = data.get('message', '')
-        
-        if not user_message:
-            return jsonify({"error": "No message provided"}), 400
-        
-        # Detect Hebrew language
-        is_hebrew = any(ord(char) >= 0x0590 and ord(char) <= 0x05FF for char in user_message)
-        
-        # System prompt for Ollama AI
-        system_prompt = f"""
-You are a helpful AI assistant with access to LIVE DATA through MCP tools.
+        await known_ids.refresh_if_stale()
+    except httpx.HTTPError as e:
+        print(f"Skipping id validation: {e}")
+        return None
+
+    for name, (_, english, hebrew) in ID_PARAMETERS.items():
+        if name not in parameters:
+            continue
+        value = parameters[name]
+        valid = known_ids.ids.get(name, [])
+        try:
+            parameters[name] = int(value)  # Models sometimes send "1"
+        except (TypeError, ValueError):
+            pass
+        if parameters[name] not in valid:
+            if is_hebrew:
+                return f"לא קיים {hebrew} עם מזהה {value}. מזהים זמינים: {_describe_ids(valid)}"
+            return f"There is no {english} with id {value}. Available {english} ids: {_describe_ids(valid)}"
+    return None
+
+# === METRICS ===
+
+class LatencyStats:
+    """Count / mean / p50 / p95 / max per named latency, over a recent window"""
+
+    WINDOW = 500
+
+    def __init__(self):
+        self.samples = {}
+        self.counts = Counter()
+
+    def record(self, name, seconds):
+        self.samples.setdefault(name, deque(maxlen=self.WINDOW)).append(seconds)
+        self.counts[name] += 1
+
+    def snapshot(self):
+        result = {}
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            result[name] = {
+                "count": self.counts[name],
+                "mean_seconds": round(sum(ordered) / len(ordered), 3),
+                "p50_seconds": round(ordered[len(ordered) // 2], 3),
+                "p95_seconds": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                "max_seconds": round(ordered[-1], 3)
+            }
+        return result
+
+chat_latency = LatencyStats()
+answer_sources = Counter()  # How tool answers were written: "model", "template" or "formatted_cache"
+model_escalations = Counter()  # Tool selections retried on the escalation model, by reason
+
+# === OLLAMA ===
+# One pooled HTTP client for the gateway's lifetime: connections to Ollama
+# are reused instead of opened per call, every request pins the model with
+# keep_alive, and an idle ping keeps it resident between bursts so users
+# never pay a multi-second model reload. Generations are spread over the
+# OLLAMA_BACKENDS by least outstanding requests, preferring backends that
+# already have the model loaded and skipping ones that keep failing.
+
+COLD_LOAD_SECONDS = 1.0  # load_duration above this means the model was (re)loaded
+
+# Generations waiting for a slot start in this order: finishing a chat that
+# already has its tool data comes before starting a new one, and background
+# summaries (any other stage) go last
+GENERATION_STAGE_ORDER = {"answer": 0, "tool_selection_escalated": 1, "tool_selection": 1}
+
+def stage_model(stage):
+    """The model that runs a pipeline stage's generations"""
+    return OLLAMA_STAGE_MODELS.get(stage) or OLLAMA_MODEL
+
+class OllamaError(Exception):
+    """Ollama answered with a non-200 status"""
+
+    def __init__(self, status_code):
+        super().__init__(f"Ollama API error: {status_code}")
+        self.status_code = status_code
+
+class OllamaStats:
+    """Load vs prompt-eval vs generation time, from Ollama's response fields"""
+
+    def __init__(self):
+        self.requests = 0
+        self.cold_loads = 0
+        self.load_seconds = 0.0
+        self.prompt_eval_seconds = 0.0
+        self.prompt_tokens = 0
+        self.eval_seconds = 0.0
+        self.eval_tokens = 0
+        self.warm_pings = 0
+        self.stopped_early = 0  # Generations closed before Ollama finished them
+        self.abandoned = 0  # Generations cancelled because nobody waits for the chat anymore
+        self.wasted_seconds = 0.0  # Generation time spent on them
+        self.stages = {}
+
+    def record(self, result, stage=None):
+        """
+        Accumulate the *_duration (nanoseconds) and *_count fields of one response.
+        Prompt eval is also kept per pipeline stage: Ollama only evaluates the
+        tokens after the cached prefix, so its count and time show cache reuse.
+        """
+        load_seconds = result.get("load_duration", 0) / 1e9
+        self.requests += 1
+        self.cold_loads += load_seconds > COLD_LOAD_SECONDS
+        self.load_seconds += load_seconds
+        self.prompt_eval_seconds += result.get("prompt_eval_duration", 0) / 1e9
+        self.prompt_tokens += result.get("prompt_eval_count", 0)
+        self.eval_seconds += result.get("eval_duration", 0) / 1e9
+        self.eval_tokens += result.get("eval_count", 0)
+        if stage:
+            totals = self.stages.setdefault(stage, Counter())
+            totals["requests"] += 1
+            totals["prompt_eval_seconds"] += result.get("prompt_eval_duration", 0) / 1e9
+            totals["prompt_tokens"] += result.get("prompt_eval_count", 0)
+
+    def record_first_chunk(self, stage, seconds):
+        """Time to the first streamed chunk (load + prompt eval), known even for streams stopped early"""
+        totals = self.stages.setdefault(stage, Counter())
+        totals["first_chunks"] += 1
+        totals["first_chunk_seconds"] += seconds
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "cold_loads": self.cold_loads,
+            "warm_pings": self.warm_pings,
+            "stopped_early": self.stopped_early,
+            "abandoned": self.abandoned,
+            "wasted_generation_seconds": round(self.wasted_seconds, 3),
+            "load_seconds": round(self.load_seconds, 3),
+            "prompt_eval_seconds": round(self.prompt_eval_seconds, 3),
+            "prompt_tokens": self.prompt_tokens,
+            "eval_seconds": round(self.eval_seconds, 3),
+            "eval_tokens": self.eval_tokens,
+            "eval_tokens_per_second": round(self.eval_tokens / self.eval_seconds, 2) if self.eval_seconds else None,
+            "prompt_eval_by_stage": {
+                stage: {
+                    "requests": totals["requests"],
+                    "mean_prompt_tokens": round(totals["prompt_tokens"] / totals["requests"], 1) if totals["requests"] else None,
+                    "mean_prompt_eval_seconds": round(totals["prompt_eval_seconds"] / totals["requests"], 3) if totals["requests"] else None,
+                    "mean_seconds_to_first_chunk": round(totals["first_chunk_seconds"] / totals["first_chunks"], 3) if totals["first_chunks"] else None
+                }
+                for stage, totals in self.stages.items()
+            }
+        }
+
+class GenerationSlots:
+    """
+    Dispatcher for Ollama's parallel decoding slots. Ollama batches up to
+    OLLAMA_NUM_PARALLEL sequences together and queues the rest internally,
+    out of the gateway's sight. Generations are started here only when a
+    slot is free, so each slot that frees up goes to the most urgent waiting
+    generation from any chat (answers before new tool selections), and
+    slot utilization is measured.
+    """
+
+    def __init__(self, slots=OLLAMA_NUM_PARALLEL):
+        self.slots = slots
+        self.busy = 0
+        self.peak_busy = 0
+        self.waiting = []  # Heap of (stage order, arrival, waiter)
+        self.arrivals = 0
+        self.started_at = self.changed_at = time.monotonic()
+        self.busy_seconds = 0.0  # Integral of busy slots over time
+        self.dispatched = Counter()
+        self.waits = LatencyStats()
+
+    def _account(self):
+        now = time.monotonic()
+        self.busy_seconds += self.busy * (now - self.changed_at)
+        self.changed_at = now
+
+    async def acquire(self, stage=None):
+        """Wait until a slot is free for a generation of this pipeline stage"""
+        queued_at = time.monotonic()
+        if self.busy < self.slots and not self.waiting:
+            self._account()
+            self.busy += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self.arrivals += 1
+            heapq.heappush(self.waiting, (GENERATION_STAGE_ORDER.get(stage, len(GENERATION_STAGE_ORDER)), self.arrivals, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self.release()  # Handed a slot just as the caller went away
+                raise
+        self.peak_busy = max(self.peak_busy, self.busy)
+        self.dispatched[stage or "other"] += 1
+        self.waits.record(stage or "other", time.monotonic() - queued_at)
+
+    def release(self):
+        """Free a slot, handing it straight to the next waiting generation"""
+        while self.waiting:
+            _, _, waiter = heapq.heappop(self.waiting)
+            if not waiter.done():  # Cancelled waiters are skipped
+                waiter.set_result(None)
+                return
+        self._account()
+        self.busy -= 1
+
+    def snapshot(self):
+        self._account()
+        elapsed = self.changed_at - self.started_at
+        return {
+            "slots": self.slots,
+            "busy": self.busy,
+            "peak_busy": self.peak_busy,
+            "waiting": sum(not waiter.done() for _, _, waiter in self.waiting),
+            "utilization": round(self.busy_seconds / (self.slots * elapsed), 3) if elapsed else None,
+            "dispatched": dict(self.dispatched),
+            "slot_wait_seconds": self.waits.snapshot()
+        }
+
+def _model_tag(model):
+    """Ollama's full model name, e.g. aya -> aya:latest"""
+    return model if ":" in model else f"{model}:latest"
+
+class OllamaBackend:
+    """One Ollama instance: its generation slots, health, loaded models and latency"""
+
+    def __init__(self, url, slots=OLLAMA_NUM_PARALLEL):
+        self.url = url
+        self.slots = GenerationSlots(slots)
+        self.outstanding = 0  # Generations routed here, running or waiting for a slot
+        self.loaded_models = set()
+        self.failures = 0  # Consecutive
+        self.ejected_until = None
+        self.requests = 0
+        self.errors = 0
+        self.latency = LatencyStats()
+
+    def available(self):
+        return self.ejected_until is None or time.monotonic() >= self.ejected_until
+
+    def load(self, model):
+        """Routing cost: outstanding generations per slot, plus a penalty when the model is not loaded"""
+        cold = 0 if _model_tag(model) in self.loaded_models else OLLAMA_COLD_BACKEND_PENALTY
+        return self.outstanding / self.slots.slots + cold
+
+    def record_success(self, model, seconds, first_chunk_seconds=None):
+        self.requests += 1
+        self.failures = 0
+        self.ejected_until = None
+        self.loaded_models.add(_model_tag(model))
+        self.latency.record("generation", seconds)
+        if first_chunk_seconds is not None:
+            self.latency.record("first_chunk", first_chunk_seconds)
+
+    def record_failure(self, error):
+        """Passive health check: repeated failures take the backend out of rotation for a while"""
+        self.errors += 1
+        self.failures += 1
+        if self.failures >= OLLAMA_BACKEND_MAX_FAILURES:
+            if self.available():
+                print(f"[OLLAMA] Backend {self.url} out of rotation: {error}")
+            self.ejected_until = time.monotonic() + OLLAMA_BACKEND_EJECT_SECONDS
+
+    def record_health(self, loaded_models):
+        """Active health check passed: back in rotation, with the models it reports loaded"""
+        self.failures = 0
+        self.ejected_until = None
+        self.loaded_models = {_model_tag(model) for model in loaded_models}
+
+    def snapshot(self):
+        return {
+            "url": self.url,
+            "available": self.available(),
+            "outstanding": self.outstanding,
+            "loaded_models": sorted(self.loaded_models),
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_failures": self.failures,
+            "latency": self.latency.snapshot(),
+            "slots": self.slots.snapshot()
+        }
+
+class OllamaClient:
+    """Gateway-lifetime Ollama client with a keep-alive connection pool over the backends"""
+
+    def __init__(self, backends=None):
+        self.stats = OllamaStats()
+        self.backends = backends or [OllamaBackend(url) for url in OLLAMA_BACKENDS]
+        self.last_request_at = None
+        self._client = None
+        self._loop = None
+        self._warm_task = None
+        self._health_task = None
+
+    def pick_backend(self, model, exclude=()):
+        """Least loaded available backend for the model (any backend when none is available)"""
+        candidates = [backend for backend in self.backends if backend not in exclude] or self.backends
+        available = [backend for backend in candidates if backend.available()] or candidates
+        return min(available, key=lambda backend: backend.load(model))
+
+    def _http(self):
+        """Pooled client for the running event loop (httpx clients are loop-bound)"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=OLLAMA_TIMEOUT_SECONDS,
+                limits=httpx.Limits(max_connections=OLLAMA_MAX_CONNECTIONS,
+                                    max_keepalive_connections=OLLAMA_MAX_CONNECTIONS)
+            )
+            self._loop = loop
+        return self._client
+
+    def chat_stream(self, messages, tools=None, format=None, stage=None):
+        """
+        Stream an /api/chat reply with the model pinned in memory
+
+        Args:
+            messages: Chat messages ({"role", "content"})
+            tools: Ollama tool definitions, answered with message.tool_calls
+            format: JSON schema the reply is constrained to
+            stage: Pipeline stage, which picks the model (stage_model) and
+                the prompt-eval timing is reported under
+
+        Yields:
+            Ollama's NDJSON chunks ("message" holds the new content or tool
+            calls, the final chunk has done=true and the timing fields)
+
+        Raises:
+            OllamaError: Ollama answered with an error status
+        """
+        body = {
+            "model": stage_model(stage),
+            "messages": messages,
+            "stream": True,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": OLLAMA_OPTIONS
+        }
+        if tools:
+            body["tools"] = tools
+        if format is not None:
+            body["format"] = format
+        return self._stream("/api/chat", body, stage)
+
+    async def _stream(self, path, body, stage=None):
+        """
+        POST a streaming request to a backend, once one of its generation
+        slots is free, and yield its NDJSON chunks. Closing the generator
+        early closes the connection, which stops the generation and frees
+        its slot. A backend that fails before sending anything is retried
+        on the next one.
+        """
+        tried = []
+        while True:
+            backend = self.pick_backend(body["model"], tried)
+            tried.append(backend)
+            backend.outstanding += 1
+            try:
+                await backend.slots.acquire(stage)
+            except asyncio.CancelledError:
+                backend.outstanding -= 1  # Gave up while waiting for a slot
+                raise
+            first_chunk_seconds = None
+            try:
+                started = self.last_request_at = time.monotonic()
+                async with self._http().stream("POST", f"{backend.url}{path}", json=body) as response:
+                    if response.status_code != 200:
+                        raise OllamaError(response.status_code)
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        chunk = json.loads(line)
+                        if first_chunk_seconds is None:
+                            first_chunk_seconds = time.monotonic() - started
+                            if stage:
+                                self.stats.record_first_chunk(stage, first_chunk_seconds)
+                        if chunk.get("done"):
+                            self.stats.record(chunk, stage)
+                            backend.record_success(body["model"], time.monotonic() - started, first_chunk_seconds)
+                        try:
+                            yield chunk
+                        except GeneratorExit:
+                            if not chunk.get("done"):
+                                self.stats.stopped_early += 1
+                            raise
+                return
+            except asyncio.CancelledError:
+                self.stats.abandoned += 1
+                self.stats.wasted_seconds += time.monotonic() - started
+                raise
+            except (httpx.TransportError, OllamaError) as e:
+                if isinstance(e, OllamaError) and e.status_code < 500:
+                    raise  # The request's fault (e.g. unknown model), not the backend's
+                backend.record_failure(e)
+                if first_chunk_seconds is not None or len(tried) == len(self.backends):
+                    raise
+                print(f"[OLLAMA] Backend {backend.url} failed, retrying on another: {e}")
+            finally:
+                backend.slots.release()
+                backend.outstanding -= 1
+
+    async def warm(self):
+        """Load every stage's model (or refresh its keep_alive) on every backend without generating anything"""
+        for backend in self.backends:
+            try:
+                for model in dict.fromkeys([OLLAMA_MODEL, *OLLAMA_STAGE_MODELS.values()]):
+                    response = await self._http().post(
+                        f"{backend.url}/api/generate",
+                        json={"model": model, "keep_alive": OLLAMA_KEEP_ALIVE}
+                    )
+                    if 400 <= response.status_code < 500:
+                        # e.g. the model was never pulled: a configuration problem, not a failing backend
+                        print(f"[WARM] Model {model} not available on {backend.url}: {response.status_code}")
+                        continue
+                    if response.status_code != 200:
+                        raise OllamaError(response.status_code)
+                    backend.loaded_models.add(_model_tag(model))
+            except (httpx.HTTPError, OllamaError) as e:
+                print(f"[WARM] Ollama warm ping failed on {backend.url}: {e}")
+                backend.record_failure(e)
+        self.stats.warm_pings += 1
+
+    async def check_health(self):
+        """Active health check: ask every backend which models it has loaded (/api/ps)"""
+        async def check(backend):
+            try:
+                response = await self._http().get(f"{backend.url}/api/ps", timeout=5)
+                if response.status_code != 200:
+                    raise OllamaError(response.status_code)
+                backend.record_health(model["name"] for model in response.json().get("models", []))
+            except (httpx.HTTPError, OllamaError, ValueError) as e:
+                backend.record_failure(e)
+        await asyncio.gather(*(check(backend) for backend in self.backends))
+
+    async def _keep_healthy(self):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(OLLAMA_HEALTH_INTERVAL_SECONDS)
+
+    async def _keep_warm(self):
+        while True:
+            idle = self.last_request_at is None or time.monotonic() - self.last_request_at >= OLLAMA_WARM_INTERVAL_SECONDS
+            if idle:
+                await self.warm()
+            await asyncio.sleep(OLLAMA_WARM_INTERVAL_SECONDS)
+
+    def start(self):
+        """Start the warm-keeping ping and the backend health checks on the running event loop"""
+        if OLLAMA_WARM_INTERVAL_SECONDS > 0 and self._warm_task is None:
+            self._warm_task = asyncio.get_running_loop().create_task(self._keep_warm())
+        if OLLAMA_HEALTH_INTERVAL_SECONDS > 0 and self._health_task is None:
+            self._health_task = asyncio.get_running_loop().create_task(self._keep_healthy())
+
+    async def close(self):
+        if self._warm_task is not None:
+            self._warm_task.cancel()
+            self._warm_task = None
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+ollama = OllamaClient()
+
+# === FAST-PATH INTENT ROUTER ===
+# Most questions name their tool and id outright ("who is user 3?",
+# "תגובות לפוסט חמש"). Precompiled Hebrew/English patterns pick the tool
+# and arguments in microseconds; only confident matches skip the
+# tool-selection Ollama call, everything else goes to the model as before.
+
+INTENT_ROUTER_ENABLED = True
+INTENT_ROUTER_MIN_CONFIDENCE = 0.8
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+    "eleven": 11, "twelve": 12, "fifteen": 15, "twenty": 20,
+    "first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5,
+    "sixth": 6, "seventh": 7, "eighth": 8, "ninth": 9, "tenth": 10,
+    "אחד": 1, "אחת": 1, "שניים": 2, "שתיים": 2, "שני": 2, "שתי": 2,
+    "שלוש": 3, "שלושה": 3, "ארבע": 4, "ארבעה": 4, "חמש": 5, "חמישה": 5,
+    "שש": 6, "שישה": 6, "שבע": 7, "שבעה": 7, "שמונה": 8, "תשע": 9, "תשעה": 9,
+    "עשר": 10, "עשרה": 10, "עשרים": 20,
+    "ראשון": 1, "ראשונה": 1, "שנייה": 2, "שלישי": 3, "שלישית": 3,
+    "רביעי": 4, "רביעית": 4, "חמישי": 5, "חמישית": 5, "שישי": 6, "שישית": 6,
+    "שביעי": 7, "שביעית": 7, "שמיני": 8, "שמינית": 8, "תשיעי": 9, "תשיעית": 9,
+    "עשירי": 10, "עשירית": 10
+}
+
+_NUMBER = r"(?<!\w)ה?(\d+|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r")(?!\w)"
+_ID_LABEL = r"\s*(?:(?:number|no\.?|id|#|מספר|מס['׳]?|מזהה)\s*)?"
+_HEBREW_PREFIX = r"(?<!\w)[הלבמשו]{0,2}"
+
+NUMBER_RE = re.compile(_NUMBER)
+USER_ID_RE = re.compile(r"(?:(?<!\w)user|" + _HEBREW_PREFIX + r"משתמש)(?!\w)" + _ID_LABEL + _NUMBER)
+POST_ID_RE = re.compile(r"(?:(?<!\w)post|" + _HEBREW_PREFIX + r"פוסט)(?!\w)" + _ID_LABEL + _NUMBER)
+POSTS_RE = re.compile(r"(?<!\w)posts(?!\w)|" + _HEBREW_PREFIX + r"פוסטים(?!\w)")
+POSTS_LIMIT_RE = re.compile(_NUMBER + r"\s+(?:\w+\s+)?(?:posts|ה?פוסטים)(?!\w)")
+# "his posts", "הפוסטים שלו" - refers back to an earlier turn, only the model (with the session history) knows who
+FOLLOW_UP_RE = re.compile(r"(?<!\w)(?:his|her|hers|him|their|them|its|same|that one|שלו|שלה|שלהם|שלהן|אותו|אותה|אותם)(?!\w)")
+COMMENTS_RE = re.compile(r"(?<!\w)comments?(?!\w)|" + _HEBREW_PREFIX + r"(?:תגובות|תגובה)(?!\w)")
+# "who wrote post 5" - the comments tool's post carries no author, only the model can look one up
+AUTHOR_RE = re.compile(r"(?<!\w)(?:who|whom|whose|wrote|written|writer|authors?|email)(?!\w)|"
+                       + _HEBREW_PREFIX + r"(?:מי|כתב|כתבה|כותב|מחבר|אימייל|מייל)(?!\w)")
+# "which user has the most posts" - needs every post, not the first page get_posts returns
+AGGREGATE_RE = re.compile(r"(?<!\w)(?:most|fewest|least|more|less|top|average|how many|count)(?!\w)|"
+                          + _HEBREW_PREFIX + r"(?:הכי|ביותר|יותר|פחות|כמה|ממוצע)(?!\w)")
+
+def _number_value(token):
+    return int(token) if token.isdigit() else NUMBER_WORDS[token]
+
+def route_intent(message):
+    """
+    Pick a tool and its arguments without the model
+
+    Returns:
+        {"tool", "parameters", "confidence"} for a recognized question, otherwise None
+    """
+    text = message.lower()
+    user_id = USER_ID_RE.search(text)
+    post_id = POST_ID_RE.search(text)
+    posts = POSTS_RE.search(text)
+    comments = COMMENTS_RE.search(text)
+    numbers = {_number_value(token) for token in NUMBER_RE.findall(text)}
+    aggregate = AGGREGATE_RE.search(text)
+
+    if comments and post_id and not user_id:
+        tool, parameters, confidence = "get_post_comments", {"post_id": _number_value(post_id.group(1))}, 0.95
+    elif post_id and not posts and not user_id:
+        # A single post is only served together with its comments, which say nothing of its author
+        tool, parameters = "get_post_comments", {"post_id": _number_value(post_id.group(1))}
+        confidence = 0.5 if AUTHOR_RE.search(text) or aggregate else 0.85
+    elif posts and user_id and not comments:
+        tool, parameters, confidence = "search_posts_by_user", {"user_id": _number_value(user_id.group(1))}, 0.95
+    elif user_id and not posts and not comments:
+        tool, parameters, confidence = "get_user_info", {"user_id": _number_value(user_id.group(1))}, 0.95
+    elif posts and not comments and not post_id and not aggregate:
+        limit = POSTS_LIMIT_RE.search(text)
+        parameters = {"limit": _number_value(limit.group(1))} if limit else {}
+        tool, confidence = "get_posts", 0.9 if limit or not numbers else 0.6
+    else:
+        return None
+
+    # Numbers the pattern did not consume mean a question this router cannot answer
+    # in one call ("compare user 1 and user 2"), so leave it to the model
+    unused = numbers - set(parameters.values())
+    confidence = confidence - 0.3 * len(unused)
+    if FOLLOW_UP_RE.search(text):
+        confidence -= 0.5
+    confidence = round(confidence, 2)
+    return {"tool": tool, "parameters": parameters, "confidence": confidence}
+
+class RouterStats:
+    """Fast-path hit rate, and the tool-selection time it saved"""
+
+    def __init__(self):
+        self.routed = 0
+        self.fallbacks = 0
+        self.route_seconds = 0.0
+
+    def record(self, routed, seconds):
+        if routed:
+            self.routed += 1
+        else:
+            self.fallbacks += 1
+        self.route_seconds += seconds
+
+    def snapshot(self):
+        total = self.routed + self.fallbacks
+        selection = chat_latency.samples.get("tool_selection")
+        selection_mean = sum(selection) / len(selection) if selection else None
+        return {
+            "enabled": INTENT_ROUTER_ENABLED,
+            "routed": self.routed,
+            "fallbacks": self.fallbacks,
+            "hit_rate": round(self.routed / total, 3) if total else None,
+            "mean_route_microseconds": round(self.route_seconds / total * 1e6, 1) if total else None,
+            # Each routed question skipped one tool-selection call of mean length
+            "estimated_seconds_saved": round(self.routed * selection_mean, 3) if selection_mean else None
+        }
+
+router_stats = RouterStats()
+
+# === ANSWER CACHE ===
+# The same few questions come in all day with small variations ("Who is
+# user 1?", "who's user 1", "מי זה משתמש 1?"). Answers are cached under the
+# question's language, numbers (in order), the tool the intent router reads
+# in it, the requested persona and its content words, and a new question
+# reuses one when its hashed character n-grams are close enough. Scopes must
+# match exactly, so "user 1" never answers "user 2", "user 1 posts" or "user 1
+# or user 2" reversed, and "most posts" never answers "fewest posts" - only
+# casing, punctuation, stop words and number spelling may differ. Entries
+# expire with their tool's data.
+
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_MAX_ENTRIES = 1000
+ANSWER_CACHE_MIN_SIMILARITY = 0.8
+ANSWER_CACHE_NGRAM = 3
+ANSWER_CACHE_BUCKETS = 1 << 16
+# Tool -> seconds an answer built on its data stays fresh (None: answered without a tool)
+ANSWER_CACHE_TTL_SECONDS = {
+    "get_posts": KNOWN_IDS_TTL_SECONDS,
+    "get_user_info": KNOWN_IDS_TTL_SECONDS,
+    "search_posts_by_user": KNOWN_IDS_TTL_SECONDS,
+    "get_post_comments": KNOWN_IDS_TTL_SECONDS,
+    None: 3600
+}
+
+# Words that never change what is asked; anything else ("not", "most", "fewest") is a content word
+ANSWER_CACHE_STOP_WORDS = frozenset({
+    "a", "an", "the", "is", "are", "was", "s", "of", "on", "for", "to", "about",
+    "me", "please", "tell", "can", "you", "do", "does",
+    "את", "של", "זה", "זו", "זאת", "הוא", "היא", "לי", "בבקשה"
+})
+
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+def normalize_question(message):
+    """Lowercase words only, numbers replaced by # (they are matched exactly, as part of the scope)"""
+    return _NON_WORD_RE.sub(" ", NUMBER_RE.sub("#", message.lower())).strip()
+
+def content_words(text):
+    """Words of a normalized question that change its meaning, order-free"""
+    return tuple(sorted(set(text.split()) - ANSWER_CACHE_STOP_WORDS - {"#"}))
+
+def ngram_vector(text):
+    """Hashed character n-gram counts of a normalized question"""
+    padded = f" {text} "
+    vector = Counter()
+    for i in range(len(padded) - ANSWER_CACHE_NGRAM + 1):
+        vector[zlib.crc32(padded[i:i + ANSWER_CACHE_NGRAM].encode("utf-8")) % ANSWER_CACHE_BUCKETS] += 1
+    return vector
+
+def _norm(vector):
+    return sum(count * count for count in vector.values()) ** 0.5
+
+def cosine_similarity(a, b, a_norm, b_norm):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(count * b[bucket] for bucket, count in a.items()) / (a_norm * b_norm) if a_norm and b_norm else 0.0
+
+class AnswerCache:
+    """Answers by (language, numbers, intent, persona, content words), matched by n-gram similarity, LRU-bounded"""
+
+    def __init__(self):
+        self.entries = OrderedDict()  # scope + (normalized question,) -> entry, oldest first
+        self.by_scope = defaultdict(set)  # (language, numbers, intent, persona, content words) -> keys
+        self.hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+
+    @staticmethod
+    def _scope(message, persona=None):
+        language = "he" if any(0x0590 <= ord(char) <= 0x05FF for char in message) else "en"
+        numbers = tuple(_number_value(token) for token in NUMBER_RE.findall(message.lower()))
+        route = route_intent(message)
+        return (language, numbers, route["tool"] if route else None, str(persona or "default"),
+                content_words(normalize_question(message)))
+
+    def _remove(self, key):
+        del self.entries[key]
+        self.by_scope[key[:-1]].discard(key)
+        if not self.by_scope[key[:-1]]:
+            del self.by_scope[key[:-1]]
+
+    def get(self, message, persona=None):
+        """
+        Look up this question or a near-duplicate
+
+        Returns:
+            {"payload", "tool_call"} copied from the cached answer, otherwise None
+        """
+        started = time.perf_counter()
+        scope = self._scope(message, persona)
+        text = normalize_question(message)
+        vector = ngram_vector(text)
+        vector_norm = _norm(vector)
+        now = time.monotonic()
+        best, best_similarity = None, ANSWER_CACHE_MIN_SIMILARITY
+        for key in list(self.by_scope.get(scope, ())):
+            entry = self.entries[key]
+            if entry["expires_at"] <= now:
+                self._remove(key)
+                continue
+            similarity = 1.0 if key[-1] == text else cosine_similarity(vector, entry["vector"], vector_norm, entry["norm"])
+            if similarity >= best_similarity:
+                best, best_similarity = key, similarity
+        self.lookup_seconds += time.perf_counter() - started
+        if best is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(best)
+        entry = self.entries[best]
+        return {"payload": dict(entry["payload"]), "tool_call": entry["tool_call"]}
+
+    def put(self, message, payload, tool_call=None, persona=None):
+        ttl = ANSWER_CACHE_TTL_SECONDS.get(payload.get("tool_used"))
+        if not ttl:
+            return
+        text = normalize_question(message)
+        vector = ngram_vector(text)
+        key = self._scope(message, persona) + (text,)
+        self.entries[key] = {
+            "payload": dict(payload),
+            "tool_call": tool_call,
+            "vector": vector,
+            "norm": _norm(vector),
+            "expires_at": time.monotonic() + ttl
+        }
+        self.entries.move_to_end(key)
+        self.by_scope[key[:-1]].add(key)
+        while len(self.entries) > ANSWER_CACHE_MAX_ENTRIES:
+            self._remove(next(iter(self.entries)))
+
+    def snapshot(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "mean_lookup_microseconds": round(self.lookup_seconds / lookups * 1e6, 1) if lookups else None
+        }
+
+answer_cache = AnswerCache()
+
+# === SESSIONS ===
+# Conversations live in the gateway: each turn is kept as the question, the
+# tool call and a trimmed answer, and replayed as chat history after the
+# static system prompt. History only ever grows at the end, so a follow-up's
+# prompt starts with the previous one and Ollama only evaluates the new turn.
+# Long sessions are compacted in the background (see CONVERSATION COMPACTION).
+
+SESSION_MAX_COUNT = 500  # Least recently used sessions are evicted beyond this
+SESSION_MAX_TURNS = 50  # Hard cap on stored turns, in case compaction cannot keep up
+SESSION_ANSWER_CHARS = 600
+SESSION_RECENT_TURNS = 4  # Always replayed verbatim, never summarized
+SESSION_HISTORY_TOKEN_BUDGET = 2000  # Most history (summary + turns) replayed per prompt
+SESSION_COMPACT_AT_TOKENS = 1200  # History size that queues a background compaction
+
+def approx_tokens(text):
+    """Rough token count without a tokenizer: ~4 bytes per token (Hebrew letters are 2 bytes)"""
+    return len(text.encode("utf-8")) // 4 + 1
+
+class ChatSession:
+    """Compact history of one conversation: a summary of old turns, then recent turns verbatim"""
+
+    def __init__(self):
+        self.turns = []
+        self.summary = None
+        self.next_turn = 0
+        self.compacting = False
+
+    def add_turn(self, question, tool_call, answer):
+        """tool_call is the turn's {"tool", "parameters"}, a list of them or None"""
+        calls = tool_call if isinstance(tool_call, list) else [tool_call] if tool_call else []
+        turn = {
+            "n": self.next_turn,
+            "question": question,
+            "tool": calls[0]["tool"] if len(calls) == 1 else None,
+            "parameters": calls[0]["parameters"] if len(calls) == 1 else None,
+            "tool_calls": calls if len(calls) > 1 else None,
+            "answer": answer[:SESSION_ANSWER_CHARS]
+        }
+        turn["tokens"] = approx_tokens(question + answer[:SESSION_ANSWER_CHARS]) + 20 * len(calls)
+        self.turns.append(turn)
+        self.next_turn += 1
+        del self.turns[:-SESSION_MAX_TURNS]
+
+    def tokens(self):
+        return (approx_tokens(self.summary) if self.summary else 0) + sum(turn["tokens"] for turn in self.turns)
+
+    def needs_compaction(self):
+        return len(self.turns) > SESSION_RECENT_TURNS and self.tokens() > SESSION_COMPACT_AT_TOKENS
+
+    def fold(self, last_turn, summary):
+        """Replace turns up to number last_turn with their summary"""
+        self.turns = [turn for turn in self.turns if turn["n"] > last_turn]
+        self.summary = summary
+
+    def history(self):
+        """
+        History to replay, within SESSION_HISTORY_TOKEN_BUDGET
+
+        Returns:
+            (summary or None, turns) - the oldest turns are left out when
+            compaction has not caught up yet
+        """
+        budget = SESSION_HISTORY_TOKEN_BUDGET - (approx_tokens(self.summary) if self.summary else 0)
+        kept = []
+        for turn in reversed(self.turns):
+            budget -= turn["tokens"]
+            if budget < 0 and kept:
+                break
+            kept.append(turn)
+        return self.summary, kept[::-1]
+
+class SessionStore:
+    """Bounded, LRU-evicted sessions by id"""
+
+    def __init__(self):
+        self.sessions = OrderedDict()
+        self.evictions = 0
+
+    def get(self, session_id):
+        """The session for an id, None if it is unknown or was evicted"""
+        session = self.sessions.get(session_id) if isinstance(session_id, str) else None
+        if session is not None:
+            self.sessions.move_to_end(session_id)
+        return session
+
+    def create(self):
+        session_id = uuid.uuid4().hex
+        self.sessions[session_id] = ChatSession()
+        while len(self.sessions) > SESSION_MAX_COUNT:
+            self.sessions.popitem(last=False)
+            self.evictions += 1
+        return session_id, self.sessions[session_id]
+
+    def snapshot(self):
+        return {
+            "active": len(self.sessions),
+            "max": SESSION_MAX_COUNT,
+            "evictions": self.evictions
+        }
+
+sessions = SessionStore()
+
+# === TEMPLATE ANSWERS ===
+# A lookup like "who is user 3?" needs no second generation to restate the
+# tool's JSON as prose. Lookup tools have Hebrew and English templates that
+# render instantly; the model still writes the answer when the question asks
+# for reasoning over the data, or the request sets "detailed": true.
+
+TEMPLATE_ANSWERS_ENABLED = True
+
+# Asking to explain, compare, summarize... needs the model, not a template
+REASONING_RE = re.compile(
+    r"(?<!\w)(?:why|how|explain|compare|summari[sz]e|analy[sz]e|describe|recommend|should|"
+    r"[הלו]?(?:למה|מדוע|איך|הסבר|תסביר|השווה|תשווה|סכם|תסכם|נתח|תנתח|תאר|המלץ|ממליץ))(?!\w)"
+)
+
+# Unicode first-strong isolate: keeps emails, URLs and Latin names from
+# reordering the surrounding right-to-left Hebrew sentence
+_FSI, _PDI = "\u2068", "\u2069"
+
+ANSWER_TEMPLATES = {
+    ("get_user_info", "en"): (
+        "User {id} is {name} (username: {username}).\n"
+        "Email: {email}\n"
+        "Phone: {phone}\n"
+        "Website: {website}\n"
+        "Company: {company}\n"
+        "City: {city}"
+    ),
+    ("get_user_info", "he"): (
+        "משתמש {id} הוא {name} (שם משתמש: {username}).\n"
+        "אימייל: {email}\n"
+        "טלפון: {phone}\n"
+        "אתר: {website}\n"
+        "חברה: {company}\n"
+        "עיר: {city}"
+    ),
+    ("get_post_comments", "en"): 'Post {id}: "{title}"\n{content}\n\nComments ({comments_count}):',
+    ("get_post_comments", "he"): 'פוסט {id}: "{title}"\n{content}\n\nתגובות ({comments_count}):',
+    ("comment", "en"): "- {author_name} ({author_email}): {content}",
+    ("comment", "he"): "- {author_name} ({author_email}): {content}"
+}
+
+def _template_fields(values, is_hebrew):
+    if not is_hebrew:
+        return values
+    return {key: f"{_FSI}{value}{_PDI}" if isinstance(value, str) else value for key, value in values.items()}
+
+def template_answer_allowed(user_message, data):
+    return TEMPLATE_ANSWERS_ENABLED and not (data or {}).get("detailed") and not REASONING_RE.search(user_message.lower())
+
+def render_answer(tool_name, tool_result, is_hebrew):
+    """
+    Render a lookup tool's result without the model
+
+    Returns:
+        The answer text, None if the tool has no template or the result does not fit it
+    """
+    language = "he" if is_hebrew else "en"
+    template = ANSWER_TEMPLATES.get((tool_name, language))
+    if template is None:
+        return None
+    try:
+        if tool_name == "get_post_comments":
+            header = template.format(comments_count=tool_result["comments_count"], **_template_fields(tool_result["post"], is_hebrew))
+            lines = [ANSWER_TEMPLATES[("comment", language)].format(**_template_fields(comment, is_hebrew))
+                     for comment in tool_result["comments"]]
+            return "\n".join([header] + lines)
+        return template.format(**_template_fields(tool_result, is_hebrew))
+    except (KeyError, TypeError):
+        return None
+
+# === FORMATTED ANSWER CACHE ===
+# The same tool result asked about the same way gets the same prose, so the
+# model's answer is cached under the tool call, a fingerprint of its result,
+# the language and the persona. When the data changes the fingerprint does,
+# so a stale answer is never served - it just ages out of the LRU.
+
+FORMATTED_ANSWER_CACHE_ENABLED = True
+FORMATTED_ANSWER_CACHE_MAX_ENTRIES = 500
+
+def formatted_answer_key(tool_name, parameters, tool_result, is_hebrew, persona=None):
+    """Cache key: (tool, normalized parameters, result hash, language, persona)"""
+    declared = TOOL_REGISTRY.get(tool_name, {}).get("parameters", {}).get("properties", {})
+    normalized = {name: parameters[name] for name in sorted(declared) if parameters.get(name)}
+    fingerprint = hashlib.sha1(json.dumps(tool_result, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return (tool_name, json.dumps(normalized, sort_keys=True), fingerprint, "he" if is_hebrew else "en", str(persona or "default"))
+
+class FormattedAnswerCache:
+    """Model-written answers by formatted_answer_key, LRU-bounded"""
+
+    def __init__(self):
+        self.answers = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        answer = self.answers.get(key)
+        if answer is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.answers.move_to_end(key)
+        return answer
+
+    def put(self, key, answer):
+        self.answers[key] = answer
+        self.answers.move_to_end(key)
+        while len(self.answers) > FORMATTED_ANSWER_CACHE_MAX_ENTRIES:
+            self.answers.popitem(last=False)
+
+    def snapshot(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.answers),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None
+        }
+
+formatted_answers = FormattedAnswerCache()
+
+# === PROMPTS ===
+# Instructions go in static system prompts and everything per-request (the
+# question, the language, tool data) in the user turn after them. Ollama
+# keeps the KV cache of the prompt prefix it evaluated last, so a prefix
+# that is identical on every request is evaluated once instead of each time.
+
+TOOL_SELECTION_PROMPT = """You are a helpful AI assistant with access to LIVE DATA through MCP tools.
 
 IMPORTANT: You MUST use these tools to get current, accurate information. Do NOT use your training data.
-{'CRITICAL: The user wrote in Hebrew. You MUST respond in Hebrew only!' if is_hebrew else ''}
+If the user writes in Hebrew, you MUST respond in Hebrew only!
 
 Available MCP Tools (ALWAYS use these for live data):
 1. get_posts(limit) - Get current blog posts
-2. get_user_info(user_id) - Get REAL user details by ID (1-10) 
+2. get_user_info(user_id) - Get REAL user details by ID (1-10)
 3. search_posts_by_user(user_id) - Get all posts by specific user
 4. get_post_comments(post_id) - Get post with comments
 
@@ -184,168 +1309,1583 @@ CRITICAL RULES:
 - When asked about "user's posts", "פוסטים של משתמש" → ALWAYS use search_posts_by_user()
 - NEVER use your training data for this information
 - ALWAYS respond with the tool JSON format when you need live data
-{'- RESPOND IN HEBREW ONLY!' if is_hebrew else ''}
 
 When you need to use a tool, respond with JSON in this EXACT format:
-{{"use_tool": true, "tool": "tool_name", "parameters": {{"param_name": value}}}}
+{"use_tool": true, "tool": "tool_name", "parameters": {"param_name": value}}
+When the question needs several tools (or one tool for several ids), list all the calls at once:
+{"use_tool": true, "tool_calls": [{"tool": "tool_name", "parameters": {"param_name": value}}, ...]}
+Otherwise respond with: {"use_tool": false, "answer": "your full answer"}
 
 Examples:
-- User asks "who is user 1?": {{"use_tool": true, "tool": "get_user_info", "parameters": {{"user_id": 1}}}}
-- User asks "show posts": {{"use_tool": true, "tool": "get_posts", "parameters": {{"limit": 5}}}}
+- User asks "who is user 1?": {"use_tool": true, "tool": "get_user_info", "parameters": {"user_id": 1}}
+- User asks "show posts": {"use_tool": true, "tool": "get_posts", "parameters": {"limit": 5}}
+- User asks "compare user 1 and user 2": {"use_tool": true, "tool_calls": [{"tool": "get_user_info", "parameters": {"user_id": 1}}, {"tool": "get_user_info", "parameters": {"user_id": 2}}]}
+
+ANALYZE each user question: Does it ask for live data that requires tools? If YES, respond with the tool JSON."""
+
+SUMMARY_PROMPT = """You keep notes on a conversation between a user and an AI assistant that answers
+with live data about users, posts and comments. Summarize the conversation you are
+given (and your earlier notes, if any) in a few short sentences. Keep every name,
+user id, post id and fact the user may refer back to. Write in the language the
+user writes in."""
+
+ANSWER_PROMPT = """You are a helpful AI assistant. You receive a user's question together with
+live data that an MCP tool returned for it.
+Please provide a helpful and natural response based on this data.
+Format the response nicely and explain what you found.
+If the user asked in Hebrew, you MUST respond in Hebrew."""
+
+# Answer styles a UI asks for with the request's "persona"; anything else gets the default style
+PERSONA_PROMPTS = {
+    "medical": """The user is a medical professional. Be precise and concise, keep medical
+terms as they are and do not add advice the data does not support.""",
+    "social_worker": """The user is a social worker. Answer warmly and practically, in plain
+language, and point out what the data says about the people involved."""
+}
+
+def request_persona(data):
+    """The request's persona when it is one of PERSONA_PROMPTS, otherwise None"""
+    persona = (data or {}).get("persona")
+    return persona if isinstance(persona, str) and persona in PERSONA_PROMPTS else None
 
-User question: {user_message}
+def summary_message(summary):
+    return {"role": "system", "content": f"Summary of the earlier conversation: {summary}"}
 
-ANALYZE: Does this question ask for live data that requires tools? If YES, respond with the tool JSON.
+def tool_selection_messages(user_message, is_hebrew, history=(), summary=None):
+    """Chat messages for tool selection: static system prompt, earlier turns, then the question"""
+    messages = [{"role": "system", "content": TOOL_SELECTION_PROMPT}]
+    if summary:
+        messages.append(summary_message(summary))
+    for turn in history:
+        if turn.get("tool_calls"):
+            decision = {"use_tool": True, "tool_calls": turn["tool_calls"]}
+        elif turn["tool"]:
+            decision = {"use_tool": True, "tool": turn["tool"], "parameters": turn["parameters"]}
+        else:
+            decision = {"use_tool": False, "answer": turn["answer"]}
+        messages.append({"role": "user", "content": f"User question: {turn['question']}"})
+        messages.append({"role": "assistant", "content": json.dumps(decision, ensure_ascii=False)})
+    question = f"User question: {user_message}"
+    if is_hebrew:
+        question += "\n\nCRITICAL: The user wrote in Hebrew. You MUST respond in Hebrew only!"
+    messages.append({"role": "user", "content": question})
+    return messages
+
+def answer_messages(user_message, is_hebrew, tool_name, parameters, tool_result, history=(), summary=None, persona=None):
+    """Chat messages for the final answer: static system prompt, persona, earlier turns, then the question and tool data"""
+    calls = [{"tool": tool_name, "parameters": parameters, "result": tool_result}]
+    return tool_results_messages(user_message, is_hebrew, calls, history, summary, persona)
+
+def tool_results_messages(user_message, is_hebrew, calls, history=(), summary=None, persona=None):
+    """answer_messages for any number of tool calls ({"tool", "parameters", "result" or "error"})"""
+    messages = [{"role": "system", "content": ANSWER_PROMPT}]
+    if persona:
+        messages.append({"role": "system", "content": PERSONA_PROMPTS[persona]})
+    if summary:
+        messages.append(summary_message(summary))
+    for turn in history:
+        messages.append({"role": "user", "content": turn["question"]})
+        messages.append({"role": "assistant", "content": turn["answer"]})
+    content = f"""The user asked {'in Hebrew' if is_hebrew else ''}: "{user_message}"
+"""
+    for call in calls:
+        content += f"""
+I used the tool {call['tool']} with parameters {call['parameters']}
 """
+        if "error" in call:
+            content += f"The tool failed: {call['error']}\n"
+        else:
+            content += f"The result was: {json.dumps(call['result'], ensure_ascii=False)}\n"
+    if is_hebrew:
+        content += "\nIMPORTANT: The user asked in Hebrew, so you MUST respond in Hebrew.\nהתשובה שלך חייבת להיות בעברית!"
+    messages.append({"role": "user", "content": content})
+    return messages
+
+def summary_messages(summary, turns):
+    """Chat messages asking for a new summary of earlier notes plus the given turns"""
+    lines = [f"Earlier notes: {summary}", ""] if summary else []
+    for turn in turns:
+        lines.append(f"User: {turn['question']}")
+        for call in turn.get("tool_calls") or []:
+            lines.append(f"(tool {call['tool']} with parameters {call['parameters']})")
+        if turn["tool"]:
+            lines.append(f"(tool {turn['tool']} with parameters {turn['parameters']})")
+        lines.append(f"Assistant: {turn['answer']}")
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": "\n".join(lines)}
+    ]
+
+# === CONVERSATION COMPACTION ===
+# Summarizing is a full Ollama generation, so it never runs on a request:
+# finished turns queue long sessions for a background worker, which folds
+# everything but the recent turns into the session's summary. Requests in
+# the meantime replay what fits the token budget.
+
+class SessionCompactor:
+    """Background worker that folds the old turns of long sessions into a summary"""
+
+    def __init__(self):
+        self.queue = None
+        self.compactions = 0
+        self.failures = 0
+        self.seconds = 0.0
+        self._task = None
+
+    def submit(self, session):
+        """Queue a session for compaction if it has outgrown the threshold"""
+        if self.queue is None or session.compacting or not session.needs_compaction():
+            return
+        session.compacting = True
+        self.queue.put_nowait(session)
+
+    async def compact(self, session):
+        older = session.turns[:-SESSION_RECENT_TURNS]
+        if not older:
+            return
+        started = time.monotonic()
+        parts = []
+        async for chunk in ollama.chat_stream(summary_messages(session.summary, older), stage="summary"):
+            parts.append(chunk.get("message", {}).get("content", ""))
+        summary = "".join(parts).strip()
+        if summary:
+            session.fold(older[-1]["n"], summary)
+            self.compactions += 1
+            self.seconds += time.monotonic() - started
+
+    async def _run(self):
+        while True:
+            session = await self.queue.get()
+            try:
+                await self.compact(session)
+            except Exception as e:  # Any failure, e.g. a malformed NDJSON line, must not end the worker
+                self.failures += 1
+                print(f"[COMPACT] Session summary failed: {e!r}")
+            finally:
+                session.compacting = False
+
+    def start(self):
+        """Start the worker on the running event loop"""
+        if self._task is None:
+            self.queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self.queue = None
+
+    def snapshot(self):
+        return {
+            "queued": self.queue.qsize() if self.queue else 0,
+            "compactions": self.compactions,
+            "failures": self.failures,
+            "mean_seconds": round(self.seconds / self.compactions, 3) if self.compactions else None
+        }
+
+compactor = SessionCompactor()
+
+# === ADMISSION CONTROL ===
+# Ollama on CPU works through a chat or two at a time, so chats beyond
+# SCHEDULER_MAX_ACTIVE wait in a bounded queue instead of all piling onto
+# Ollama until they time out. Waiting chats are served by priority class
+# (interactive UI before batch API), round robin across clients within a
+# class, so one busy client cannot starve the others. A chat that would
+# wait longer than its class allows is refused with 429 and Retry-After.
+
+SCHEDULER_MAX_ACTIVE = 2 * OLLAMA_NUM_PARALLEL * len(OLLAMA_BACKENDS)  # Chats in the pipeline at once (some are between generations)
+SCHEDULER_MAX_QUEUED = 64
+SCHEDULER_PRIORITIES = ("interactive", "batch")  # Served in this order
+SCHEDULER_MAX_WAIT_SECONDS = {"interactive": 30, "batch": 120}
+SCHEDULER_INITIAL_SERVICE_SECONDS = 5.0  # Assumed chat duration until measured
+
+class Overloaded(Exception):
+    """A chat was refused admission; retry_after is the expected wait in seconds"""
+
+    def __init__(self, retry_after, reason):
+        super().__init__(f"Server busy, retry in {retry_after} seconds")
+        self.retry_after = retry_after
+        self.reason = reason
+
+class FairScheduler:
+    """Bounded, per-client fair admission queue with priority classes"""
+
+    def __init__(self, max_active=SCHEDULER_MAX_ACTIVE, max_queued=SCHEDULER_MAX_QUEUED):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.active = 0
+        self.queues = {priority: OrderedDict() for priority in SCHEDULER_PRIORITIES}  # client -> deque of waiters
+        self.queued = 0
+        self.service_seconds = SCHEDULER_INITIAL_SERVICE_SECONDS  # Moving average of admitted chat durations
+        self.waits = LatencyStats()
+        self.admitted = Counter()
+        self.shed = Counter()
+
+    def estimated_wait(self, priority):
+        """Seconds a new chat of this priority would wait, from the chats admitted before it"""
+        if self.active < self.max_active and not self.queued:
+            return 0.0
+        served_first = SCHEDULER_PRIORITIES[:SCHEDULER_PRIORITIES.index(priority) + 1]
+        ahead = sum(len(waiters) for p in served_first for waiters in self.queues[p].values())
+        return (ahead + 1) * self.service_seconds / self.max_active
+
+    def check(self, priority):
+        """Raise Overloaded when a new chat of this priority would be refused"""
+        estimate = self.estimated_wait(priority)
+        if self.queued >= self.max_queued:
+            self._shed("queue_full", estimate)
+        if estimate > SCHEDULER_MAX_WAIT_SECONDS[priority]:
+            self._shed("expected_wait", estimate)
+
+    def _shed(self, reason, estimate):
+        self.shed[reason] += 1
+        raise Overloaded(max(1, round(estimate)), reason)
+
+    async def acquire(self, client, priority):
+        """
+        Wait for a free slot
+
+        Returns:
+            The admission time, to hand back to release()
+
+        Raises:
+            Overloaded: the queue is full or the wait is (or became) too long
+        """
+        self.check(priority)
+        queued_at = time.monotonic()
+        if self.active < self.max_active and not self.queued:
+            self.active += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self.queues[priority].setdefault(client, deque()).append(waiter)
+            self.queued += 1
+            try:
+                await asyncio.wait_for(waiter, SCHEDULER_MAX_WAIT_SECONDS[priority])
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if waiter.done() and not waiter.cancelled():
+                    self.release()  # Admitted just as the caller went away
+                else:
+                    self._withdraw(priority, client, waiter)
+                if isinstance(e, asyncio.TimeoutError):
+                    self._shed("wait_timeout", self.estimated_wait(priority))
+                raise
+        admitted_at = time.monotonic()
+        self.waits.record(priority, admitted_at - queued_at)
+        self.admitted[priority] += 1
+        return admitted_at
+
+    def release(self, admitted_at=None):
+        """Free a slot, handing it straight to the next waiting chat"""
+        if admitted_at is not None:
+            self.service_seconds += 0.2 * (time.monotonic() - admitted_at - self.service_seconds)
+        while self.queued:
+            waiter = self._next_waiter()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _next_waiter(self):
+        """Oldest waiter of the next client in round robin order, highest priority first"""
+        for priority in SCHEDULER_PRIORITIES:
+            clients = self.queues[priority]
+            if clients:
+                client, waiters = next(iter(clients.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    clients.move_to_end(client)
+                else:
+                    del clients[client]
+                self.queued -= 1
+                return waiter
+
+    def _withdraw(self, priority, client, waiter):
+        waiters = self.queues[priority].get(client)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self.queued -= 1
+            if not waiters:
+                del self.queues[priority][client]
+
+    def snapshot(self):
+        return {
+            "active": self.active,
+            "max_active": self.max_active,
+            "queued": self.queued,
+            "queued_by_priority": {
+                priority: sum(len(waiters) for waiters in clients.values())
+                for priority, clients in self.queues.items()
+            },
+            "clients_waiting": len({client for clients in self.queues.values() for client in clients}),
+            "mean_chat_seconds": round(self.service_seconds, 3),
+            "admitted": dict(self.admitted),
+            "shed": dict(self.shed),
+            "wait_seconds": self.waits.snapshot()
+        }
+
+scheduler = FairScheduler()
+
+def chat_client(data, address=None):
+    """Fair-share identity of a chat: its client_id, else the caller's address"""
+    return str((data or {}).get("client_id") or address or "anonymous")
+
+def chat_priority(data, default):
+    """The chat's requested priority class, else the endpoint's default"""
+    priority = (data or {}).get("priority")
+    return priority if priority in SCHEDULER_PRIORITIES else default
+
+# === CANCELLATION ===
+# A chat nobody waits for anymore - the client disconnected or its deadline
+# passed - is cancelled wherever it is: queued for admission, in a tool call
+# or in an Ollama stream, whose closed connection stops the generation.
+
+DEADLINE_HEADER = "X-Request-Timeout"  # Seconds the client will wait for the answer
+
+abandoned_chats = Counter()  # Chats cancelled, by "disconnect" or "deadline"
+
+def request_deadline(headers):
+    """Monotonic deadline from the request's deadline header, None when absent or invalid"""
+    try:
+        return time.monotonic() + max(0.0, float(headers.get(DEADLINE_HEADER)))
+    except (TypeError, ValueError):
+        return None
+
+async def abort_when_abandoned(events, deadline=None, disconnected=None):
+    """
+    Yield from the events async generator, running it in its own task so
+    it can be cancelled mid-await when the deadline passes, the disconnected
+    awaitable completes or the consumer stops early.
+
+    Yields:
+        events' (event, payload) pairs, then an "error" with status 504 if the deadline cut them short
+    """
+    queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for item in events:
+                queue.put_nowait(item)
+        finally:
+            queue.put_nowait(None)
+
+    producer = asyncio.ensure_future(produce())
+    watcher = asyncio.ensure_future(disconnected) if disconnected is not None else None
+    reason = "disconnect"
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                done, _ = await asyncio.wait([getter, watcher] if watcher else [getter],
+                                             timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                getter.cancel()
+            if getter in done:
+                item = getter.result()
+                if item is None:
+                    await producer  # Re-raises the pipeline's exception, if any
+                    return
+                yield item
+            elif watcher in done:
+                return
+            else:
+                reason = "deadline"
+                producer.cancel()
+                yield "error", {"error": "Deadline exceeded", "status": 504}
+                return
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        if not producer.done() or producer.cancelled():
+            abandoned_chats[reason] += 1
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+async def run_until_abandoned(coro, deadline=None, disconnected=None):
+    """
+    Await a handle_chat call unless its client gives up first
+
+    Returns:
+        Its (payload, status), (error payload, 504) past the deadline or (error payload, 499) after a disconnect
+    """
+    async def result():
+        yield "result", await coro
+
+    outcome = {"error": "Client disconnected"}, 499
+    try:
+        async for event, payload in abort_when_abandoned(result(), deadline, disconnected):
+            outcome = payload if event == "result" else ({"error": payload["error"]}, payload["status"])
+    finally:
+        coro.close()  # Never started when abandoned right away
+    return outcome
+
+# === REQUEST DEDUPLICATION ===
+# Double-clicks and client retries send the same chat twice. Identical
+# requests - the same Idempotency-Key from a client, or the same normalized
+# message in the same session - share one running pipeline, and its result
+# is kept briefly so a late retry is answered without generating again.
+# Streamed chats are shared the same way: a duplicate first gets the events
+# already sent, then follows the running pipeline.
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_KEY_MAX_CHARS = 255
+CHAT_DEDUPE_MAX_RESULTS = 1000
+# Key kind -> seconds a finished chat's result is replayed to retries
+CHAT_DEDUPE_TTL_SECONDS = {
+    "key": 300,
+    "message": 10  # A same-session repeat after this is a new question
+}
+
+def chat_dedupe_key(data, address=None, idempotency_key=None):
+    """
+    Returns:
+        (key, request fingerprint) - by the client's idempotency key, else by
+        the session and normalized message; (None, None) when not deduplicated
+    """
+    if idempotency_key:
+        fingerprint = hashlib.sha1(json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+        return ("key", chat_client(data, address), idempotency_key), fingerprint
+    if isinstance(data, dict) and isinstance(data.get("session_id"), str) and isinstance(data.get("message"), str):
+        normalized = dict(data, message=_NON_WORD_RE.sub(" ", data["message"].lower()).strip())  # Keeps numbers, unlike normalize_question
+        return ("message", json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)), None
+    return None, None
+
+def idempotency_key_error(idempotency_key):
+    """Error message for an unusable Idempotency-Key, None when it is fine or absent"""
+    if idempotency_key is not None and len(idempotency_key) > IDEMPOTENCY_KEY_MAX_CHARS:
+        return f"{IDEMPOTENCY_HEADER} is longer than {IDEMPOTENCY_KEY_MAX_CHARS} characters"
+    return None
+
+class ChatDeduplicator:
+    """One pipeline run per key for concurrent callers, and recent results for late retries"""
+
+    def __init__(self):
+        self.in_flight = {}  # key -> {"task", "fingerprint", "waiters"} (streams also "events", "update")
+        self.results = OrderedDict()  # key -> (expires_at, fingerprint, (payload or events, status))
+        self.started = 0
+        self.attached = 0
+        self.replayed = 0
+        self.conflicts = 0
+
+    def _stored(self, key):
+        stored = self.results.get(key)
+        if stored is not None and stored[0] <= time.monotonic():
+            del self.results[key]
+            return None
+        return stored
+
+    async def run(self, key, fingerprint, start):
+        """
+        Result of the chat under key: replayed, shared with the identical
+        chat already running, or that of start() (a coroutine function).
+        The run is cancelled only once every caller waiting on it is.
+
+        Returns:
+            (payload, status) - 422 when an idempotency key is reused for a different request
+        """
+        conflict = self._conflict(key, fingerprint)
+        if conflict:
+            return conflict, 422
+        stored = self._stored(key)
+        if stored is not None:
+            self.replayed += 1
+            payload, status = stored[2]
+            return dict(payload), status
+        entry = self._join(key, fingerprint, start)
+        try:
+            payload, status = await asyncio.shield(entry["task"])
+        finally:
+            self._leave(key, entry)
+        return dict(payload), status
+
+    async def stream(self, key, fingerprint, start):
+        """
+        run() for a streamed chat, start() being an async generator function.
+        Every caller gets all of the run's events, a late one first those
+        already sent; a late retry gets the stored events of the finished run.
+
+        Yields:
+            (event, payload) - a single "error" with status 422 when an idempotency key is reused for a different request
+        """
+        conflict = self._conflict(key, fingerprint)
+        if conflict:
+            yield "error", dict(conflict, status=422)
+            return
+        stored = self._stored(key)
+        if stored is not None:
+            self.replayed += 1
+            for item in stored[2][0]:
+                yield item
+            return
+
+        async def pump(entry):
+            status = 500
+            try:
+                async for event, payload in start():
+                    entry["events"].append((event, payload))
+                    if event in ("done", "error"):
+                        status = payload.get("status", 200) if event == "error" else 200
+                    entry["update"].set()
+                    entry["update"] = asyncio.Event()
+            finally:
+                entry["update"].set()
+            return entry["events"], status
+
+        entry = self._join(key, fingerprint, pump, streamed=True)
+        try:
+            position = 0
+            while True:
+                update = entry["update"]
+                while position < len(entry["events"]):
+                    yield entry["events"][position]
+                    position += 1
+                if entry["task"].done():
+                    entry["task"].result()  # Re-raises the pipeline's exception, if any
+                    return
+                await update.wait()
+        finally:
+            self._leave(key, entry)
+
+    def _conflict(self, key, fingerprint):
+        """Error payload when key already belongs to a request with another fingerprint"""
+        stored = self._stored(key)
+        entry = self.in_flight.get(key)
+        known = stored[1] if stored is not None else entry["fingerprint"] if entry is not None else fingerprint
+        if known == fingerprint:
+            return None
+        self.conflicts += 1
+        return {"error": f"{IDEMPOTENCY_HEADER} was already used for a different request"}
+
+    def _join(self, key, fingerprint, start, streamed=False):
+        """The run in flight under key, started now if there is none"""
+        entry = self.in_flight.get(key)
+        if entry is None:
+            entry = {"fingerprint": fingerprint, "waiters": 0}
+            if streamed:
+                entry.update(events=[], update=asyncio.Event())
+                entry["task"] = asyncio.ensure_future(start(entry))
+            else:
+                entry["task"] = asyncio.ensure_future(start())
+            entry["task"].add_done_callback(lambda task: self._finish(key, entry, task))
+            self.in_flight[key] = entry
+            self.started += 1
+        else:
+            self.attached += 1
+        entry["waiters"] += 1
+        return entry
+
+    def _leave(self, key, entry):
+        """A caller stopped waiting; the run is cancelled once none is left"""
+        entry["waiters"] -= 1
+        if entry["waiters"] == 0 and not entry["task"].done():
+            if self.in_flight.get(key) is entry:
+                del self.in_flight[key]  # A new caller starts over instead of joining a cancelled run
+            entry["task"].cancel()
+
+    def _finish(self, key, entry, task):
+        if self.in_flight.get(key) is entry:
+            del self.in_flight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        result, status = task.result()
+        if status < 500 and status != 429:  # Overload and failures are worth retrying for real
+            self.results[key] = (time.monotonic() + CHAT_DEDUPE_TTL_SECONDS[key[0]], entry["fingerprint"], (result, status))
+            self.results.move_to_end(key)
+            while len(self.results) > CHAT_DEDUPE_MAX_RESULTS:
+                self.results.popitem(last=False)
+
+    def snapshot(self):
+        return {
+            "in_flight": len(self.in_flight),
+            "stored_results": len(self.results),
+            "started": self.started,
+            "attached": self.attached,
+            "replayed": self.replayed,
+            "conflicts": self.conflicts
+        }
+
+chat_dedupe = ChatDeduplicator()
+
+# === CHAT PIPELINE ===
+
+async def run_tool(tool_name, parameters):
+    """Execute an MCP tool directly, None if the tool or its arguments are unknown"""
+    tool = TOOL_REGISTRY.get(tool_name)
+    if tool is None:
+        return None
+    schema = tool["parameters"]
+    arguments = {name: parameters[name] for name in schema["properties"] if parameters.get(name)}
+    if any(name not in arguments for name in schema["required"]):
+        return None
+    return await tool["function"](**arguments)
+
+async def run_tool_calls(calls):
+    """
+    Execute independent tool calls concurrently, at most TOOL_FANOUT_LIMIT
+    at a time. Identical calls run once.
+
+    Returns:
+        The calls in order, each with its "result" or an "error"
+    """
+    limit = asyncio.Semaphore(TOOL_FANOUT_LIMIT)
+    runs = {}
+
+    async def run(call):
+        async with limit:
+            return await run_tool(call["tool"], call["parameters"])
+
+    for call in calls:
+        key = (call["tool"], json.dumps(call["parameters"], sort_keys=True))
+        if key not in runs:
+            runs[key] = asyncio.ensure_future(run(call))
+    await asyncio.gather(*runs.values(), return_exceptions=True)
+
+    finished = []
+    for call in calls:
+        run_task = runs[(call["tool"], json.dumps(call["parameters"], sort_keys=True))]
+        if run_task.exception() is not None:
+            finished.append(dict(call, error=str(run_task.exception())))
+        elif not run_task.result():
+            finished.append(dict(call, error=f"Tool {call['tool']} returned no data"))
+        else:
+            finished.append(dict(call, result=run_task.result()))
+    return finished
+
+class JsonObjectScanner:
+    """Finds the end of the first JSON object in text that arrives in pieces"""
+
+    def __init__(self):
+        self.text = ""
+        self.start = None
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, piece):
+        """
+        Add streamed text
+
+        Returns:
+            The first complete top-level object's text once its brace closes, otherwise None
+        """
+        offset = len(self.text)
+        self.text += piece
+        for i in range(offset, len(self.text)):
+            char = self.text[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif self.start is None:
+                if char == "{":
+                    self.start = i
+                    self.depth = 1
+            elif char == '"':
+                self.in_string = True
+            elif char == "{":
+                self.depth += 1
+            elif char == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    return self.text[self.start:i + 1]
+        return None
+
+async def select_tool(messages):
+    """
+    Ask the model which tool to use. The selection stage's (small) model
+    answers first; when its reply fails validation, or it answers without
+    a tool (final answers are the answer model's job), the escalation
+    model is asked instead.
+
+    Returns:
+        (tool calls - a list of {"tool", "parameters"}, empty for none - plain answer or None)
+
+    Raises:
+        OllamaError: Ollama answered with an error status
+    """
+    can_escalate = stage_model("tool_selection") != stage_model("tool_selection_escalated")
+    try:
+        calls, answer, problem = await request_tool_calls(messages, "tool_selection")
+    except OllamaError as e:
+        if not can_escalate:
+            raise
+        print(f"Selection model failed, escalating: {e}")
+        calls, answer, problem = [], None, "ollama_error"
+    if can_escalate and (problem or not calls):
+        model_escalations[problem or "plain_answer"] += 1
+        calls, answer, _ = await request_tool_calls(messages, "tool_selection_escalated")
+    return calls, answer
+
+def checked_tool_calls(requested, fallback_answer):
+    """
+    Keep the requested calls of registered tools
+
+    Returns:
+        (tool calls, fallback_answer when none are left, "invalid_call" if a call was
+        dropped or lacks a required parameter, else None)
+    """
+    calls = [
+        {"tool": call["tool"], "parameters": call.get("parameters") or {}}
+        for call in requested
+        if isinstance(call, dict) and call.get("tool") in TOOL_REGISTRY
+    ]
+    complete = len(calls) == len(requested) and all(
+        call["parameters"].get(name) is not None
+        for call in calls
+        for name in TOOL_REGISTRY[call["tool"]]["parameters"]["required"]
+    )
+    return calls[:TOOL_CALLS_MAX], None if calls else fallback_answer, None if complete else "invalid_call"
+
+async def request_tool_calls(messages, stage):
+    """
+    One tool-selection generation, with output it cannot malform. The
+    reply is streamed and cut off as soon as the tool call is complete,
+    so trailing tokens after the JSON are never generated.
+
+    Returns:
+        (tool calls, plain answer or None, the validation problem or None)
+
+    Raises:
+        OllamaError: Ollama answered with an error status
+    """
+    if OLLAMA_TOOL_CALLING == "tools":
+        content = []
+        chunks = ollama.chat_stream(messages, tools=ollama_tool_definitions(), stage=stage)
+        try:
+            async for chunk in chunks:
+                message = chunk.get("message", {})
+                requested = [
+                    {"tool": call["function"]["name"], "parameters": call["function"].get("arguments") or {}}
+                    for call in message.get("tool_calls") or []
+                ]
+                if requested:
+                    return checked_tool_calls(requested, "".join(content))
+                content.append(message.get("content", ""))
+        finally:
+            await chunks.aclose()
+        return [], "".join(content), None
+
+    scanner = JsonObjectScanner()
+    content = None
+    chunks = ollama.chat_stream(messages, format=tool_call_schema(), stage=stage)
+    try:
+        async for chunk in chunks:
+            content = scanner.feed(chunk.get("message", {}).get("content", ""))
+            if content is not None:
+                break
+    finally:
+        await chunks.aclose()
+    try:
+        decision = json.loads(content if content is not None else scanner.text)
+    except ValueError:
+        # Only possible when the generation was cut short (e.g. num_predict)
+        return [], scanner.text, "unparseable"
+    if decision.get("use_tool"):
+        requested = decision["tool_calls"] if isinstance(decision.get("tool_calls"), list) else [decision]
+        return checked_tool_calls(requested, decision.get("answer", scanner.text))
+    return [], decision.get("answer", scanner.text), None
+
+async def chat_events(data, stream=False, history=(), summary=None):
+    """
+    Chat pipeline that integrates Ollama AI with MCP tools
+    
+    Flow:
+    1. Receive user message
+    2. Detect language (Hebrew/English)
+    3. Route recognized questions straight to a tool (fast path), otherwise
+       send to Ollama AI with tool instructions
+    4. Parse AI response for tool usage (one call or a list of them)
+    5. Execute MCP tools if needed, several concurrently
+    6. Send results back to Ollama for formatting, once for all of them
+    7. Return final response to user
+    
+    Yields:
+        (event, payload) pairs - "status", "tool" and "token" while working,
+        then exactly one "done" (response payload) or "error" (with "status" code).
+        Answer tokens are only streamed from Ollama when stream=True.
+        history and summary hold the earlier conversation (see ChatSession.history).
+    """
+    try:
+        user_message = (data or {}).get('message', '')
+        
+        if not user_message:
+            yield "error", {"error": "No message provided", "status": 400}
+            return
+        
+        # Detect Hebrew language
+        is_hebrew = any(ord(char) >= 0x0590 and ord(char) <= 0x05FF for char in user_message)
         
         # Safe printing for Windows console (avoid encoding errors)
         print(f"Sending to Ollama: {user_message.encode('ascii', errors='replace').decode('ascii')}")
         
-        # Call Ollama AI
-        ollama_response = requests.post(
-            f"{OLLAMA_API_URL}/api/generate",
-            json={
-                "model": OLLAMA_MODEL,
-                "prompt": system_prompt,
-                "stream": False,
-                "options": {
-                    "num_thread": 4,
-                    "num_gpu": 0,
-                    "temperature": 0.7
-                }
-            },
-            timeout=600  # 10 minutes timeout for complex queries
-        )
-        
-        if ollama_response.status_code != 200:
-            return jsonify({"error": f"Ollama API error: {ollama_response.status_code}"}), 500
+        # Fast path: questions that name their tool and id skip the selection call
+        route = None
+        if INTENT_ROUTER_ENABLED:
+            route_started = time.perf_counter()
+            route = route_intent(user_message)
+            if route and route["confidence"] < INTENT_ROUTER_MIN_CONFIDENCE:
+                route = None
+            router_stats.record(route is not None, time.perf_counter() - route_started)
         
-        ai_response = ollama_response.json()["response"]
-        print(f"Ollama response: {ai_response.encode('ascii', errors='replace').decode('ascii')}")
+        ai_response = None
+        tool_name = None
+        parameters = {}
+        if route:
+            tool_name = route["tool"]
+            parameters = route["parameters"]
+            print(f"Routed without AI: {tool_name} (confidence {route['confidence']})")
+        else:
+            # Call Ollama AI
+            yield "status", {"stage": "selecting_tool"}
+            selection_started = time.monotonic()
+            try:
+                tool_calls, ai_response = await select_tool(tool_selection_messages(user_message, is_hebrew, history, summary))
+            except OllamaError as e:
+                yield "error", {"error": str(e), "status": 500}
+                return
+            chat_latency.record("tool_selection", time.monotonic() - selection_started)
+            
+            if ai_response is not None:
+                print(f"Ollama response: {ai_response.encode('ascii', errors='replace').decode('ascii')}")
+            if len(tool_calls) > 1:
+                async for event, payload in tool_calls_events(user_message, is_hebrew, tool_calls, stream, history, summary,
+                                                              request_persona(data)):
+                    yield event, payload
+                return
+            if tool_calls:
+                tool_name, parameters = tool_calls[0]["tool"], tool_calls[0]["parameters"]
         
-        # Check if Ollama wants to use a tool
-        if '"use_tool": true' in ai_response:
+        tool_result = None
+        tool_error = None
+        if tool_name:
             try:
-                import json
-                json_start = ai_response.find("{")
-                json_end = ai_response.rfind("}") + 1
+                print(f"Using tool: {tool_name} with parameters: {parameters}")
                 
-                if json_start >= 0 and json_end > json_start:
-                    tool_request_text = ai_response[json_start:json_end]
-                    tool_request = json.loads(tool_request_text)
-                    
-                    if tool_request.get("use_tool"):
-                        tool_name = tool_request.get("tool")
-                        parameters = tool_request.get("parameters", {})
-                        
-                        print(f"Using tool: {tool_name} with parameters: {parameters}")
-                        
-                        # Execute MCP tool directly
-                        tool_result = None
-                        if tool_name == "get_posts":
-                            limit = parameters.get("limit", 10)
-                            tool_result = asyncio.run(get_posts_tool(limit))
-                        elif tool_name == "get_user_info":
-                            user_id = parameters.get("user_id")
-                            if user_id:
-                                tool_result = asyncio.run(get_user_info_tool(user_id))
-                        elif tool_name == "search_posts_by_user":
-                            user_id = parameters.get("user_id")
-                            if user_id:
-                                tool_result = asyncio.run(search_posts_by_user_tool(user_id))
-                        elif tool_name == "get_post_comments":
-                            post_id = parameters.get("post_id")
-                            if post_id:
-                                tool_result = asyncio.run(get_post_comments_tool(post_id))
-                        
-                        if tool_result:
-                            print(f"Tool result: {len(str(tool_result))} characters")
-                            
-                            # Send results back to Ollama for formatting
-                            final_prompt = f"""
-The user asked {'in Hebrew' if is_hebrew else ''}: "{user_message}"
-
-I used the tool {tool_name} with parameters {parameters}
-The result was: {json.dumps(tool_result, ensure_ascii=False)}
-
-{'IMPORTANT: The user asked in Hebrew, so you MUST respond in Hebrew.' if is_hebrew else ''}
-Please provide a helpful and natural response based on this data.
-Format the response nicely and explain what you found.
-{'התשובה שלך חייבת להיות בעברית!' if is_hebrew else ''}
-"""
-                            
-                            final_response = requests.post(
-                                f"{OLLAMA_API_URL}/api/generate",
-                                json={
-                                    "model": OLLAMA_MODEL,
-                                    "prompt": final_prompt,
-                                    "stream": False,
-                                    "options": {
-                                        "num_thread": 4,
-                                        "num_gpu": 0,
-                                        "temperature": 0.7
-                                    }
-                                },
-                                timeout=600
-                            )
-                            
-                            if final_response.status_code == 200:
-                                final_answer = final_response.json()["response"]
-                                return jsonify({
-                                    "success": True,
-                                    "message": final_answer,
-                                    "tool_used": tool_name,
-                                    "tool_result": tool_result
-                                })
+                invalid_id_message = await validate_tool_ids(parameters, is_hebrew)
+                if invalid_id_message:
+                    yield "done", {
+                        "success": True,
+                        "message": invalid_id_message,
+                        "tool_used": None
+                    }
+                    return
+                
+                # Execute MCP tool directly
+                yield "status", {"stage": "running_tool", "tool": tool_name}
+                tool_result = await run_tool(tool_name, parameters)
+            
+            except Exception as e:
+                print(f"Error using tool: {e}")
+                tool_error = str(e)
+        
+        if tool_result:
+            print(f"Tool result: {len(str(tool_result))} characters")
+            yield "tool", {"tool": tool_name, "parameters": parameters, "result": tool_result}
+            
+            # Lookups are answered from a template, skipping the second generation
+            rendered = render_answer(tool_name, tool_result, is_hebrew) if template_answer_allowed(user_message, data) else None
+            if rendered:
+                answer_sources["template"] += 1
+                if stream:
+                    yield "token", {"text": rendered}
+                yield "done", {
+                    "success": True,
+                    "message": rendered,
+                    "tool_used": tool_name,
+                    "tool_result": tool_result,
+                    "templated": True
+                }
+                return
+            
+            # The key ignores the wording, so only plain lookups outside a conversation share answers
+            answer_key = None
+            if FORMATTED_ANSWER_CACHE_ENABLED and not history and not summary and not REASONING_RE.search(user_message.lower()):
+                answer_key = formatted_answer_key(tool_name, parameters, tool_result, is_hebrew, request_persona(data))
+                cached_answer = formatted_answers.get(answer_key)
+                if cached_answer:
+                    answer_sources["formatted_cache"] += 1
+                    if stream:
+                        yield "token", {"text": cached_answer}
+                    yield "done", {
+                        "success": True,
+                        "message": cached_answer,
+                        "tool_used": tool_name,
+                        "tool_result": tool_result
+                    }
+                    return
             
+            # Send results back to Ollama for formatting
+            messages = answer_messages(user_message, is_hebrew, tool_name, parameters, tool_result, history, summary,
+                                       request_persona(data))
+            
+            yield "status", {"stage": "generating"}
+            answer_parts = []
+            try:
+                async for event, payload in answer_events(messages, stream, answer_parts):
+                    yield event, payload
             except Exception as e:
                 print(f"Error using tool: {e}")
+                if answer_parts or ai_response is None:
+                    yield "error", {"error": str(e), "status": 500}
+                    return
+            else:
+                answer_sources["model"] += 1
+                if answer_key and answer_parts:
+                    formatted_answers.put(answer_key, "".join(answer_parts))
+                yield "done", {
+                    "success": True,
+                    "message": "".join(answer_parts),
+                    "tool_used": tool_name,
+                    "tool_result": tool_result
+                }
+                return
+        
+        if ai_response is None:
+            # Routed straight to a tool that failed: there is no model answer to fall back on
+            yield "error", {"error": tool_error or f"Tool {tool_name} returned no data", "status": 502}
+            return
         
         # Regular response without tools
-        return jsonify({
+        if stream:
+            yield "token", {"text": ai_response}
+        yield "done", {
             "success": True,
             "message": ai_response,
             "tool_used": None
-        })
+        }
         
     except Exception as e:
         print(f"Error: {e}")
-        return jsonify({"error": str(e)}), 500
+        yield "error", {"error": str(e), "status": 500}
 
-@app.route('/api/tools', methods=['GET'])
-def get_available_tools():
-    """Get list of available MCP tools"""
-    tools = {
-        "get_posts": "Get blog posts with limit parameter",
-        "get_user_info": "Get user information by user_id",
-        "search_posts_by_user": "Get all posts by specific user_id",
-        "get_post_comments": "Get post with comments by post_id"
+async def answer_events(messages, stream, answer_parts):
+    """Generate the final answer into answer_parts, yielding its tokens when streaming"""
+    async for chunk in ollama.chat_stream(messages, stage="answer"):
+        text = chunk.get("message", {}).get("content")
+        if text:
+            answer_parts.append(text)
+            if stream:
+                yield "token", {"text": text}
+
+async def tool_calls_events(user_message, is_hebrew, tool_calls, stream=False, history=(), summary=None, persona=None):
+    """
+    chat_events for a question planned as several tool calls: the calls run
+    concurrently and a single generation answers from all their results.
+    Calls that fail are reported to the model instead of failing the question.
+    """
+    for call in tool_calls:
+        invalid_id_message = await validate_tool_ids(call["parameters"], is_hebrew)
+        if invalid_id_message:
+            yield "done", {"success": True, "message": invalid_id_message, "tool_used": None}
+            return
+    
+    print(f"Using tools: {', '.join(call['tool'] for call in tool_calls)}")
+    yield "status", {"stage": "running_tools", "tools": [call["tool"] for call in tool_calls]}
+    calls = await run_tool_calls(tool_calls)
+    for call in calls:
+        if "result" in call:
+            yield "tool", call
+    if all("error" in call for call in calls):
+        yield "error", {"error": "; ".join(call["error"] for call in calls), "status": 502}
+        return
+    
+    yield "status", {"stage": "generating"}
+    answer_parts = []
+    async for event, payload in answer_events(tool_results_messages(user_message, is_hebrew, calls, history, summary, persona), stream, answer_parts):
+        yield event, payload
+    answer_sources["model"] += 1
+    yield "done", {
+        "success": True,
+        "message": "".join(answer_parts),
+        "tool_used": ", ".join(dict.fromkeys(call["tool"] for call in calls)),
+        "tool_result": calls
     }
-    return jsonify({
+
+async def cached_answer_events(cached, stream=False):
+    """Replay a cached answer with the same events chat_events would send"""
+    payload = cached["payload"]
+    if cached["tool_call"]:
+        yield "tool", dict(cached["tool_call"], result=payload.get("tool_result"))
+    if stream:
+        yield "token", {"text": payload["message"]}
+    payload["cached"] = True
+    yield "done", payload
+
+async def session_chat_events(data, stream=False):
+    """
+    chat_events within a conversation: the request's session_id selects the
+    history, and the finished turn is stored in it. Requests without a known
+    session_id start a new session; its id is returned with "done".
+    Questions that do not refer back to the conversation are answered from
+    the answer cache when a close enough one was answered recently; requests
+    asking for a "detailed" answer always reach the model.
+    """
+    data = data or {}
+    message = data.get("message", "")
+    session_id = data.get("session_id")
+    session = sessions.get(session_id)
+    summary, history = session.history() if session else (None, ())
+    cacheable = (ANSWER_CACHE_ENABLED and isinstance(message, str) and message and not data.get("detailed")
+                 and not FOLLOW_UP_RE.search(message.lower()))
+    cached = answer_cache.get(message, request_persona(data)) if cacheable else None
+    if cached is not None:
+        events = cached_answer_events(cached, stream)
+    else:
+        events = chat_events(data, stream, history, summary)
+    tool_calls = []
+    async for event, payload in events:
+        if event == "tool":
+            tool_calls.append({"tool": payload["tool"], "parameters": payload["parameters"]})
+        elif event == "done":
+            tool_call = tool_calls[0] if len(tool_calls) == 1 else tool_calls or None
+            # Only single-tool answers that did not depend on earlier turns are reusable
+            if cached is None and cacheable and not history and not summary and len(tool_calls) <= 1:
+                answer_cache.put(message, payload, tool_call, request_persona(data))
+            if session is None:
+                session_id, session = sessions.create()
+            session.add_turn(data.get("message", ""), tool_call, payload["message"])
+            compactor.submit(session)
+            payload["session_id"] = session_id
+        yield event, payload
+
+async def handle_chat(data, address=None, progress=None):
+    """
+    Run the chat pipeline to completion, once admitted (batch priority by default).
+    progress, if given, is called with each (event, payload) before the final one.
+    
+    Returns:
+        (response payload, HTTP status code) - 429 payloads carry "retry_after"
+    """
+    started = time.monotonic()
+    try:
+        admitted_at = await scheduler.acquire(chat_client(data, address), chat_priority(data, "batch"))
+    except Overloaded as e:
+        return {"error": str(e), "retry_after": e.retry_after}, 429
+    try:
+        async for event, payload in session_chat_events(data):
+            if event == "done":
+                chat_latency.record("total", time.monotonic() - started)
+                return payload, 200
+            if event == "error":
+                status = payload.pop("status")
+                return payload, status
+            if progress is not None:
+                progress(event, payload)
+        return {"error": "Chat pipeline ended without a response"}, 500
+    finally:
+        scheduler.release(admitted_at)
+
+async def deduplicated_chat(data, address=None, idempotency_key=None):
+    """handle_chat, shared with identical requests in flight and replayed to late retries"""
+    key_error = idempotency_key_error(idempotency_key)
+    if key_error:
+        return {"error": key_error}, 400
+    key, fingerprint = chat_dedupe_key(data, address, idempotency_key)
+    if key is None:
+        return await handle_chat(data, address)
+    return await chat_dedupe.run(key, fingerprint, lambda: handle_chat(data, address))
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+async def chat_stream(data, address=None, deadline=None, disconnected=None, idempotency_key=None):
+    """
+    Run the chat pipeline as Server-Sent Events, recording time to first token.
+    Chats get interactive priority by default; a chat that has to wait is told
+    with a "queued" status first. Duplicates share one pipeline run, as with
+    deduplicated_chat. The chat is cancelled when its deadline passes or the
+    disconnected awaitable completes (a shared one once all its callers are).
+    """
+    started = time.monotonic()
+    priority = chat_priority(data, "interactive")
+
+    async def events():
+        try:
+            scheduler.check(priority)
+            estimated_wait = scheduler.estimated_wait(priority)
+            if estimated_wait:
+                yield "status", {"stage": "queued", "estimated_wait": round(estimated_wait, 1)}
+            admitted_at = await scheduler.acquire(chat_client(data, address), priority)
+        except Overloaded as e:
+            yield "error", {"error": str(e), "status": 429, "retry_after": e.retry_after}
+            return
+        try:
+            async for event, payload in session_chat_events(data, stream=True):
+                yield event, payload
+        finally:
+            scheduler.release(admitted_at)
+
+    async def refused(error):
+        yield "error", {"error": error, "status": 400}
+
+    key, fingerprint = chat_dedupe_key(data, address, idempotency_key)
+    if idempotency_key_error(idempotency_key):
+        shared = refused(idempotency_key_error(idempotency_key))
+    elif key is None:
+        shared = events()
+    else:
+        # Streamed runs are stored as events, so they never share a key with deduplicated_chat's results
+        shared = chat_dedupe.stream(key + ("stream",), fingerprint, events)
+    first_token = True
+    async for event, payload in abort_when_abandoned(shared, deadline, disconnected):
+        if event == "token" and first_token:
+            chat_latency.record("first_token", time.monotonic() - started)
+            first_token = False
+        if event in ("done", "error"):
+            chat_latency.record("total", time.monotonic() - started)
+        yield sse_event(event, payload)
+
+def available_tools():
+    """Payload for the tools listing endpoint"""
+    tools = {name: tool["description"] for name, tool in TOOL_REGISTRY.items()}
+    return {
         "success": True,
         "tools": tools
-    })
+    }
 
-@app.route('/', methods=['GET'])
-def home():
-    """Server status and information"""
-    return jsonify({
+def gateway_metrics():
+    """Payload for the metrics endpoint"""
+    return {
+        "success": True,
+        "chat_latency": chat_latency.snapshot(),
+        "answer_sources": dict(answer_sources),
+        "intent_router": router_stats.snapshot(),
+        "answer_cache": answer_cache.snapshot(),
+        "formatted_answer_cache": formatted_answers.snapshot(),
+        "sessions": sessions.snapshot(),
+        "compaction": compactor.snapshot(),
+        "abandoned_chats": dict(abandoned_chats),
+        "deduplication": chat_dedupe.snapshot(),
+        "chat_jobs": chat_jobs.snapshot(),
+        "admission": scheduler.snapshot(),
+        "ollama": ollama.stats.snapshot(),
+        "ollama_backends": [backend.snapshot() for backend in ollama.backends],
+        "model_routing": {
+            "stage_models": {stage: stage_model(stage) for stage in OLLAMA_STAGE_MODELS},
+            "escalations": dict(model_escalations)
+        }
+    }
+
+def gateway_info():
+    """Payload for the status endpoint"""
+    return {
         "message": "SIMPLE MCP Gateway - Production Ready",
-        "architecture": "HTTP Client -> Flask Gateway -> Direct MCP Tools -> JSONPlaceholder API",
+        "architecture": "HTTP Client -> Async Gateway -> Direct MCP Tools -> JSONPlaceholder API",
         "status": "running",
+        "mode": GATEWAY_MODE,
         "features": [
             "Real Ollama AI Integration",
             "Direct MCP Tools Execution", 
             "Hebrew Language Support",
+            "Fast-Path Intent Router (skips AI tool selection)",
+            "Per-Stage Models (optional small model selects tools, escalates when its reply fails validation)",
+            "Fair-Share Admission Control (429 with Retry-After under overload)",
+            "Idempotent Chat Requests (duplicates share one generation)",
             "Windows Encoding Compatible",
             "Live External API Data"
         ],
         "endpoints": {
-            "POST /api/chat": "Main chat endpoint with AI and MCP",
+            "POST /api/chat": f"Main chat endpoint with AI and MCP (optional {DEADLINE_HEADER} header, seconds, and {IDEMPOTENCY_HEADER} header)",
+            "POST /api/chat/stream": f"Streaming chat (Server-Sent Events: status, tool, token, done; optional {IDEMPOTENCY_HEADER} header)",
+            "POST /api/chat/jobs": f"Start a chat as a background job, returns its id at once (optional {IDEMPOTENCY_HEADER} header)",
+            "GET /api/chat/jobs/<id>": "Chat job status, and its result once done",
+            "GET /api/chat/jobs/<id>/events": "Chat job progress (Server-Sent Events: status, tool, done or error)",
             "GET /api/tools": "List available MCP tools",
+            "GET /api/metrics": "Ollama load/eval timing and gateway metrics",
             "GET /": "Server status and info"
         }
-    })
+    }
+
+# === CHAT JOBS ===
+# A chat can take minutes on CPU, longer than proxies keep an idle request
+# open. POST /api/chat/jobs admits the chat as a background job and answers
+# at once with its id; clients poll the job or follow its progress as
+# Server-Sent Events. Finished jobs are kept for a while in a bounded store.
+
+CHAT_JOBS_MAX = 1000  # Oldest finished jobs are evicted beyond this
+CHAT_JOB_RESULT_TTL_SECONDS = 600  # How long a finished job's result can be fetched
+
+class ChatJob:
+    """One background chat: its state, progress events and outcome"""
+
+    def __init__(self, data, address=None, key=None):
+        self.id = uuid.uuid4().hex
+        self.data = data
+        self.address = address
+        self.key = key
+        self.state = "queued"  # queued -> running -> done or failed
+        self.stage = "queued"
+        self.events = [("status", {"stage": "queued"})]  # Replayed to every follower
+        self.result = None  # (payload, HTTP status) once finished
+        self.created_at = time.time()
+        self.finished_at = None
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def record(self, event, payload):
+        self.events.append((event, payload))
+        if event == "status":
+            self.stage = payload["stage"]
+            self.state = "running"
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def run(self):
+        try:
+            payload, status = await handle_chat(self.data, self.address, progress=self.record)
+        except asyncio.CancelledError:
+            payload, status = {"error": "Gateway shutting down"}, 503
+        except Exception as e:
+            payload, status = {"error": str(e)}, 500
+        self.result = payload, status
+        self.state = "done" if status == 200 else "failed"
+        self.finished_at = time.monotonic()
+        if status == 200:
+            self.record("done", payload)
+        else:
+            self.record("error", dict(payload, status=status))
+
+    async def follow(self):
+        """Yield the job's (event, payload) pairs so far, then as they happen until it finishes"""
+        sent = 0
+        while True:
+            changed = self._changed
+            while sent < len(self.events):
+                yield self.events[sent]
+                sent += 1
+            if self.result is not None:
+                return
+            await changed.wait()
+
+    def snapshot(self):
+        snapshot = {
+            "job_id": self.id,
+            "status": self.state,
+            "stage": self.stage,
+            "created_at": round(self.created_at, 3)
+        }
+        if self.result is not None:
+            payload, status = self.result
+            snapshot["status_code"] = status
+            if status == 200:
+                snapshot["result"] = payload
+            else:
+                snapshot.update(payload)  # "error", and "retry_after" when refused admission
+        return snapshot
+
+class ChatJobStore:
+    """Chat jobs by id; finished jobs expire, and the oldest are evicted beyond CHAT_JOBS_MAX"""
+
+    def __init__(self):
+        self.jobs = OrderedDict()
+        self.by_key = {}  # (client, idempotency key) -> job id
+        self.submitted = 0
+        self.evicted = 0
+
+    def submit(self, data, address=None, idempotency_key=None):
+        """
+        Start a chat job on the running event loop; a repeated idempotency key
+        returns the client's existing job.
+
+        Raises:
+            Overloaded: when admission would refuse the chat
+        """
+        key = (chat_client(data, address), idempotency_key) if idempotency_key else None
+        job = self.get(self.by_key.get(key)) if key else None
+        if job is not None:
+            return job
+        scheduler.check(chat_priority(data, "batch"))
+        job = ChatJob(data, address, key)
+        job.task = asyncio.get_running_loop().create_task(job.run())
+        self.jobs[job.id] = job
+        if key:
+            self.by_key[key] = job.id
+        self.submitted += 1
+        self._evict()
+        return job
+
+    def get(self, job_id):
+        """The job by id, None if it is unknown or expired"""
+        self._evict()
+        return self.jobs.get(job_id) if isinstance(job_id, str) else None
+
+    def _evict(self):
+        now = time.monotonic()
+        excess = len(self.jobs) - CHAT_JOBS_MAX
+        for job in [job for job in self.jobs.values() if job.finished_at is not None]:
+            if excess <= 0 and now - job.finished_at < CHAT_JOB_RESULT_TTL_SECONDS:
+                continue
+            del self.jobs[job.id]
+            if job.key:
+                self.by_key.pop(job.key, None)
+            excess -= 1
+            self.evicted += 1
+
+    async def close(self):
+        """Cancel unfinished jobs (they fail with 503)"""
+        tasks = [job.task for job in self.jobs.values() if not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self):
+        states = Counter(job.state for job in self.jobs.values())
+        return {
+            "stored": len(self.jobs),
+            "max": CHAT_JOBS_MAX,
+            "queued": states["queued"],
+            "running": states["running"],
+            "submitted": self.submitted,
+            "evicted": self.evicted
+        }
+
+chat_jobs = ChatJobStore()
+
+async def submit_chat_job(data, address=None, idempotency_key=None):
+    """
+    Returns:
+        (job payload with its status and events URLs, 202), or (payload, 429) when overloaded
+    """
+    try:
+        job = chat_jobs.submit(data, address, idempotency_key)
+    except Overloaded as e:
+        return {"error": str(e), "retry_after": e.retry_after}, 429
+    payload = job.snapshot()
+    payload["success"] = True
+    payload["status_url"] = f"/api/chat/jobs/{job.id}"
+    payload["events_url"] = f"/api/chat/jobs/{job.id}/events"
+    return payload, 202
+
+async def chat_job_status(job_id):
+    """(job snapshot, 200), or (error payload, 404) for unknown or expired jobs"""
+    job = chat_jobs.get(job_id)
+    if job is None:
+        return {"error": "Unknown or expired job"}, 404
+    return job.snapshot(), 200
+
+async def chat_job_events(job_id):
+    """The job's progress as Server-Sent Events: status, tool, then done or error"""
+    job = chat_jobs.get(job_id)
+    if job is None:
+        yield sse_event("error", {"error": "Unknown or expired job", "status": 404})
+        return
+    async for event, payload in job.follow():
+        yield sse_event(event, payload)
+
+# === ASGI ENDPOINTS (default mode) ===
+# All requests run on uvicorn's event loop, so a slow Ollama generation is
+# just a pending await instead of a blocked worker thread.
+
+def retry_after_headers(payload, status):
+    return {"Retry-After": str(payload["retry_after"])} if status == 429 else None
+
+def overloaded_response(data):
+    """(payload, 429) when a new streaming chat would be refused, otherwise None"""
+    try:
+        scheduler.check(chat_priority(data, "interactive"))
+    except Overloaded as e:
+        return {"error": str(e), "retry_after": e.retry_after}, 429
+    return None
+
+async def wait_for_disconnect(request):
+    """Completes when the client closes the connection (the request body is already read)"""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+async def chat_request_data(request):
+    """The request's JSON body when it is an object, otherwise None"""
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+NO_MESSAGE = {"error": "No message provided"}
+
+async def chat_endpoint(request):
+    """Main chat endpoint with AI and MCP tools"""
+    data = await chat_request_data(request)
+    if data is None:
+        return JSONResponse(NO_MESSAGE, status_code=400)
+    chat = deduplicated_chat(data, request.client.host if request.client else None, request.headers.get(IDEMPOTENCY_HEADER))
+    payload, status = await run_until_abandoned(chat, request_deadline(request.headers), wait_for_disconnect(request))
+    return JSONResponse(payload, status_code=status, headers=retry_after_headers(payload, status))
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+async def chat_stream_endpoint(request):
+    """Streaming chat endpoint (Server-Sent Events)"""
+    data = await chat_request_data(request)
+    if data is None:
+        return JSONResponse(NO_MESSAGE, status_code=400)
+    refused = overloaded_response(data)
+    if refused:
+        return JSONResponse(refused[0], status_code=429, headers=retry_after_headers(*refused))
+    events = chat_stream(data, request.client.host if request.client else None, request_deadline(request.headers),
+                         wait_for_disconnect(request), request.headers.get(IDEMPOTENCY_HEADER))
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
+def job_location_headers(payload, status):
+    return {"Location": payload["status_url"]} if status == 202 else retry_after_headers(payload, status)
+
+async def chat_jobs_endpoint(request):
+    """Start a chat as a background job"""
+    data = await chat_request_data(request)
+    if data is None:
+        return JSONResponse(NO_MESSAGE, status_code=400)
+    payload, status = await submit_chat_job(data, request.client.host if request.client else None,
+                                            request.headers.get(IDEMPOTENCY_HEADER))
+    return JSONResponse(payload, status_code=status, headers=job_location_headers(payload, status))
+
+async def chat_job_endpoint(request):
+    """Status, and once finished the result, of a chat job"""
+    payload, status = await chat_job_status(request.path_params["job_id"])
+    return JSONResponse(payload, status_code=status)
+
+async def chat_job_events_endpoint(request):
+    """A chat job's progress (Server-Sent Events)"""
+    payload, status = await chat_job_status(request.path_params["job_id"])
+    if status != 200:
+        return JSONResponse(payload, status_code=status)
+    return StreamingResponse(chat_job_events(request.path_params["job_id"]), media_type="text/event-stream", headers=SSE_HEADERS)
+
+async def tools_endpoint(request):
+    """Get list of available MCP tools"""
+    return JSONResponse(available_tools())
+
+async def metrics_endpoint(request):
+    """Ollama timing stats and gateway metrics"""
+    return JSONResponse(gateway_metrics())
+
+async def home_endpoint(request):
+    """Server status and information"""
+    return JSONResponse(gateway_info())
+
+@asynccontextmanager
+async def gateway_lifespan(app):
+    """Start background workers with the server and release Ollama connections on shutdown"""
+    ollama.start()
+    compactor.start()
+    yield
+    await chat_jobs.close()
+    await compactor.close()
+    await ollama.close()
+
+asgi_app = Starlette(
+    routes=[
+        Route('/api/chat', chat_endpoint, methods=['POST']),
+        Route('/api/chat/stream', chat_stream_endpoint, methods=['POST']),
+        Route('/api/chat/jobs', chat_jobs_endpoint, methods=['POST']),
+        Route('/api/chat/jobs/{job_id}', chat_job_endpoint, methods=['GET']),
+        Route('/api/chat/jobs/{job_id}/events', chat_job_events_endpoint, methods=['GET']),
+        Route('/api/tools', tools_endpoint, methods=['GET']),
+        Route('/api/metrics', metrics_endpoint, methods=['GET']),
+        Route('/', home_endpoint, methods=['GET'])
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'], expose_headers=['Retry-After', 'Location'])
+    ],
+    lifespan=gateway_lifespan
+)
+
+# === FLASK ENDPOINTS (GATEWAY_MODE=flask) ===
+# Flask handlers are synchronous, so the async pipeline runs on one
+# background event loop shared by all requests instead of asyncio.run()
+# creating and tearing down a loop per call.
+
+_gateway_loop = None
+_gateway_loop_lock = threading.Lock()
+
+def run_on_gateway_loop(coro):
+    """Run a coroutine on the shared background event loop and wait for it"""
+    global _gateway_loop
+    with _gateway_loop_lock:
+        if _gateway_loop is None:
+            _gateway_loop = asyncio.new_event_loop()
+            threading.Thread(target=_gateway_loop.run_forever, name="gateway-loop", daemon=True).start()
+            _gateway_loop.call_soon_threadsafe(ollama.start)
+            _gateway_loop.call_soon_threadsafe(compactor.start)
+    return asyncio.run_coroutine_threadsafe(coro, _gateway_loop).result()
+
+@app.route('/api/chat', methods=['POST'])
+def chat_with_ai():
+    """Main chat endpoint with AI and MCP tools"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(NO_MESSAGE), 400
+    chat = deduplicated_chat(data, request.remote_addr, request.headers.get(IDEMPOTENCY_HEADER))
+    payload, status = run_on_gateway_loop(run_until_abandoned(chat, request_deadline(request.headers)))
+    return jsonify(payload), status, retry_after_headers(payload, status)
+
+def iterate_on_gateway_loop(agen):
+    """
+    Consume an async generator from sync code, one item at a time on the
+    shared loop. The server closing the response (client gone) closes it too.
+    """
+    try:
+        while True:
+            try:
+                yield run_on_gateway_loop(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        run_on_gateway_loop(agen.aclose())
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_with_ai_stream():
+    """Streaming chat endpoint (Server-Sent Events)"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(NO_MESSAGE), 400
+    refused = overloaded_response(data)
+    if refused:
+        return jsonify(refused[0]), 429, retry_after_headers(*refused)
+    events = iterate_on_gateway_loop(chat_stream(data, request.remote_addr, request_deadline(request.headers),
+                                                 idempotency_key=request.headers.get(IDEMPOTENCY_HEADER)))
+    return Response(events, mimetype="text/event-stream", headers=SSE_HEADERS)
+
+@app.route('/api/chat/jobs', methods=['POST'])
+def start_chat_job():
+    """Start a chat as a background job"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(NO_MESSAGE), 400
+    submission = submit_chat_job(data, request.remote_addr, request.headers.get(IDEMPOTENCY_HEADER))
+    payload, status = run_on_gateway_loop(submission)
+    return jsonify(payload), status, job_location_headers(payload, status)
+
+@app.route('/api/chat/jobs/<job_id>', methods=['GET'])
+def get_chat_job(job_id):
+    """Status, and once finished the result, of a chat job"""
+    payload, status = run_on_gateway_loop(chat_job_status(job_id))
+    return jsonify(payload), status
+
+@app.route('/api/chat/jobs/<job_id>/events', methods=['GET'])
+def get_chat_job_events(job_id):
+    """A chat job's progress (Server-Sent Events)"""
+    payload, status = run_on_gateway_loop(chat_job_status(job_id))
+    if status != 200:
+        return jsonify(payload), status
+    return Response(iterate_on_gateway_loop(chat_job_events(job_id)), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+@app.route('/api/tools', methods=['GET'])
+def get_available_tools():
+    """Get list of available MCP tools"""
+    return jsonify(available_tools())
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Ollama timing stats and gateway metrics"""
+    return jsonify(gateway_metrics())
+
+@app.route('/', methods=['GET'])
+def home():
+    """Server status and information"""
+    return jsonify(gateway_info())
 
 if __name__ == '__main__':
     print("[START] SIMPLE MCP Gateway Starting...")
@@ -354,13 +2894,17 @@ if __name__ == '__main__':
     print("[TOOLS] MCP Tools: 4 tools available")
     
     try:
-        # Test Ollama connection
-        test_response = requests.get(f"{OLLAMA_API_URL}/api/tags", timeout=5)
-        if test_response.status_code == 200:
-            print("[OK] Ollama connection verified")
+        # Test Ollama connections
+        for backend_url in OLLAMA_BACKENDS:
+            test_response = httpx.get(f"{backend_url}/api/tags", timeout=5)
+            if test_response.status_code == 200:
+                print(f"[OK] Ollama connection verified: {backend_url}")
         
-        print("[SERVER] Starting on http://localhost:3001")
-        app.run(host='0.0.0.0', port=3001, debug=True)
+        print(f"[SERVER] Starting on http://localhost:{GATEWAY_PORT} ({GATEWAY_MODE} mode)")
+        if GATEWAY_MODE == "flask":
+            app.run(host='0.0.0.0', port=GATEWAY_PORT, debug=True)
+        else:
+            uvicorn.run(asgi_app, host='0.0.0.0', port=GATEWAY_PORT)
         
     except Exception as e:
-        print(f"[ERROR] Failed to start: {e}")
\ No newline at end of file
+        print(f"[ERROR] Failed to start: {e}")
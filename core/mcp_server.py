@@ -15,6 +15,7 @@ Tools Available:
 - search_posts_by_user(user_id) - Get posts by specific user
 - get_post_by_id(post_id) - Get specific post
 - get_post_comments(post_id) - Get post with comments
+- query_posts(filter, sort, limit, offset) - Structured query over indexed posts
 
 Created: 2025-08-26
 Author: SIMPLE MCP Project
@@ -22,17 +23,159 @@ Status: PRODUCTION READY ✅
 """
 
 import asyncio
+import bisect
+import functools
+import json
+import time
+import sys
+import anyio
 import httpx
-from mcp.server.fastmcp import FastMCP
-from typing import List, Dict, Any
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from mcp import types
+from mcp.server.fastmcp import FastMCP, Context
+from pydantic import AnyUrl
+from typing import List, Dict, Any, Optional, Union, AsyncIterator
+
+@asynccontextmanager
+async def server_lifespan(server):
+    """Keep the shared resource watcher running while a client is connected"""
+    async with resource_watcher.running():
+        yield {}
 
 # Initialize MCP Server with FastMCP framework
-mcp = FastMCP("jsonplaceholder-api")
+mcp = FastMCP("jsonplaceholder-api", lifespan=server_lifespan)
 
 # Base URL for JSONPlaceholder API
 BASE_URL = "https://jsonplaceholder.typicode.com"
 
+# === STREAMED RESULTS ===
+# search_posts_by_user fetches its posts page by page and sends each page to
+# the client as soon as it arrives, as partial data in the message of an MCP
+# progress notification, so a client can render posts before the tool
+# finishes. The tool result still carries every post once, in the same shape
+# at any size. get_posts stays a single upstream request: /posts is small and
+# paging it would only add sequential round trips.
+
+STREAM_PAGE_SIZE = 20  # Items per upstream page / progress notification
+
+async def iter_pages(client: httpx.AsyncClient, path: str, params: Optional[Dict[str, Any]] = None,
+                     page_size: int = STREAM_PAGE_SIZE, max_items: Optional[int] = None) -> AsyncIterator[tuple]:
+    """
+    Fetch a JSONPlaceholder collection page by page
+
+    Yields:
+        (items in this page, total items reported by the API or None)
+    """
+    if max_items is not None:
+        page_size = min(page_size, max_items)  # Page offsets depend on _limit, so it stays fixed
+    page, fetched = 1, 0
+    while max_items is None or fetched < max_items:
+        response = await client.get(f"{BASE_URL}{path}", params={**(params or {}), "_page": page, "_limit": page_size})
+        response.raise_for_status()
+        items = response.json()
+        total = response.headers.get("x-total-count")
+        if max_items is not None:
+            items = items[:max_items - fetched]
+        if items:
+            yield items, int(total) if total is not None else None
+        fetched += len(items)
+        if len(items) < page_size:
+            break
+        page += 1
+
+class PageProgress:
+    """
+    Sends each fetched page to the client in a progress notification
+
+    The notification's message is JSON: {"fetched": items so far, "<key>": [...page items]}.
+    Without a progress token from the client nothing is sent.
+    """
+
+    def __init__(self, ctx: Context, key: str):
+        self.ctx = ctx
+        self.key = key
+        self.items = 0
+
+    async def page(self, items: List[Dict[str, Any]], total: Optional[int] = None):
+        self.items += len(items)
+        message = json.dumps({"fetched": self.items, self.key: items}, ensure_ascii=False)
+        await self.ctx.report_progress(self.items, total, message)
+
+# === CANCELLATION & DEADLINES ===
+# Every tool runs inside a cancel scope. A client `notifications/cancelled`
+# (handled by the MCP session) or an expired per-call deadline cancels the
+# tool coroutine, which aborts its in-flight httpx requests and closes the
+# upstream connections instead of finishing work nobody will read.
+#
+# Deadline per call: send `"_meta": {"timeoutMs": 5000}` with tools/call.
+
+TOOL_DEFAULT_TIMEOUT_SECONDS = 60  # Applied when the client sends no deadline
+
+class ToolMetrics:
+    """Counters for tool executions, including abandoned (cancelled) work"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.completed = Counter()
+        self.failed = Counter()
+        self.cancelled = Counter()
+        self.deadline_exceeded = Counter()
+        self.abandoned_seconds = 0.0  # Time spent on calls that never delivered a result
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "completed": dict(self.completed),
+            "failed": dict(self.failed),
+            "cancelled": dict(self.cancelled),
+            "deadline_exceeded": dict(self.deadline_exceeded),
+            "abandoned_seconds": round(self.abandoned_seconds, 3)
+        }
+
+tool_metrics = ToolMetrics()
+
+def _request_timeout() -> float:
+    """Deadline (seconds) requested by the client for the current call"""
+    try:
+        meta = mcp.get_context().request_context.meta
+    except (LookupError, ValueError):
+        meta = None  # Called outside an MCP request (e.g. directly in tests)
+    timeout_ms = (meta.model_extra or {}).get("timeoutMs") if meta is not None else None
+    if isinstance(timeout_ms, (int, float)) and timeout_ms > 0:
+        return timeout_ms / 1000
+    return TOOL_DEFAULT_TIMEOUT_SECONDS
+
+def cancellable(fn):
+    """Run a tool under its per-call deadline and record cancelled work"""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        name = fn.__name__
+        timeout = _request_timeout()
+        started = time.monotonic()
+        tool_metrics.in_flight += 1
+        try:
+            with anyio.fail_after(timeout):
+                result = await fn(*args, **kwargs)
+        except TimeoutError:
+            tool_metrics.deadline_exceeded[name] += 1
+            tool_metrics.abandoned_seconds += time.monotonic() - started
+            raise TimeoutError(f"{name} exceeded its deadline of {timeout:g}s and was cancelled")
+        except anyio.get_cancelled_exc_class():
+            tool_metrics.cancelled[name] += 1
+            tool_metrics.abandoned_seconds += time.monotonic() - started
+            raise
+        except Exception:
+            tool_metrics.failed[name] += 1
+            raise
+        finally:
+            tool_metrics.in_flight -= 1
+        tool_metrics.completed[name] += 1
+        return result
+    return wrapper
+
 @mcp.tool()
+@cancellable
 async def get_posts(limit: int = 10) -> List[Dict[str, Any]]:
     """
     Get blog posts from JSONPlaceholder API
@@ -62,6 +205,7 @@ async def get_posts(limit: int = 10) -> List[Dict[str, Any]]:
         return cleaned_posts
 
 @mcp.tool()
+@cancellable
 async def get_post_by_id(post_id: int) -> Dict[str, Any]:
     """
     Get specific post by ID
@@ -85,6 +229,7 @@ async def get_post_by_id(post_id: int) -> Dict[str, Any]:
         }
 
 @mcp.tool() 
+@cancellable
 async def get_user_info(user_id: int) -> Dict[str, Any]:
     """
     Get user information by ID
@@ -112,7 +257,8 @@ async def get_user_info(user_id: int) -> Dict[str, Any]:
         }
 
 @mcp.tool()
-async def search_posts_by_user(user_id: int) -> List[Dict[str, Any]]:
+@cancellable
+async def search_posts_by_user(user_id: int, ctx: Context) -> Dict[str, Any]:
     """
     Get all posts by specific user
     
@@ -121,33 +267,38 @@ async def search_posts_by_user(user_id: int) -> List[Dict[str, Any]]:
     
     Returns:
         User info and all their posts
+        (each page of 20 posts is also sent ahead in a progress notification)
     """
     async with httpx.AsyncClient() as client:
         user_response = await client.get(f"{BASE_URL}/users/{user_id}")
         user_response.raise_for_status()
         user = user_response.json()
         
-        posts_response = await client.get(f"{BASE_URL}/posts?userId={user_id}")
-        posts_response.raise_for_status()
-        posts = posts_response.json()
-        
         result = {
             "user_name": user["name"],
             "user_email": user["email"], 
-            "posts_count": len(posts),
+            "posts_count": 0,
             "posts": []
         }
+        progress = PageProgress(ctx, key="posts")
         
-        for post in posts:
-            result["posts"].append({
-                "id": post["id"],
-                "title": post["title"],
-                "content": post["body"][:80] + "..." if len(post["body"]) > 80 else post["body"]
-            })
-            
+        async for posts, total in iter_pages(client, "/posts", params={"userId": user_id}):
+            page = [
+                {
+                    "id": post["id"],
+                    "title": post["title"],
+                    "content": post["body"][:80] + "..." if len(post["body"]) > 80 else post["body"]
+                }
+                for post in posts
+            ]
+            result["posts"].extend(page)
+            await progress.page(page, total)
+        
+        result["posts_count"] = len(result["posts"])
         return result
 
 @mcp.tool()
+@cancellable
 async def get_post_comments(post_id: int) -> Dict[str, Any]:
     """
     Get post with its comments
@@ -185,6 +336,462 @@ async def get_post_comments(post_id: int) -> Dict[str, Any]:
             ]
         }
 
+# === POSTS INDEX - Structured Queries ===
+# query_posts runs against an in-memory copy of the posts table with
+# secondary indexes, so a filtered query never re-downloads or scans
+# everything when an index can narrow the candidates first.
+
+INDEX_TTL_SECONDS = 300  # Refresh the API snapshot every 5 minutes
+QUERY_MAX_LIMIT = 100
+
+# Predicate language: {"field": {"op": value}} - only these combinations are valid
+QUERY_OPERATORS = {
+    "id": {"eq", "in", "gte", "lte"},
+    "user_id": {"eq", "in"},
+    "title": {"contains"},
+    "comments_count": {"eq", "gte", "lte"},
+}
+QUERY_SORT_FIELDS = {"id", "user_id", "title", "comments_count"}
+QUERY_AGGREGATES = {"count", "count_by_user"}
+
+def _trigrams(text: str):
+    """Lowercased character trigrams of a string"""
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class PostIndex:
+    """
+    Snapshot of all posts with secondary indexes
+
+    Indexes:
+        ids            - sorted post ids (range lookups via bisect)
+        by_user        - user_id -> post ids
+        title_trigrams - trigram -> post ids (substring lookups)
+        by_comments    - sorted (comments_count, post_id) pairs
+    """
+
+    def __init__(self, posts: List[Dict[str, Any]], comments: List[Dict[str, Any]]):
+        comment_counts = Counter(comment["postId"] for comment in comments)
+
+        self.rows = {}
+        self.by_user = defaultdict(list)
+        self.title_trigrams = defaultdict(set)
+        for post in posts:
+            row = {
+                "id": post["id"],
+                "title": post["title"],
+                "content": post["body"][:100] + "..." if len(post["body"]) > 100 else post["body"],
+                "user_id": post["userId"],
+                "comments_count": comment_counts.get(post["id"], 0)
+            }
+            self.rows[row["id"]] = row
+            self.by_user[row["user_id"]].append(row["id"])
+            for gram in _trigrams(row["title"]):
+                self.title_trigrams[gram].add(row["id"])
+
+        self.ids = sorted(self.rows)
+        self.by_comments = sorted((row["comments_count"], row["id"]) for row in self.rows.values())
+
+    def _candidates(self, field: str, op: str, value: Any):
+        """Post ids matching one predicate via an index, or None if no index applies"""
+        if field == "id":
+            if op == "eq":
+                return {value} if value in self.rows else set()
+            if op == "in":
+                return {post_id for post_id in value if post_id in self.rows}
+            if op == "gte":
+                return set(self.ids[bisect.bisect_left(self.ids, value):])
+            return set(self.ids[:bisect.bisect_right(self.ids, value)])
+
+        if field == "user_id":
+            user_ids = value if op == "in" else [value]
+            return {post_id for user_id in user_ids for post_id in self.by_user.get(user_id, ())}
+
+        if field == "title":
+            grams = _trigrams(value)
+            if not grams:
+                return None  # Shorter than a trigram - cannot use the index
+            postings = sorted((self.title_trigrams.get(gram, set()) for gram in grams), key=len)
+            return set.intersection(*postings)
+
+        if field == "comments_count":
+            if op == "eq":
+                lo = bisect.bisect_left(self.by_comments, (value, 0))
+                hi = bisect.bisect_left(self.by_comments, (value + 1, 0))
+            elif op == "gte":
+                lo, hi = bisect.bisect_left(self.by_comments, (value, 0)), len(self.by_comments)
+            else:
+                lo, hi = 0, bisect.bisect_left(self.by_comments, (value + 1, 0))
+            return {post_id for _, post_id in self.by_comments[lo:hi]}
+
+        return None
+
+    def plan(self, predicates: List[tuple]):
+        """
+        Pick the most selective index for a list of (field, op, value) predicates
+
+        Returns:
+            (candidate ids or None for a full scan, name of the index used)
+        """
+        best, best_index = None, "full_scan"
+        for field, op, value in predicates:
+            candidates = self._candidates(field, op, value)
+            if candidates is not None and (best is None or len(candidates) < len(best)):
+                best, best_index = candidates, field
+                if not best:
+                    break  # Nothing can match - stop planning
+        return best, best_index
+
+    @staticmethod
+    def matches(row: Dict[str, Any], field: str, op: str, value: Any) -> bool:
+        """Evaluate one predicate against a row"""
+        actual = row[field]
+        if op == "eq":
+            return actual == value
+        if op == "in":
+            return actual in value
+        if op == "gte":
+            return actual >= value
+        if op == "lte":
+            return actual <= value
+        return value.lower() in actual.lower()  # contains
+
+    def query(self, predicates: List[tuple], sort: Optional[str], limit: int, offset: int,
+              aggregate: Optional[str] = None) -> Dict[str, Any]:
+        """Run a validated query: plan, filter residual predicates, sort, page"""
+        candidates, index_used = self.plan(predicates)
+        scan_ids = self.ids if candidates is None else sorted(candidates)
+        rows = [
+            self.rows[post_id] for post_id in scan_ids
+            if all(self.matches(self.rows[post_id], field, op, value) for field, op, value in predicates)
+        ]
+
+        plan = {"index": index_used, "scanned": len(scan_ids), "table_size": len(self.rows)}
+
+        if aggregate == "count":
+            return {"count": len(rows), "plan": plan}
+        if aggregate == "count_by_user":
+            counts = Counter(row["user_id"] for row in rows)
+            return {"count": len(rows), "by_user": dict(sorted(counts.items())), "plan": plan}
+
+        if sort:
+            field = sort.lstrip("-")
+            rows.sort(key=lambda row: row[field], reverse=sort.startswith("-"))
+
+        page = rows[offset:offset + limit]
+        return {"total": len(rows), "count": len(page), "offset": offset, "posts": page, "plan": plan}
+
+def parse_query_filter(filter: Optional[Dict[str, Any]]) -> List[tuple]:
+    """
+    Validate a query_posts filter and flatten it to (field, op, value) predicates
+
+    Raises:
+        ValueError: Unknown field/operator or wrongly typed value
+    """
+    predicates = []
+    for field, condition in (filter or {}).items():
+        if field not in QUERY_OPERATORS:
+            raise ValueError(f"Unknown filter field '{field}'. Allowed: {sorted(QUERY_OPERATORS)}")
+        if not isinstance(condition, dict):
+            condition = {"contains" if field == "title" else "eq": condition}
+
+        for op, value in condition.items():
+            if op not in QUERY_OPERATORS[field]:
+                raise ValueError(f"Operator '{op}' not allowed on '{field}'. Allowed: {sorted(QUERY_OPERATORS[field])}")
+
+            if field == "title":
+                if not isinstance(value, str) or not value:
+                    raise ValueError("title.contains must be a non-empty string")
+            elif op == "in":
+                if not isinstance(value, list) or not all(isinstance(v, int) for v in value):
+                    raise ValueError(f"{field}.in must be a list of integers")
+                value = set(value)
+            elif not isinstance(value, int) or isinstance(value, bool):
+                raise ValueError(f"{field}.{op} must be an integer")
+
+            predicates.append((field, op, value))
+    return predicates
+
+class PrefixIndex:
+    """
+    Sorted (key, id) pairs for argument completion
+
+    Every id is reachable by the digits of the id itself and by each word of
+    its label (user name / post title), so "1" and "lean" both complete.
+    """
+
+    def __init__(self, labels: Dict[int, str]):
+        self.labels = labels
+        entries = set()
+        for item_id, label in labels.items():
+            entries.add((str(item_id), item_id))
+            for word in label.lower().split():
+                entries.add((word, item_id))
+        self.entries = sorted(entries)
+        self.keys = [key for key, _ in self.entries]
+
+    def complete(self, prefix: str) -> List[int]:
+        """All ids with a key starting with prefix, in numeric order"""
+        prefix = prefix.strip().lower()
+        ids = set()
+        for position in range(bisect.bisect_left(self.keys, prefix), len(self.keys)):
+            if not self.keys[position].startswith(prefix):
+                break
+            ids.add(self.entries[position][1])
+        return sorted(ids)
+
+class ApiSnapshot:
+    """One consistent copy of users, posts and comment counts from the API"""
+
+    def __init__(self, users: List[Dict[str, Any]], posts: List[Dict[str, Any]], comments: List[Dict[str, Any]]):
+        self.users = {user["id"]: user for user in users}
+        self.posts = {post["id"]: post for post in posts}
+        self.index = PostIndex(posts, comments)
+        self.completions = {
+            "user_id": PrefixIndex({user["id"]: user["name"] for user in users}),
+            "post_id": PrefixIndex({post["id"]: post["title"] for post in posts})
+        }
+        self.loaded_at = time.monotonic()
+
+_snapshot: Optional[ApiSnapshot] = None
+_snapshot_lock = asyncio.Lock()
+
+async def get_snapshot(force_refresh: bool = False) -> ApiSnapshot:
+    """Load (or refresh when stale) the shared API snapshot"""
+    global _snapshot
+    async with _snapshot_lock:
+        if force_refresh or _snapshot is None or time.monotonic() - _snapshot.loaded_at > INDEX_TTL_SECONDS:
+            async with httpx.AsyncClient() as client:
+                responses = await asyncio.gather(
+                    client.get(f"{BASE_URL}/users"),
+                    client.get(f"{BASE_URL}/posts"),
+                    client.get(f"{BASE_URL}/comments")
+                )
+                for response in responses:
+                    response.raise_for_status()
+                _snapshot = ApiSnapshot(*(response.json() for response in responses))
+        return _snapshot
+
+async def get_post_index() -> PostIndex:
+    """Shared posts index from the current snapshot"""
+    return (await get_snapshot()).index
+
+@mcp.tool()
+@cancellable
+async def query_posts(
+    filter: Optional[Dict[str, Any]] = None,
+    sort: Optional[str] = None,
+    limit: int = 10,
+    offset: int = 0,
+    aggregate: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Structured query over all posts - use this instead of fetching everything
+
+    Args:
+        filter: Predicates as {"field": {"op": value}}, all must match. Fields/operators:
+            id: eq, in, gte, lte            e.g. {"id": {"gte": 10, "lte": 20}}
+            user_id: eq, in                 e.g. {"user_id": {"in": [1, 2]}}
+            title: contains                 e.g. {"title": {"contains": "dolor"}}
+            comments_count: eq, gte, lte    e.g. {"comments_count": {"gte": 5}}
+        sort: Field to sort by (id, user_id, title, comments_count), prefix "-" for descending
+        limit: Maximum number of posts to return (default: 10, max: 100)
+        offset: Number of matching posts to skip (default: 0)
+        aggregate: Optional "count" or "count_by_user" to return counts instead of posts
+
+    Returns:
+        Matching posts (or counts) with total matches and the query plan used
+    """
+    predicates = parse_query_filter(filter)
+    if sort is not None and sort.lstrip("-") not in QUERY_SORT_FIELDS:
+        raise ValueError(f"Unknown sort field '{sort}'. Allowed: {sorted(QUERY_SORT_FIELDS)}")
+    if aggregate is not None and aggregate not in QUERY_AGGREGATES:
+        raise ValueError(f"Unknown aggregate '{aggregate}'. Allowed: {sorted(QUERY_AGGREGATES)}")
+    if not 1 <= limit <= QUERY_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {QUERY_MAX_LIMIT}")
+    if offset < 0:
+        raise ValueError("offset must be >= 0")
+
+    index = await get_post_index()
+    return index.query(predicates, sort, limit, offset, aggregate)
+
+# === LIVE RESOURCES & SUBSCRIPTIONS ===
+# post://{id}, user://{id} and user://{id}/posts are served from the shared
+# API snapshot. Clients subscribe instead of re-polling tools: one watcher
+# refreshes the snapshot for everyone, diffs it against the previous one and
+# pushes notifications/resources/updated only for entities that changed.
+
+RESOURCE_POLL_SECONDS = 30  # Upstream refresh interval while anyone is subscribed
+
+def changed_resource_uris(old: ApiSnapshot, new: ApiSnapshot) -> set:
+    """Resource URIs whose content differs between two snapshots"""
+    uris = set()
+    for user_id in old.users.keys() | new.users.keys():
+        if old.users.get(user_id) != new.users.get(user_id):
+            uris.add(f"user://{user_id}")
+
+    for post_id in old.posts.keys() | new.posts.keys():
+        before, after = old.posts.get(post_id), new.posts.get(post_id)
+        before_comments = old.index.rows[post_id]["comments_count"] if before else None
+        after_comments = new.index.rows[post_id]["comments_count"] if after else None
+        if before != after or before_comments != after_comments:
+            uris.add(f"post://{post_id}")
+            for post in (before, after):
+                if post is not None:
+                    uris.add(f"user://{post['userId']}/posts")
+    return uris
+
+class ResourceWatcher:
+    """Subscription registry plus the single upstream poller shared by all sessions"""
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)  # uri -> subscribed sessions
+        self.refreshes = 0
+        self.notifications_sent = 0
+        self._sessions_running = 0
+        self._task = None
+
+    def subscribe(self, uri: str, session):
+        self.subscribers[uri].add(session)
+
+    def unsubscribe(self, uri: str, session):
+        sessions = self.subscribers.get(uri)
+        if sessions is not None:
+            sessions.discard(session)
+            if not sessions:
+                del self.subscribers[uri]
+
+    @asynccontextmanager
+    async def running(self):
+        """Start the poller with the first session, stop it with the last"""
+        self._sessions_running += 1
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll_loop())
+        try:
+            yield self
+        finally:
+            self._sessions_running -= 1
+            if self._sessions_running == 0 and self._task is not None:
+                self._task.cancel()
+                self._task = None
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(RESOURCE_POLL_SECONDS)
+            if not self.subscribers:
+                continue  # Nobody is watching - skip the upstream call
+            try:
+                await self.refresh()
+            except httpx.HTTPError as e:
+                print(f"[WATCH] Refresh failed: {e}", file=sys.stderr)
+
+    async def refresh(self):
+        """Re-fetch the snapshot once and notify subscribers of changed entities"""
+        old = _snapshot
+        new = await get_snapshot(force_refresh=True)
+        self.refreshes += 1
+        if old is not None:
+            await self.notify(changed_resource_uris(old, new))
+
+    async def notify(self, uris):
+        for uri in uris:
+            for session in list(self.subscribers.get(uri, ())):
+                try:
+                    await session.send_resource_updated(AnyUrl(uri))
+                    self.notifications_sent += 1
+                except Exception:
+                    self.unsubscribe(uri, session)  # Session closed - drop it
+
+resource_watcher = ResourceWatcher()
+
+@mcp.resource("post://{post_id}", mime_type="application/json")
+async def get_post_resource(post_id: int) -> str:
+    """Post by ID with its comment count, kept live through subscriptions"""
+    snapshot = await get_snapshot()
+    post = snapshot.posts.get(post_id)
+    if post is None:
+        raise ValueError(f"Post {post_id} not found")
+    return json.dumps({
+        "id": post["id"],
+        "title": post["title"],
+        "content": post["body"],
+        "author_id": post["userId"],
+        "comments_count": snapshot.index.rows[post_id]["comments_count"]
+    }, ensure_ascii=False)
+
+@mcp.resource("user://{user_id}", mime_type="application/json")
+async def get_user_resource(user_id: int) -> str:
+    """User details by ID, kept live through subscriptions"""
+    snapshot = await get_snapshot()
+    user = snapshot.users.get(user_id)
+    if user is None:
+        raise ValueError(f"User {user_id} not found")
+    return json.dumps({
+        "id": user["id"],
+        "name": user["name"],
+        "username": user["username"],
+        "email": user["email"],
+        "phone": user["phone"],
+        "website": user["website"],
+        "company": user["company"]["name"],
+        "city": user["address"]["city"]
+    }, ensure_ascii=False)
+
+@mcp.resource("user://{user_id}/posts", mime_type="application/json")
+async def get_user_posts_resource(user_id: int) -> str:
+    """All posts by a user, kept live through subscriptions"""
+    snapshot = await get_snapshot()
+    if user_id not in snapshot.users:
+        raise ValueError(f"User {user_id} not found")
+    return json.dumps([
+        snapshot.index.rows[post_id] for post_id in snapshot.index.by_user.get(user_id, ())
+    ], ensure_ascii=False)
+
+@mcp._mcp_server.subscribe_resource()
+async def subscribe_resource(uri: AnyUrl) -> None:
+    resource_watcher.subscribe(str(uri), mcp.get_context().session)
+
+@mcp._mcp_server.unsubscribe_resource()
+async def unsubscribe_resource(uri: AnyUrl) -> None:
+    resource_watcher.unsubscribe(str(uri), mcp.get_context().session)
+
+# === ARGUMENT COMPLETION ===
+# completion/complete for user_id / post_id arguments, answered from the
+# snapshot's prefix indexes (no upstream call once the snapshot is loaded).
+# MCP only defines completion for resource templates and prompts, so any
+# reference with an argument of that name is served. Labels (user name /
+# post title) for the returned ids are sent in the completion's extra
+# "labels" field - the decorator's handler does not pass a result _meta through.
+
+COMPLETION_MAX_VALUES = 100  # Protocol limit per response
+
+@mcp.completion()
+async def complete_argument(
+    ref: Union[types.PromptReference, types.ResourceTemplateReference],
+    argument: types.CompletionArgument,
+    context: Optional[types.CompletionContext]
+) -> types.Completion:
+    snapshot = await get_snapshot()
+    index = snapshot.completions.get(argument.name)
+    ids = index.complete(argument.value) if index is not None else []
+    values = [str(item_id) for item_id in ids[:COMPLETION_MAX_VALUES]]
+
+    return types.Completion(
+        values=values, total=len(ids), hasMore=len(ids) > len(values),
+        labels={value: index.labels[int(value)] for value in values}
+    )
+
+# FastMCP always advertises resources.subscribe=False - advertise the handlers above
+_base_capabilities = mcp._mcp_server.get_capabilities
+
+def _capabilities_with_subscribe(*args, **kwargs):
+    capabilities = _base_capabilities(*args, **kwargs)
+    if capabilities.resources is not None:
+        capabilities.resources.subscribe = True
+    return capabilities
+
+mcp._mcp_server.get_capabilities = _capabilities_with_subscribe
+
 # MCP Resource - API Information
 @mcp.resource("api://info")
 def get_api_info() -> str:
@@ -208,12 +815,27 @@ def get_api_info() -> str:
     3. get_user_info() - Get user details
     4. search_posts_by_user() - Find user's posts
     5. get_post_comments() - Get post with comments
+    6. query_posts() - Filter/sort/count posts using indexes
+    
+    Live Resources (subscribe for change notifications):
+    • post://{id} - Post with comment count
+    • user://{id} - User details
+    • user://{id}/posts - All posts by a user
+    """
+
+# MCP Resource - Tool execution metrics
+@mcp.resource("api://metrics")
+def get_tool_metrics() -> str:
+    """
+    Tool execution counters: completed, failed, cancelled by the client,
+    deadline exceeded, and seconds spent on abandoned calls
     """
+    return json.dumps(tool_metrics.snapshot(), indent=2)
 
 if __name__ == "__main__":
     print("[START] SIMPLE MCP Server Starting...")
     print("[API] Connecting to JSONPlaceholder API...")
-    print("[TOOLS] MCP Tools: get_posts, get_user_info, search_posts_by_user, get_post_comments")
+    print("[TOOLS] MCP Tools: get_posts, get_user_info, search_posts_by_user, get_post_comments, query_posts")
     print("[PROTOCOL] MCP stdio transport")
     print("[READY] Server ready!")
     
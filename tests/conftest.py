@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Shared pytest fixtures - offline fakes for the gateway, undone after every test
+"""
+import os
+import sys
+import time
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import mcp_gateway
+
+KNOWN_IDS = {"user_id": list(range(1, 11)), "post_id": list(range(1, 101))}
+
+# Paths that answer without the model; tests turn on the ones they cover
+FAST_PATHS = ("INTENT_ROUTER_ENABLED", "ANSWER_CACHE_ENABLED", "TEMPLATE_ANSWERS_ENABLED", "FORMATTED_ANSWER_CACHE_ENABLED")
+
+@pytest.fixture
+def gateway(monkeypatch):
+    """
+    mcp_gateway with users 1-10 and posts 1-100 known, every fast path off
+    and fresh caches, sessions, admission, deduplication, job state and counters.
+
+    Returns:
+        fake(chat_stream=None, tools=None, **settings) - installs an Ollama
+        chat_stream fake, {tool name: fake function} and module settings
+        (e.g. INTENT_ROUTER_ENABLED=True); all undone after the test
+    """
+    monkeypatch.setattr(mcp_gateway.known_ids, "ids", {name: list(ids) for name, ids in KNOWN_IDS.items()})
+    monkeypatch.setattr(mcp_gateway.known_ids, "loaded_at", time.monotonic())
+    for flag in FAST_PATHS:
+        monkeypatch.setattr(mcp_gateway, flag, False)
+    monkeypatch.setattr(mcp_gateway, "answer_cache", mcp_gateway.AnswerCache())
+    monkeypatch.setattr(mcp_gateway, "formatted_answers", mcp_gateway.FormattedAnswerCache())
+    monkeypatch.setattr(mcp_gateway, "sessions", mcp_gateway.SessionStore())
+    monkeypatch.setattr(mcp_gateway, "scheduler", mcp_gateway.FairScheduler())
+    monkeypatch.setattr(mcp_gateway, "chat_dedupe", mcp_gateway.ChatDeduplicator())
+    monkeypatch.setattr(mcp_gateway, "chat_jobs", mcp_gateway.ChatJobStore())
+    monkeypatch.setattr(mcp_gateway, "abandoned_chats", Counter())
+    monkeypatch.setattr(mcp_gateway, "model_escalations", Counter())
+
+    def fake(chat_stream=None, tools=None, **settings):
+        if chat_stream is not None:
+            monkeypatch.setattr(mcp_gateway.ollama, "chat_stream", chat_stream)
+        for name, function in (tools or {}).items():
+            monkeypatch.setitem(mcp_gateway.TOOL_REGISTRY[name], "function", function)
+        for name, value in settings.items():
+            monkeypatch.setattr(mcp_gateway, name, value)
+
+    return fake
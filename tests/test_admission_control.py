@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Test admission control and fair-share scheduling (offline - Ollama and tools faked)
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+from starlette.testclient import TestClient
+
+import mcp_gateway
+from mcp_gateway import FairScheduler, Overloaded, handle_chat
+
+async def fake_chat_stream(messages, tools=None, format=None, stage=None):
+    if stage == "tool_selection":
+        decision = {"use_tool": True, "tool": "get_user_info", "parameters": {"user_id": 1}}
+        yield {"message": {"role": "assistant", "content": json.dumps(decision)}, "done": True}
+    else:
+        yield {"message": {"role": "assistant", "content": "Leanne Graham."}, "done": True}
+
+async def fake_get_user_info(user_id):
+    return {"id": user_id, "name": "Leanne Graham"}
+
+@pytest.fixture
+def fakes(gateway):
+    gateway(chat_stream=fake_chat_stream, tools={"get_user_info": fake_get_user_info})
+    return gateway
+
+def test_waiting_chats_round_robin_across_clients_and_priorities():
+    async def scenario():
+        scheduler = FairScheduler(max_active=1)
+        order = []
+
+        async def chat(client, priority, name):
+            admitted_at = await scheduler.acquire(client, priority)
+            order.append(name)
+            await asyncio.sleep(0.01)
+            scheduler.release(admitted_at)
+
+        first = asyncio.ensure_future(chat("heavy", "batch", "heavy-1"))
+        await asyncio.sleep(0)
+        waiting = [asyncio.ensure_future(chat(client, priority, name)) for client, priority, name in [
+            ("heavy", "batch", "heavy-2"), ("heavy", "batch", "heavy-3"), ("light", "batch", "light-1"),
+            ("ui", "interactive", "ui-1")
+        ]]
+        await asyncio.sleep(0)
+        assert scheduler.snapshot()["queued_by_priority"] == {"interactive": 1, "batch": 3}
+        await asyncio.gather(first, *waiting)
+        return order, scheduler
+
+    order, scheduler = asyncio.run(scenario())
+    assert order == ["heavy-1", "ui-1", "heavy-2", "light-1", "heavy-3"]
+    snapshot = scheduler.snapshot()
+    assert snapshot["active"] == snapshot["queued"] == 0
+    assert snapshot["admitted"] == {"batch": 4, "interactive": 1}
+    assert snapshot["wait_seconds"]["batch"]["count"] == 4
+
+def test_long_expected_wait_is_shed_with_retry_after(fakes):
+    scheduler = FairScheduler(max_active=1)
+    fakes(scheduler=scheduler)
+    scheduler.active = 1  # Ollama busy with a long chat
+    scheduler.service_seconds = 50.0
+    payload, status = asyncio.run(handle_chat({"message": "Who is user 1?", "priority": "interactive"}))
+    assert status == 429 and payload["retry_after"] == 50
+    try:
+        scheduler.check("batch")
+    except Overloaded as e:
+        raise AssertionError(f"batch waits up to 120 seconds, refused: {e}")
+
+    client = TestClient(mcp_gateway.asgi_app)
+    response = client.post("/api/chat/stream", json={"message": "Who is user 1?"})
+    assert response.status_code == 429 and response.headers["Retry-After"] == "50"
+    response = mcp_gateway.app.test_client().post("/api/chat", json={"message": "Who is user 1?", "priority": "interactive"})
+    assert response.status_code == 429 and response.headers["Retry-After"] == "50"
+    assert scheduler.snapshot()["shed"] == {"expected_wait": 3}
+
+def test_waiting_too_long_is_shed_and_leaves_the_queue(monkeypatch):
+    monkeypatch.setitem(mcp_gateway.SCHEDULER_MAX_WAIT_SECONDS, "interactive", 0.05)
+
+    async def scenario():
+        scheduler = FairScheduler(max_active=1)
+        admitted_at = await scheduler.acquire("a", "interactive")
+        scheduler.service_seconds = 0.01  # Expected to be admitted in time, but the slot is never freed
+        try:
+            await scheduler.acquire("b", "interactive")
+        except Overloaded as e:
+            assert e.reason == "wait_timeout"
+        else:
+            raise AssertionError("second chat was admitted while the slot was busy")
+        assert scheduler.queued == 0 and scheduler.active == 1
+        scheduler.release(admitted_at)
+        return scheduler
+
+    assert asyncio.run(scenario()).snapshot()["active"] == 0
+
+def test_full_queue_is_refused(fakes):
+    scheduler = FairScheduler(max_active=1, max_queued=0)
+    fakes(scheduler=scheduler)
+    scheduler.active = 1
+    scheduler.service_seconds = 0.1
+    response = mcp_gateway.app.test_client().post("/api/chat", json={"message": "Who is user 1?"})
+    assert response.status_code == 429 and "Retry-After" in response.headers
+    assert scheduler.snapshot()["shed"] == {"queue_full": 1}
+
+def test_stream_reports_queueing_then_answers(fakes):
+    scheduler = FairScheduler(max_active=1)
+    fakes(scheduler=scheduler)
+
+    async def scenario():
+        admitted_at = await scheduler.acquire("other", "batch")
+        asyncio.get_running_loop().call_later(0.05, scheduler.release, admitted_at)
+        return [chunk async for chunk in mcp_gateway.chat_stream({"message": "Who is user 1?"})]
+
+    chunks = asyncio.run(scenario())
+    assert chunks[0].startswith('event: status\ndata: {"stage": "queued"')
+    assert chunks[-1].startswith("event: done")
+    assert scheduler.active == 0
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
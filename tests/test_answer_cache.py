@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test the gateway's semantic answer cache (offline - Ollama and tools faked)
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import mcp_gateway
+from mcp_gateway import AnswerCache, handle_chat
+
+ANSWER = {"success": True, "message": "Leanne Graham", "tool_used": "get_user_info", "tool_result": {"id": 1}}
+TOOL_CALL = {"tool": "get_user_info", "parameters": {"user_id": 1}}
+
+def test_near_duplicates_hit():
+    cache = AnswerCache()
+    cache.put("Who is user 1?", ANSWER, TOOL_CALL)
+    assert cache.get("who is user 1")["payload"]["message"] == "Leanne Graham"
+    assert cache.get("WHO IS USER ONE")["tool_call"] == TOOL_CALL
+    assert cache.get("Where does user 1 live?") is None
+
+def test_numbers_and_language_must_match():
+    cache = AnswerCache()
+    cache.put("Who is user 1?", ANSWER, TOOL_CALL)
+    cache.put("מי זה משתמש 1?", dict(ANSWER, message="לין גרהם"), TOOL_CALL)
+    assert cache.get("Who is user 2?") is None
+    assert cache.get("מי זה משתמש אחד")["payload"]["message"] == "לין גרהם"  # Hebrew number word
+    assert cache.get("who is user 1")["payload"]["message"] == "Leanne Graham"
+
+def test_intent_must_match():
+    cache = AnswerCache()
+    cache.put("Show me user 3", ANSWER, {"tool": "get_user_info", "parameters": {"user_id": 3}})
+    assert cache.get("Show me user 3 posts") is None  # Close wording, another tool
+    assert cache.get("show me user 3") is not None
+
+def test_close_wording_with_another_meaning_misses():
+    cache = AnswerCache()
+    most = dict(ANSWER, message="User 1", tool_used="get_posts")
+    cache.put("Which user has the most posts?", most)
+    assert cache.get("which user has the fewest posts") is None  # Trigram cosine 0.84
+    assert cache.get("Which user has the most posts")["payload"]["message"] == "User 1"
+
+    cache.put("show posts by user 1", dict(ANSWER, tool_used="search_posts_by_user"))
+    assert cache.get("show posts not by user 1") is None
+
+    cache.put("Is user 1 older than user 2?", dict(ANSWER, tool_used="get_user_info"))
+    assert cache.get("is user 2 older than user 1") is None  # Same numbers, swapped
+    assert cache.get("is user one older than user two") is not None
+
+def test_persona_must_match():
+    cache = AnswerCache()
+    cache.put("Who is user 1?", ANSWER, TOOL_CALL, "medical")
+    assert cache.get("Who is user 1?", "social_worker") is None
+    assert cache.get("Who is user 1?") is None
+    assert cache.get("who is user 1", "medical")["payload"]["message"] == "Leanne Graham"
+
+def test_entries_expire_with_their_tool_data(monkeypatch):
+    cache = AnswerCache()
+    monkeypatch.setitem(mcp_gateway.ANSWER_CACHE_TTL_SECONDS, "get_user_info", 0.05)
+    cache.put("Who is user 1?", ANSWER, TOOL_CALL)
+    time.sleep(0.06)
+    assert cache.get("Who is user 1?") is None and not cache.entries
+
+def test_repeated_question_skips_ollama(gateway):
+    calls = []
+
+    async def fake_chat_stream(messages, tools=None, format=None, stage=None):
+        calls.append(stage)
+        if stage == "tool_selection":
+            decision = {"use_tool": True, "tool": "get_post_comments", "parameters": {"post_id": 7}}
+            yield {"message": {"role": "assistant", "content": json.dumps(decision)}, "done": True}
+        else:
+            yield {"message": {"role": "assistant", "content": "Post 7 has 5 comments."}, "done": True}
+
+    async def fake_comments_tool(post_id):
+        return {"post": {"id": post_id}, "comments_count": 5}
+
+    gateway(chat_stream=fake_chat_stream, tools={"get_post_comments": fake_comments_tool}, ANSWER_CACHE_ENABLED=True)
+
+    first, _ = asyncio.run(handle_chat({"message": "Show the comments of post 7"}))
+    started = time.perf_counter()
+    second, _ = asyncio.run(handle_chat({"message": "show the comments on post 7"}))
+    print(f"   cached answer in {(time.perf_counter() - started) * 1000:.2f} ms")
+
+    assert calls == ["tool_selection", "answer"]
+    assert second["cached"] and second["message"] == first["message"] == "Post 7 has 5 comments."
+    assert second["tool_used"] == "get_post_comments" and second["session_id"] != first["session_id"]
+    assert mcp_gateway.sessions.get(second["session_id"]).turns[0]["tool"] == "get_post_comments"
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
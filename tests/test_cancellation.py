@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test cancelling abandoned chats on disconnect or deadline (offline - Ollama and tools faked)
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import httpx
+from starlette.testclient import TestClient
+
+import mcp_gateway
+from mcp_gateway import OllamaBackend, OllamaClient, abort_when_abandoned, chat_stream
+
+seen = {"closed": 0, "tool_cancelled": 0}
+
+async def slow_chat_stream(messages, tools=None, format=None, stage=None):
+    """Selection is instant; the answer takes a second per token"""
+    if stage.startswith("tool_selection"):
+        decision = {"use_tool": True, "tool": "get_user_info", "parameters": {"user_id": 1}}
+        yield {"message": {"role": "assistant", "content": json.dumps(decision)}, "done": True}
+        return
+    try:
+        for token in ["Leanne ", "Graham."]:
+            await asyncio.sleep(1)
+            yield {"message": {"role": "assistant", "content": token}, "done": False}
+    finally:
+        seen["closed"] += 1
+
+async def slow_get_user_info(user_id):
+    try:
+        await asyncio.sleep(1)
+    except asyncio.CancelledError:
+        seen["tool_cancelled"] += 1
+        raise
+    return {"id": user_id, "name": "Leanne Graham"}
+
+async def fast_get_user_info(user_id):
+    return {"id": user_id, "name": "Leanne Graham"}
+
+@pytest.fixture
+def fakes(gateway):
+    gateway(chat_stream=slow_chat_stream, tools={"get_user_info": fast_get_user_info})
+    seen.update(closed=0, tool_cancelled=0)
+    return gateway
+
+def test_deadline_header_cancels_generation(fakes):
+    started = time.monotonic()
+    response = mcp_gateway.app.test_client().post("/api/chat", json={"message": "Who is user 1?"},
+                                                  headers={"X-Request-Timeout": "0.2"})
+    elapsed = time.monotonic() - started
+
+    assert response.status_code == 504 and response.json == {"error": "Deadline exceeded"}
+    assert elapsed < 0.8
+    assert seen["closed"] == 1 and mcp_gateway.abandoned_chats == {"deadline": 1}
+    assert mcp_gateway.scheduler.active == 0  # Admission slot handed back
+
+def test_stream_reports_deadline_as_event(fakes):
+    client = TestClient(mcp_gateway.asgi_app)
+    response = client.post("/api/chat/stream", json={"message": "Who is user 1?"}, headers={"X-Request-Timeout": "0.3"})
+    last_event = response.text.strip().split("\n\n")[-1]
+    assert last_event == 'event: error\ndata: {"error": "Deadline exceeded", "status": 504}'
+    assert seen["closed"] == 1
+
+def test_disconnect_cancels_tool_calls(fakes):
+    fakes(tools={"get_user_info": slow_get_user_info})
+
+    async def scenario():
+        disconnected = asyncio.get_running_loop().create_future()
+        asyncio.get_running_loop().call_later(0.1, disconnected.set_result, None)
+        started = time.monotonic()
+        chunks = [chunk async for chunk in chat_stream({"message": "Who is user 1?"}, disconnected=disconnected)]
+        return chunks, time.monotonic() - started
+
+    chunks, elapsed = asyncio.run(scenario())
+    assert elapsed < 0.5 and not any(chunk.startswith("event: done") for chunk in chunks)
+    assert seen["tool_cancelled"] == 1 and mcp_gateway.abandoned_chats == {"disconnect": 1}
+
+def test_consumer_closing_early_cancels_the_pipeline(fakes):
+    async def scenario():
+        events = abort_when_abandoned(mcp_gateway.session_chat_events({"message": "Who is user 1?"}, stream=True))
+        async for event, _ in events:
+            if event == "tool":
+                break
+        await events.aclose()
+
+    asyncio.run(scenario())
+    assert seen["closed"] == 1 and mcp_gateway.abandoned_chats == {"disconnect": 1}
+
+def test_abandoned_generation_time_is_counted_as_wasted():
+    async def handler(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200, content=b"")
+
+    client = OllamaClient([OllamaBackend("http://ollama:11434")])
+
+    async def scenario():
+        client._client, client._loop = httpx.AsyncClient(transport=httpx.MockTransport(handler)), asyncio.get_running_loop()
+
+        async def consume():
+            return [chunk async for chunk in client.chat_stream([{"role": "user", "content": "hi"}], stage="answer")]
+
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    stats = client.stats.snapshot()
+    assert stats["abandoned"] == 1 and 0.15 < stats["wasted_generation_seconds"] < 1
+    assert client.backends[0].slots.busy == 0
+
+def test_finished_chats_are_not_counted(fakes):
+    fakes(chat_stream=lambda *args, **kwargs: fast_answer())
+    payload, status = asyncio.run(mcp_gateway.run_until_abandoned(mcp_gateway.handle_chat({"message": "Who is user 1?"}), time.monotonic() + 5))
+    assert status == 200 and not mcp_gateway.abandoned_chats
+
+async def fast_answer():
+    decision = {"use_tool": True, "tool": "get_user_info", "parameters": {"user_id": 1}}
+    yield {"message": {"role": "assistant", "content": json.dumps(decision)}, "done": True}
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
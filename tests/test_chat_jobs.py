@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Test the asynchronous chat job API (offline - Ollama and tools faked)
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+from starlette.testclient import TestClient
+
+import mcp_gateway
+
+seen = {"selections": 0}
+
+async def slow_chat_stream(messages, tools=None, format=None, stage=None):
+    """Selection is instant; the answer takes a moment so the job can be watched running"""
+    if stage.startswith("tool_selection"):
+        seen["selections"] += 1
+        decision = {"use_tool": True, "tool": "get_user_info", "parameters": {"user_id": 1}}
+        yield {"message": {"role": "assistant", "content": json.dumps(decision)}, "done": True}
+        return
+    await asyncio.sleep(0.2)
+    yield {"message": {"role": "assistant", "content": "Leanne Graham."}, "done": True}
+
+async def fake_get_user_info(user_id):
+    return {"id": user_id, "name": "Leanne Graham"}
+
+@pytest.fixture
+def fakes(gateway):
+    gateway(chat_stream=slow_chat_stream, tools={"get_user_info": fake_get_user_info})
+    seen.update(selections=0)
+    return gateway
+
+def wait_for(client, job_id, state="done"):
+    for _ in range(100):
+        job = client.get(f"/api/chat/jobs/{job_id}").json
+        if job["status"] == state:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} never reached {state}: {job}")
+
+def test_job_returns_at_once_and_finishes_in_background(fakes):
+    client = mcp_gateway.app.test_client()
+    response = client.post("/api/chat/jobs", json={"message": "Who is user 1?"})
+    assert response.status_code == 202
+    assert response.json["status"] == "queued" and "result" not in response.json  # Did not wait for the answer
+    job_id = response.json["job_id"]
+    assert response.headers["Location"] == f"/api/chat/jobs/{job_id}"
+    assert response.json["events_url"] == f"/api/chat/jobs/{job_id}/events"
+
+    running = wait_for(client, job_id, "running")
+    assert running["stage"] in ("selecting_tool", "running_tool", "generating") and "result" not in running
+
+    done = wait_for(client, job_id)
+    assert done["status_code"] == 200
+    assert done["result"]["message"] == "Leanne Graham." and done["result"]["session_id"]
+
+def test_events_report_progress_then_result(fakes):
+    client = mcp_gateway.app.test_client()
+    job_id = client.post("/api/chat/jobs", json={"message": "Who is user 1?"}).json["job_id"]
+    events = client.get(f"/api/chat/jobs/{job_id}/events").get_data(as_text=True).strip().split("\n\n")
+    names = [event.split("\n")[0][len("event: "):] for event in events]
+    stages = [json.loads(event.split("\n")[1][len("data: "):])["stage"] for event in events if event.startswith("event: status")]
+    assert stages == ["queued", "selecting_tool", "running_tool", "generating"]
+    assert names[-1] == "done" and "tool" in names
+
+    # A follower joining after the job finished gets the whole story
+    replay = client.get(f"/api/chat/jobs/{job_id}/events").get_data(as_text=True).strip().split("\n\n")
+    assert replay == events
+
+def test_idempotency_key_returns_existing_job(fakes):
+    client = mcp_gateway.app.test_client()
+    headers = {"Idempotency-Key": "job-1"}
+    first = client.post("/api/chat/jobs", json={"message": "Who is user 1?"}, headers=headers).json
+    second = client.post("/api/chat/jobs", json={"message": "Who is user 1?"}, headers=headers).json
+    assert first["job_id"] == second["job_id"]
+    wait_for(client, first["job_id"])
+    assert seen["selections"] == 1
+
+def test_failed_job_reports_error(fakes):
+    client = mcp_gateway.app.test_client()
+    job_id = client.post("/api/chat/jobs", json={"message": ""}).json["job_id"]
+    job = wait_for(client, job_id, "failed")
+    assert job["status_code"] == 400 and job["error"]
+
+def test_unknown_job_is_404(fakes):
+    assert mcp_gateway.app.test_client().get("/api/chat/jobs/nope").status_code == 404
+    client = TestClient(mcp_gateway.asgi_app)
+    assert client.get("/api/chat/jobs/nope").status_code == 404
+    assert client.get("/api/chat/jobs/nope/events").status_code == 404
+
+def test_store_is_bounded_and_finished_jobs_expire(fakes):
+    fakes(CHAT_JOBS_MAX=2)
+    store = mcp_gateway.chat_jobs
+
+    async def scenario():
+        jobs = [store.submit({"message": f"Who is user {n}?"}) for n in range(1, 4)]
+        assert len(store.jobs) == 3  # Unfinished jobs are never evicted
+        await asyncio.gather(*(job.task for job in jobs))
+        assert store.get(jobs[0].id) is None and store.get(jobs[2].id) is jobs[2]
+        jobs[2].finished_at -= mcp_gateway.CHAT_JOB_RESULT_TTL_SECONDS
+        assert store.get(jobs[2].id) is None
+
+    asyncio.run(scenario())
+    assert store.snapshot()["evicted"] == 2
+
+def test_overloaded_submission_is_refused(fakes):
+    scheduler = mcp_gateway.scheduler
+    scheduler.max_queued = 0
+    scheduler.active = scheduler.max_active
+    response = mcp_gateway.app.test_client().post("/api/chat/jobs", json={"message": "Who is user 1?"})
+    assert response.status_code == 429 and response.headers["Retry-After"]
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
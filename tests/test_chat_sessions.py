@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test server-side chat sessions (offline - Ollama and tools faked)
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import mcp_gateway
+from mcp_gateway import SessionStore, handle_chat, route_intent
+
+selection_requests = []
+
+async def fake_chat_stream(messages, tools=None, format=None, stage=None):
+    if stage == "tool_selection":
+        selection_requests.append(messages)
+        question = messages[-1]["content"]
+        user_id = 2 if "user 2" in question or "his" in question else 1
+        tool = "search_posts_by_user" if "posts" in question else "get_user_info"
+        decision = {"use_tool": True, "tool": tool, "parameters": {"user_id": user_id}}
+        yield {"message": {"role": "assistant", "content": json.dumps(decision)}, "done": True}
+    else:
+        yield {"message": {"role": "assistant", "content": "Answer."}, "done": True}
+
+async def fake_user_tool(user_id):
+    return {"id": user_id, "name": f"User {user_id}"}
+
+@pytest.fixture
+def fakes(gateway):
+    gateway(chat_stream=fake_chat_stream, tools={"get_user_info": fake_user_tool, "search_posts_by_user": fake_user_tool},
+            INTENT_ROUTER_ENABLED=True)
+    selection_requests.clear()
+    return gateway
+
+def test_follow_up_sees_earlier_turns(fakes):
+    first, _ = asyncio.run(handle_chat({"message": "Tell me about user 2"}))
+    second, _ = asyncio.run(handle_chat({"message": "and his posts?", "session_id": first["session_id"]}))
+
+    assert second["session_id"] == first["session_id"]
+    assert second["tool_used"] == "search_posts_by_user"
+    history = selection_requests[-1]
+    assert history[0]["content"] == mcp_gateway.TOOL_SELECTION_PROMPT
+    assert history[1] == {"role": "user", "content": "User question: Tell me about user 2"}
+    assert json.loads(history[2]["content"]) == {"use_tool": True, "tool": "get_user_info", "parameters": {"user_id": 2}}
+
+def test_unknown_session_starts_a_new_one(fakes):
+    payload, _ = asyncio.run(handle_chat({"message": "Who is user 1?", "session_id": "made-up"}))
+    assert payload["session_id"] != "made-up"
+    assert len(mcp_gateway.sessions.get(payload["session_id"]).turns) == 1
+
+def test_pronoun_follow_ups_are_left_to_the_model():
+    assert route_intent("show his posts") is None or route_intent("show his posts")["confidence"] < 0.8
+    assert route_intent("הראה את הפוסטים שלו")["confidence"] < mcp_gateway.INTENT_ROUTER_MIN_CONFIDENCE
+
+def test_sessions_are_bounded_lru(monkeypatch):
+    store = SessionStore()
+    monkeypatch.setattr(mcp_gateway, "SESSION_MAX_COUNT", 3)
+    first, _ = store.create()
+    second, _ = store.create()
+    store.create()
+    store.get(first)  # Recently used, survives
+    store.create()
+    assert store.get(first) is not None and store.get(second) is None
+    assert store.snapshot()["evictions"] == 1
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
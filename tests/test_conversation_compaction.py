@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test rolling compaction of long chat sessions (offline - Ollama faked)
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import mcp_gateway
+from mcp_gateway import ChatSession, SessionCompactor, tool_selection_messages
+
+def long_session(turns=12):
+    session = ChatSession()
+    for i in range(turns):
+        session.add_turn(f"Tell me about user {i % 10 + 1}", {"tool": "get_user_info", "parameters": {"user_id": i % 10 + 1}}, "x" * 500)
+    return session
+
+def test_history_stays_within_budget_before_compaction():
+    session = long_session(20)
+    summary, turns = session.history()
+    assert summary is None
+    assert sum(turn["tokens"] for turn in turns) <= mcp_gateway.SESSION_HISTORY_TOKEN_BUDGET
+    assert turns[-1] is session.turns[-1] and len(turns) < len(session.turns)
+    assert session.needs_compaction()
+
+def test_background_compaction_folds_old_turns(gateway):
+    prompts = []
+
+    async def fake_chat_stream(messages, tools=None, format=None, stage=None):
+        prompts.append((stage, messages))
+        await asyncio.sleep(0.01)
+        yield {"message": {"role": "assistant", "content": "The user asked about users 1-8."}, "done": True}
+
+    gateway(chat_stream=fake_chat_stream)
+    session = long_session()
+    compactor = SessionCompactor()
+
+    async def run():
+        compactor.start()
+        compactor.submit(session)
+        compactor.submit(session)  # Already queued, ignored
+        await asyncio.sleep(0.005)
+        session.add_turn("and user 3?", None, "Clementine.")  # Arrives while summarizing
+        await asyncio.sleep(0.1)
+        await compactor.close()
+
+    asyncio.run(run())
+    print(f"   {compactor.snapshot()}")
+
+    assert len(prompts) == 1 and prompts[0][0] == "summary"
+    assert "Tell me about user 1" in prompts[0][1][1]["content"]
+    assert session.summary == "The user asked about users 1-8."
+    assert [turn["n"] for turn in session.turns] == [8, 9, 10, 11, 12]
+    assert compactor.snapshot()["compactions"] == 1 and not session.compacting
+
+    summary, turns = session.history()
+    messages = tool_selection_messages("and his posts?", False, turns, summary)
+    assert messages[1]["content"].endswith("The user asked about users 1-8.")
+    assert messages[0]["content"] == mcp_gateway.TOOL_SELECTION_PROMPT
+
+def test_failed_summary_keeps_turns(gateway):
+    async def failing_chat_stream(messages, tools=None, format=None, stage=None):
+        raise mcp_gateway.OllamaError(503)
+        yield
+
+    gateway(chat_stream=failing_chat_stream)
+    session = long_session()
+    compactor = SessionCompactor()
+
+    async def run():
+        compactor.start()
+        compactor.submit(session)
+        await asyncio.sleep(0.05)
+        await compactor.close()
+
+    asyncio.run(run())
+    assert len(session.turns) == 12 and session.summary is None
+    assert compactor.failures == 1 and not session.compacting
+
+def test_worker_survives_unexpected_errors(gateway):
+    async def broken_chat_stream(messages, tools=None, format=None, stage=None):
+        raise ValueError("Expecting value: line 1 column 1")
+        yield
+
+    gateway(chat_stream=broken_chat_stream)
+    sessions = [long_session(), long_session()]
+    compactor = SessionCompactor()
+
+    async def run():
+        compactor.start()
+        for session in sessions:
+            compactor.submit(session)
+        await asyncio.sleep(0.05)
+        await compactor.close()
+
+    asyncio.run(run())
+    assert compactor.failures == 2  # The second session was still processed
+    assert not any(session.compacting for session in sessions)
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
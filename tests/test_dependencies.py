@@ -17,6 +17,16 @@ def test_imports():
     except ImportError as e:
         tests.append(("[FAIL] Flask", f"FAILED: {e}"))
     
+    # Test ASGI stack
+    try:
+        import starlette
+        import uvicorn
+        from starlette.applications import Starlette
+        tests.append(("[OK] starlette", f"v{starlette.__version__}"))
+        tests.append(("[OK] uvicorn", f"v{uvicorn.__version__}"))
+    except ImportError as e:
+        tests.append(("[FAIL] starlette/uvicorn", f"FAILED: {e}"))
+    
     # Test requests
     try:
         import requests
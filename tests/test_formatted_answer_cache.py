@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Test the formatted-answer cache (offline - Ollama and tools faked)
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import mcp_gateway
+from mcp_gateway import formatted_answer_key, handle_chat
+
+POSTS = {"user_name": "Ervin Howell", "posts_count": 1, "posts": [{"id": 11, "title": "et ea vero"}]}
+
+def test_key_normalizes_parameters():
+    assert formatted_answer_key("search_posts_by_user", {"user_id": 2, "extra": 1}, POSTS, False) == \
+        formatted_answer_key("search_posts_by_user", {"user_id": 2}, dict(reversed(list(POSTS.items()))), False)
+    assert formatted_answer_key("search_posts_by_user", {"user_id": 2}, POSTS, False) != \
+        formatted_answer_key("search_posts_by_user", {"user_id": 2}, POSTS, True)
+    assert formatted_answer_key("search_posts_by_user", {"user_id": 2}, POSTS, False, "medical") != \
+        formatted_answer_key("search_posts_by_user", {"user_id": 2}, POSTS, False)
+
+def test_changed_tool_result_is_regenerated(gateway):
+    results = [POSTS, POSTS, dict(POSTS, posts_count=2)]
+    stages = []
+
+    async def fake_chat_stream(messages, tools=None, format=None, stage=None):
+        stages.append(stage)
+        if stage == "tool_selection":
+            decision = {"use_tool": True, "tool": "search_posts_by_user", "parameters": {"user_id": 2}}
+            yield {"message": {"role": "assistant", "content": json.dumps(decision)}, "done": True}
+        else:
+            count = json.loads(messages[-1]["content"].split("The result was: ")[1].split("\n")[0])["posts_count"]
+            yield {"message": {"role": "assistant", "content": f"Ervin wrote {count} posts."}, "done": True}
+
+    async def fake_posts_tool(user_id):
+        return results.pop(0)
+
+    gateway(chat_stream=fake_chat_stream, tools={"search_posts_by_user": fake_posts_tool}, FORMATTED_ANSWER_CACHE_ENABLED=True)
+
+    answers = [asyncio.run(handle_chat({"message": question}))[0]["message"]
+               for question in ["posts of Ervin", "list the posts of user two", "posts of Ervin"]]
+
+    assert answers == ["Ervin wrote 1 posts.", "Ervin wrote 1 posts.", "Ervin wrote 2 posts."]
+    assert stages.count("answer") == 2  # Second question reused the answer, third had new data
+    assert mcp_gateway.formatted_answers.snapshot()["hits"] == 1
+
+def test_persona_shapes_the_answer_and_its_cache_entry(gateway):
+    prompts = []
+
+    async def fake_chat_stream(messages, tools=None, format=None, stage=None):
+        if stage == "tool_selection":
+            decision = {"use_tool": True, "tool": "search_posts_by_user", "parameters": {"user_id": 2}}
+            yield {"message": {"role": "assistant", "content": json.dumps(decision)}, "done": True}
+        else:
+            prompts.append([message["content"] for message in messages if message["role"] == "system"])
+            yield {"message": {"role": "assistant", "content": f"Answer {len(prompts)}"}, "done": True}
+
+    async def fake_posts_tool(user_id):
+        return POSTS
+
+    gateway(chat_stream=fake_chat_stream, tools={"search_posts_by_user": fake_posts_tool}, FORMATTED_ANSWER_CACHE_ENABLED=True)
+
+    answers = [asyncio.run(handle_chat(dict({"message": "posts of Ervin"}, **extra)))[0]["message"]
+               for extra in [{"persona": "medical"}, {"persona": "social_worker"}, {"persona": "medical"}, {"persona": "pirate"}, {}]]
+
+    assert answers == ["Answer 1", "Answer 2", "Answer 1", "Answer 3", "Answer 3"]  # Unknown persona: default style
+    assert prompts[0][1] == mcp_gateway.PERSONA_PROMPTS["medical"]
+    assert prompts[1][1] == mcp_gateway.PERSONA_PROMPTS["social_worker"]
+    assert prompts[2] == [mcp_gateway.ANSWER_PROMPT]
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test the gateway chat pipeline over ASGI and Flask (offline - Ollama and tools faked)
+"""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+from starlette.testclient import TestClient
+
+import mcp_gateway
+
+ollama_prompts = []
+
+async def fake_chat_stream(messages, tools=None, format=None, stage=None):
+    ollama_prompts.append(messages[-1]["content"])
+    if messages[0]["content"] == mcp_gateway.TOOL_SELECTION_PROMPT:
+        decision = {"use_tool": True, "tool": "get_user_info", "parameters": {"user_id": 1}}
+        yield {"message": {"role": "assistant", "content": json.dumps(decision)}, "done": False}
+    else:
+        for token in ["Leanne ", "Graham ", "lives in Gwenborough."]:
+            yield {"message": {"role": "assistant", "content": token}, "done": False}
+    yield {"message": {"role": "assistant", "content": ""}, "done": True}
+
+async def fake_get_user_info(user_id):
+    return {"id": user_id, "name": "Leanne Graham", "city": "Gwenborough"}
+
+@pytest.fixture
+def fakes(gateway):
+    """These tests cover the AI tool-selection path, so every fast path stays off"""
+    gateway(chat_stream=fake_chat_stream, tools={"get_user_info": fake_get_user_info})
+    return gateway
+
+def test_asgi_chat_uses_tool(fakes):
+    client = TestClient(mcp_gateway.asgi_app)
+    response = client.post("/api/chat", json={"message": "Who is user 1?"})
+    data = response.json()
+    print(f"   {data['message']}")
+
+    assert response.status_code == 200
+    assert data["tool_used"] == "get_user_info"
+    assert data["tool_result"]["name"] == "Leanne Graham"
+    assert json.dumps(data["tool_result"]) in ollama_prompts[-1]
+
+def test_asgi_routes():
+    client = TestClient(mcp_gateway.asgi_app)
+    assert client.post("/api/chat", json={}).status_code == 400
+    assert "get_posts" in client.get("/api/tools").json()["tools"]
+    assert client.get("/").json()["status"] == "running"
+
+def parse_sse(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def test_stream_sends_status_tool_tokens_then_done(fakes):
+    client = TestClient(mcp_gateway.asgi_app)
+    response = client.post("/api/chat/stream", json={"message": "Who is user 1?"})
+    events = parse_sse(response.text)
+    names = [name for name, _ in events]
+    print(f"   {names}")
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert names[:2] == ["status", "status"] and names[2] == "tool"
+    assert [payload["text"] for name, payload in events if name == "token"] == ["Leanne ", "Graham ", "lives in Gwenborough."]
+    done = events[-1][1]
+    assert events[-1][0] == "done" and done.pop("session_id")
+    assert done == {
+        "success": True,
+        "message": "Leanne Graham lives in Gwenborough.",
+        "tool_used": "get_user_info",
+        "tool_result": {"id": 1, "name": "Leanne Graham", "city": "Gwenborough"}
+    }
+    assert mcp_gateway.chat_latency.snapshot()["first_token"]["count"] >= 1
+
+def test_stream_reports_errors_as_events(fakes):
+    client = TestClient(mcp_gateway.asgi_app)
+    events = parse_sse(client.post("/api/chat/stream", json={"message": ""}).text)
+    assert events == [("error", {"error": "No message provided", "status": 400})]
+
+def test_body_that_is_not_an_object_is_refused(fakes):
+    asgi, flask = TestClient(mcp_gateway.asgi_app), mcp_gateway.app.test_client()
+    for path in ("/api/chat", "/api/chat/stream", "/api/chat/jobs"):
+        for body in ([1], "hello", 3):
+            response = asgi.post(path, json=body)
+            assert response.status_code == 400 and response.json() == {"error": "No message provided"}
+            response = flask.post(path, json=body)
+            assert response.status_code == 400 and response.json == {"error": "No message provided"}
+
+def test_flask_mode_shares_one_event_loop(fakes):
+    client = mcp_gateway.app.test_client()
+    first = client.post("/api/chat", json={"message": "Who is user 1?"})
+    loop = mcp_gateway._gateway_loop
+    second = client.post("/api/chat", json={"message": "Who is user 1?"})
+
+    assert first.json["tool_used"] == second.json["tool_used"] == "get_user_info"
+    assert loop is not None and mcp_gateway._gateway_loop is loop
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Test local id validation in the gateway (offline, ids preloaded)
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+from mcp_gateway import validate_tool_ids
+
+def test_valid_ids_pass_and_are_normalized(gateway):
+    parameters = {"user_id": "3"}
+    assert asyncio.run(validate_tool_ids(parameters)) is None
+    assert parameters == {"user_id": 3}
+
+def test_unknown_user_answered_locally(gateway):
+    message = asyncio.run(validate_tool_ids({"user_id": 42}))
+    print(f"   {message}")
+    assert message == "There is no user with id 42. Available user ids: 1-10"
+
+def test_unknown_post_in_hebrew(gateway):
+    message = asyncio.run(validate_tool_ids({"post_id": 500}, is_hebrew=True))
+    print(f"   {message}")
+    assert "פוסט" in message and "1-100" in message
+
+def test_parameters_without_ids_skip_validation(gateway):
+    assert asyncio.run(validate_tool_ids({"limit": 5})) is None
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
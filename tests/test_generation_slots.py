@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test dispatching generations across Ollama's parallel slots (offline - Ollama replaced by an httpx mock transport)
+"""
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import httpx
+
+from mcp_gateway import GenerationSlots, OllamaBackend, OllamaClient
+
+def slow_ollama(in_flight):
+    """Mock Ollama taking 50ms per reply; records the most replies in progress at once"""
+    async def handler(request):
+        in_flight["now"] += 1
+        in_flight["most"] = max(in_flight["most"], in_flight["now"])
+        await asyncio.sleep(0.05)
+        in_flight["now"] -= 1
+        lines = [{"message": {"content": "token"}, "done": False}, {"message": {"content": ""}, "done": True}]
+        return httpx.Response(200, content="".join(json.dumps(line) + "\n" for line in lines).encode())
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+def test_generations_never_exceed_the_slots():
+    in_flight = {"now": 0, "most": 0}
+    client = OllamaClient([OllamaBackend("http://ollama:11434", slots=2)])
+    slots = client.backends[0].slots
+
+    async def generation(stage):
+        return [chunk async for chunk in client.chat_stream([{"role": "user", "content": "hi"}], stage=stage)]
+
+    async def run():
+        client._client, client._loop = slow_ollama(in_flight), asyncio.get_running_loop()
+        return await asyncio.gather(*(generation(stage) for stage in ["tool_selection", "answer"] * 3))
+
+    replies = asyncio.run(run())
+    snapshot = slots.snapshot()
+    print(f"   {snapshot}")
+
+    assert all(len(chunks) == 2 for chunks in replies)
+    assert in_flight["most"] == 2 and snapshot["peak_busy"] == 2
+    assert snapshot["busy"] == snapshot["waiting"] == 0
+    assert snapshot["dispatched"] == {"tool_selection": 3, "answer": 3}
+    assert 0.5 < snapshot["utilization"] <= 1.0  # Both slots kept busy for most of the run
+
+def test_answers_get_the_next_free_slot_first():
+    async def scenario():
+        slots = GenerationSlots(slots=1)
+        order = []
+
+        async def generation(stage, name):
+            await slots.acquire(stage)
+            order.append(name)
+            await asyncio.sleep(0)
+            slots.release()
+
+        await slots.acquire("summary")  # Slot busy
+        waiting = [asyncio.ensure_future(generation(stage, name)) for stage, name in [
+            ("summary", "summary-2"), ("tool_selection", "select-a"), ("tool_selection", "select-b"), ("answer", "answer-a")
+        ]]
+        await asyncio.sleep(0)
+        slots.release()
+        await asyncio.gather(*waiting)
+        return order
+
+    assert asyncio.run(scenario()) == ["answer-a", "select-a", "select-b", "summary-2"]
+
+def test_stopped_or_cancelled_generations_free_their_slot():
+    in_flight = {"now": 0, "most": 0}
+    client = OllamaClient([OllamaBackend("http://ollama:11434", slots=1)])
+    slots = client.backends[0].slots
+
+    async def run():
+        client._client, client._loop = slow_ollama(in_flight), asyncio.get_running_loop()
+        chunks = client.chat_stream([{"role": "user", "content": "hi"}], stage="tool_selection")
+        await chunks.__anext__()
+        waiting = asyncio.ensure_future(slots.acquire("answer"))
+        await asyncio.sleep(0)
+        waiting.cancel()  # Caller gave up while queued
+        await chunks.aclose()  # Stopped after the first chunk
+        assert slots.busy == 0
+        return [chunk async for chunk in client.chat_stream([{"role": "user", "content": "hi"}], stage="answer")]
+
+    assert len(asyncio.run(run())) == 2
+    assert slots.snapshot()["busy"] == 0
+
+if __name__ == "__main__":
+    print("Testing generation slots...")
+    print("=" * 50)
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"[OK] {name}")
+    print("[SUCCESS] Generation slots working correctly!")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test the gateway's fast-path intent router (offline - tools faked, Ollama must not be called)
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import mcp_gateway
+from mcp_gateway import route_intent
+
+def routed(message):
+    route = route_intent(message)
+    if route is None or route["confidence"] < mcp_gateway.INTENT_ROUTER_MIN_CONFIDENCE:
+        return None
+    return route["tool"], route["parameters"]
+
+def test_english_questions():
+    assert routed("Who is user 1?") == ("get_user_info", {"user_id": 1})
+    assert routed("Tell me about user #7") == ("get_user_info", {"user_id": 7})
+    assert routed("Show me the posts of user 3") == ("search_posts_by_user", {"user_id": 3})
+    assert routed("What are the comments on post 12?") == ("get_post_comments", {"post_id": 12})
+    assert routed("show 5 posts") == ("get_posts", {"limit": 5})
+    assert routed("show posts") == ("get_posts", {})
+
+def test_hebrew_questions_and_number_words():
+    assert routed("מי זה משתמש 1?") == ("get_user_info", {"user_id": 1})
+    assert routed("ספר לי על המשתמש השלישי") == ("get_user_info", {"user_id": 3})
+    assert routed("מה המידע על משתמש מספר חמש") == ("get_user_info", {"user_id": 5})
+    assert routed("הראה לי פוסטים של משתמש 2") == ("search_posts_by_user", {"user_id": 2})
+    assert routed("מה התגובות לפוסט עשר?") == ("get_post_comments", {"post_id": 10})
+    assert routed("תראה לי שלושה פוסטים") == ("get_posts", {"limit": 3})
+
+def test_unclear_questions_go_to_the_model():
+    assert routed("What is the weather today?") is None
+    assert routed("Compare user 1 and user 2") is None
+    assert routed("מה שלומך?") is None
+    assert routed("Which comments did user 4 write?") is None
+
+def test_questions_the_tools_cannot_answer_go_to_the_model():
+    assert routed("Who wrote post 5?") is None
+    assert routed("What is the email of the author of post 3") is None
+    assert routed("מי כתב את פוסט 5?") is None
+    assert routed("Which user has the most posts") is None
+    assert routed("which user has the fewest posts?") is None
+    assert routed("איזה משתמש כתב הכי הרבה פוסטים") is None
+    assert routed("What is the title of post 5?") == ("get_post_comments", {"post_id": 5})
+
+def test_routed_chat_skips_tool_selection(gateway):
+    calls = []
+
+    async def fake_chat_stream(messages, tools=None, format=None, stage=None):
+        calls.append(stage)
+        yield {"message": {"role": "assistant", "content": "Clementine Bauch lives in McKenziehaven."}, "done": True}
+
+    async def fake_get_user_info(user_id):
+        return {"id": user_id, "name": "Clementine Bauch"}
+
+    gateway(chat_stream=fake_chat_stream, tools={"get_user_info": fake_get_user_info}, INTENT_ROUTER_ENABLED=True)
+
+    payload, status = asyncio.run(mcp_gateway.handle_chat({"message": "ספר לי על משתמש שלוש"}))
+    print(f"   {payload['message']}")
+
+    assert status == 200
+    assert payload["tool_used"] == "get_user_info"
+    assert calls == ["answer"]  # Only the answer was generated
+    stats = mcp_gateway.router_stats.snapshot()
+    assert stats["routed"] >= 1 and stats["hit_rate"] > 0
+
+def test_router_is_fast():
+    started = time.perf_counter()
+    for _ in range(1000):
+        route_intent("הראה לי פוסטים של משתמש 2")
+    per_call = (time.perf_counter() - started) / 1000
+    print(f"   {per_call * 1e6:.1f} microseconds per question")
+    assert per_call < 0.001
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
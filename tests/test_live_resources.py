@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Test snapshot diffing and subscription notifications for live resources (offline)
+"""
+import asyncio
+import copy
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import mcp_server
+from mcp_server import ApiSnapshot, ResourceWatcher, changed_resource_uris, mcp, types
+
+USERS = [{"id": i, "name": f"User {i}"} for i in range(1, 4)]
+POSTS = [{"id": i, "userId": (i - 1) // 2 + 1, "title": f"title {i}", "body": "body"} for i in range(1, 7)]
+COMMENTS = [{"id": i, "postId": 1} for i in range(1, 4)]
+
+def snapshot(users=USERS, posts=POSTS, comments=COMMENTS):
+    return ApiSnapshot(copy.deepcopy(users), copy.deepcopy(posts), copy.deepcopy(comments))
+
+def test_identical_snapshots_have_no_changes():
+    assert changed_resource_uris(snapshot(), snapshot()) == set()
+
+def test_post_edit_updates_post_and_author_posts():
+    posts = copy.deepcopy(POSTS)
+    posts[3]["title"] = "edited"
+    assert changed_resource_uris(snapshot(), snapshot(posts=posts)) == {"post://4", "user://2/posts"}
+
+def test_moved_post_updates_both_authors():
+    posts = copy.deepcopy(POSTS)
+    posts[0]["userId"] = 3
+    assert changed_resource_uris(snapshot(), snapshot(posts=posts)) == {"post://1", "user://1/posts", "user://3/posts"}
+
+def test_new_comment_and_user_change():
+    users = copy.deepcopy(USERS)
+    users[1]["name"] = "Renamed"
+    comments = COMMENTS + [{"id": 99, "postId": 6}]
+    assert changed_resource_uris(snapshot(), snapshot(users=users, comments=comments)) == {"user://2", "post://6", "user://3/posts"}
+
+class FakeSession:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.updated = []
+
+    async def send_resource_updated(self, uri):
+        if self.fail:
+            raise ConnectionError("session closed")
+        self.updated.append(str(uri))
+
+def test_notify_only_subscribers_and_drop_dead_sessions():
+    watcher = ResourceWatcher()
+    alive, dead = FakeSession(), FakeSession(fail=True)
+    watcher.subscribe("post://1", alive)
+    watcher.subscribe("post://1", dead)
+    watcher.subscribe("user://2", alive)
+
+    asyncio.run(watcher.notify({"post://1", "post://2"}))
+
+    assert alive.updated == ["post://1"]
+    assert watcher.subscribers["post://1"] == {alive}
+    assert watcher.notifications_sent == 1
+
+def test_completion_is_served_by_the_registered_handler(monkeypatch):
+    async def fake_get_snapshot(force_refresh=False):
+        return snapshot()
+
+    monkeypatch.setattr(mcp_server, "get_snapshot", fake_get_snapshot)
+    request = types.CompleteRequest(method="completion/complete", params=types.CompleteRequestParams(
+        ref=types.ResourceTemplateReference(type="ref/resource", uri="user://{user_id}"),
+        argument=types.CompletionArgument(name="user_id", value="")
+    ))
+    result = asyncio.run(mcp._mcp_server.request_handlers[types.CompleteRequest](request))
+
+    completion = result.root.completion
+    assert completion.values == ["1", "2", "3"] and completion.total == 3 and not completion.hasMore
+    assert completion.model_dump()["labels"] == {"1": "User 1", "2": "User 2", "3": "User 3"}
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
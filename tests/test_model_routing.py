@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test per-stage models and escalation of failed tool selections (offline - Ollama faked)
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import httpx
+
+import mcp_gateway
+from mcp_gateway import OllamaClient, OllamaError, select_tool
+
+CALL = {"use_tool": True, "tool": "get_user_info", "parameters": {"user_id": 1}}
+SMALL = "qwen2.5:1.5b"
+
+@pytest.fixture
+def small_model(monkeypatch):
+    """Opt in to a small tool selection model, as OLLAMA_TOOL_SELECTION_MODEL does"""
+    monkeypatch.setitem(mcp_gateway.OLLAMA_STAGE_MODELS, "tool_selection", SMALL)
+
+def replies(gateway, by_stage):
+    """Fake Ollama chat answering each stage with its canned reply (an exception is raised)"""
+    stages = []
+
+    async def fake_chat_stream(messages, tools=None, format=None, stage=None):
+        stages.append(stage)
+        reply = by_stage[stage]
+        if isinstance(reply, Exception):
+            raise reply
+        yield {"message": {"role": "assistant", "content": reply}, "done": True}
+
+    gateway(chat_stream=fake_chat_stream, OLLAMA_TOOL_CALLING="format")
+    mcp_gateway.model_escalations.clear()
+    return stages
+
+def test_each_stage_runs_on_its_model(small_model):
+    bodies = []
+
+    def handler(request):
+        bodies.append(json.loads(request.content))
+        return httpx.Response(200, content=b'{"message": {"content": ""}, "done": true}\n')
+
+    client = OllamaClient()
+
+    async def run():
+        client._client, client._loop = httpx.AsyncClient(transport=httpx.MockTransport(handler)), asyncio.get_running_loop()
+        for stage in ["tool_selection", "answer", None]:
+            async for _ in client.chat_stream([{"role": "user", "content": "hi"}], stage=stage):
+                pass
+        await client.warm()
+
+    asyncio.run(run())
+    assert [body["model"] for body in bodies[:3]] == [SMALL, "aya", "aya"]
+    assert {body["model"] for body in bodies[3:]} == {SMALL, "aya"}  # Warm ping keeps both resident
+
+def test_missing_model_does_not_fail_the_backend(small_model):
+    def handler(request):
+        if json.loads(request.content)["model"] == SMALL:
+            return httpx.Response(404, json={"error": f"model '{SMALL}' not found"})
+        return httpx.Response(200, json={})
+
+    client = OllamaClient()
+
+    async def run():
+        client._client, client._loop = httpx.AsyncClient(transport=httpx.MockTransport(handler)), asyncio.get_running_loop()
+        for _ in range(mcp_gateway.OLLAMA_BACKEND_MAX_FAILURES):
+            await client.warm()
+
+    asyncio.run(run())
+    backend = client.backends[0]
+    assert backend.available() and backend.failures == 0 and backend.errors == 0
+    assert backend.loaded_models == {"aya:latest"}
+
+def test_valid_selection_stays_on_the_small_model(gateway, small_model):
+    stages = replies(gateway, {"tool_selection": json.dumps(CALL)})
+    assert asyncio.run(select_tool([])) == ([{"tool": "get_user_info", "parameters": {"user_id": 1}}], None)
+    assert stages == ["tool_selection"] and not mcp_gateway.model_escalations
+
+def test_failed_selections_escalate_to_the_big_model(gateway, small_model):
+    cases = [
+        ('{"use_tool": true, "tool": "get_us', "unparseable"),  # Cut short
+        (json.dumps({"use_tool": True, "tool": "get_user_info", "parameters": {}}), "invalid_call"),
+        (json.dumps({"use_tool": False, "answer": "I think user 1 is..."}), "plain_answer"),
+        (OllamaError(404), "ollama_error")  # Small model not pulled
+    ]
+    for reply, reason in cases:
+        stages = replies(gateway, {"tool_selection": reply, "tool_selection_escalated": json.dumps(CALL)})
+        calls, answer = asyncio.run(select_tool([]))
+        assert calls == [{"tool": "get_user_info", "parameters": {"user_id": 1}}] and answer is None
+        assert stages == ["tool_selection", "tool_selection_escalated"]
+        assert mcp_gateway.model_escalations == {reason: 1}
+
+def test_no_escalation_when_both_stages_share_a_model(gateway):
+    assert mcp_gateway.OLLAMA_STAGE_MODELS["tool_selection"] == "aya"  # The default
+    stages = replies(gateway, {"tool_selection": json.dumps({"use_tool": False, "answer": "Hello!"})})
+    assert asyncio.run(select_tool([])) == ([], "Hello!")
+    assert stages == ["tool_selection"]
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
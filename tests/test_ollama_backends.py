@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test the Ollama backend pool (offline - backends replaced by an httpx mock transport)
+"""
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import httpx
+
+import mcp_gateway
+from mcp_gateway import OllamaBackend, OllamaClient
+
+REPLY = "".join(json.dumps(line) + "\n" for line in [
+    {"message": {"content": "hi"}, "done": False},
+    {"message": {"content": ""}, "done": True}
+]).encode()
+
+def pool(*hosts, down=(), loaded=None):
+    """Client over mock backends; hosts in down refuse connections. Returns (client, hosts served per request)"""
+    served = []
+
+    async def handler(request):
+        host = request.url.host
+        if host in down:
+            raise httpx.ConnectError("connection refused", request=request)
+        if request.url.path == "/api/ps":
+            return httpx.Response(200, json={"models": [{"name": model} for model in (loaded or {}).get(host, [])]})
+        served.append(host)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, content=REPLY)
+
+    client = OllamaClient([OllamaBackend(f"http://{host}:11434") for host in hosts])
+    client.handler = handler
+    return client, served
+
+def run(client, coro_factory):
+    async def main():
+        client._client, client._loop = httpx.AsyncClient(transport=httpx.MockTransport(client.handler)), asyncio.get_running_loop()
+        return await coro_factory()
+    return asyncio.run(main())
+
+async def generation(client, stage="answer"):
+    return [chunk async for chunk in client.chat_stream([{"role": "user", "content": "hi"}], stage=stage)]
+
+def test_least_outstanding_requests_spreads_the_load():
+    client, served = pool("numa0", "numa1")
+    for backend in client.backends:
+        backend.loaded_models.add("aya:latest")
+
+    run(client, lambda: asyncio.gather(*(generation(client) for _ in range(4))))
+    assert sorted(served) == ["numa0", "numa0", "numa1", "numa1"]
+    snapshots = [backend.snapshot() for backend in client.backends]
+    assert all(snapshot["requests"] == 2 and snapshot["latency"]["generation"]["count"] == 2 for snapshot in snapshots)
+    assert all(snapshot["outstanding"] == 0 for snapshot in snapshots)
+
+def test_backend_with_the_model_loaded_is_preferred():
+    client, _ = pool("numa0", "numa1")
+    warm, cold = client.backends
+    warm.loaded_models.add("aya:latest")
+    warm.outstanding = 1  # Half its slots busy: still cheaper than loading the model elsewhere
+    assert client.pick_backend("aya") is warm
+    warm.outstanding = 3
+    assert client.pick_backend("aya") is cold
+    assert client.pick_backend("qwen2.5:1.5b") is cold  # Neither has it: least outstanding
+
+def test_failed_backend_is_retried_elsewhere_then_ejected():
+    client, served = pool("numa0", "numa1", down={"numa0"})
+    for backend in client.backends:
+        backend.loaded_models.add("aya:latest")
+    down, up = client.backends
+
+    async def sequential():
+        return [await generation(client) for _ in range(4)]
+
+    replies = run(client, sequential)
+    assert all(len(chunks) == 2 for chunks in replies) and served == ["numa1"] * 4
+    assert down.errors == mcp_gateway.OLLAMA_BACKEND_MAX_FAILURES  # Skipped once out of rotation
+    assert not down.available() and up.available()
+
+def test_health_check_restores_backends_and_reads_residency():
+    client, _ = pool("numa0", "numa1", loaded={"numa0": ["aya:latest", "qwen2.5:1.5b"]})
+    first, second = client.backends
+    for _ in range(mcp_gateway.OLLAMA_BACKEND_MAX_FAILURES):
+        first.record_failure("timeout")
+    assert not first.available()
+
+    run(client, client.check_health)
+    assert first.available()
+    assert first.snapshot()["loaded_models"] == ["aya:latest", "qwen2.5:1.5b"] and second.loaded_models == set()
+
+def test_cancelled_wait_for_a_slot_leaves_no_load_behind():
+    client, _ = pool("numa0")
+    backend = client.backends[0]
+    backend.slots.busy = backend.slots.slots  # Every slot taken
+
+    async def scenario():
+        waiting = asyncio.ensure_future(generation(client))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+
+    run(client, scenario)
+    assert backend.outstanding == 0 and backend.load("aya") == mcp_gateway.OLLAMA_COLD_BACKEND_PENALTY
+    assert not client.stats.abandoned  # Never started generating
+
+if __name__ == "__main__":
+    print("Testing Ollama backend pool...")
+    print("=" * 50)
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"[OK] {name}")
+    print("[SUCCESS] Ollama backend pool working correctly!")
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test the pooled Ollama client (offline - Ollama replaced by an httpx mock transport)
+"""
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import httpx
+
+import mcp_gateway
+from mcp_gateway import OllamaClient, OllamaStats
+
+def mock_client(requests_seen):
+    def handler(request):
+        body = json.loads(request.content)
+        requests_seen.append(body)
+        return httpx.Response(200, json={
+            "response": "ok",
+            "load_duration": 2_500_000_000,
+            "prompt_eval_count": 120,
+            "prompt_eval_duration": 600_000_000,
+            "eval_count": 40,
+            "eval_duration": 2_000_000_000
+        })
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+def mock_stream_client(requests_seen, lines):
+    def handler(request):
+        requests_seen.append(json.loads(request.content))
+        return httpx.Response(200, content="".join(json.dumps(line) + "\n" for line in lines).encode())
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+def test_chat_stream_sends_tools_and_format():
+    requests_seen = []
+    client = OllamaClient()
+    lines = [{"message": {"content": "{}"}, "done": False}, {"message": {"content": ""}, "done": True, "eval_count": 2}]
+
+    async def run():
+        client._client, client._loop = mock_stream_client(requests_seen, lines), asyncio.get_running_loop()
+        async for _ in client.chat_stream([{"role": "user", "content": "hi"}], format={"type": "object"}):
+            pass
+        async for _ in client.chat_stream([{"role": "user", "content": "hi"}], tools=mcp_gateway.ollama_tool_definitions()):
+            pass
+
+    asyncio.run(run())
+    assert all(body["keep_alive"] == mcp_gateway.OLLAMA_KEEP_ALIVE for body in requests_seen)
+    assert requests_seen[0]["format"] == {"type": "object"} and "tools" not in requests_seen[0]
+    assert [tool["function"]["name"] for tool in requests_seen[1]["tools"]] == list(mcp_gateway.TOOL_REGISTRY)
+    assert client.stats.requests == 2 and client.stats.stopped_early == 0
+
+def test_closing_a_stream_early_is_counted():
+    client = OllamaClient()
+    lines = [{"message": {"content": "x"}, "done": False}] * 5 + [{"done": True}]
+
+    async def run():
+        client._client, client._loop = mock_stream_client([], lines), asyncio.get_running_loop()
+        chunks = client.chat_stream([{"role": "user", "content": "hi"}])
+        await chunks.__anext__()
+        await chunks.aclose()
+
+    asyncio.run(run())
+    assert client.stats.stopped_early == 1 and client.stats.requests == 0
+
+def test_warm_ping_sends_no_prompt():
+    requests_seen = []
+    client = OllamaClient()
+
+    async def run():
+        client._client, client._loop = mock_client(requests_seen), asyncio.get_running_loop()
+        await client.warm()
+
+    asyncio.run(run())
+    assert "prompt" not in requests_seen[0]
+    assert client.stats.warm_pings == 1
+
+def test_prompt_eval_is_reported_per_stage():
+    stats = OllamaStats()
+    stats.record({"prompt_eval_count": 900, "prompt_eval_duration": 3_000_000_000}, "tool_selection")
+    stats.record({"prompt_eval_count": 30, "prompt_eval_duration": 100_000_000}, "tool_selection")  # Prefix cached
+    stats.record({"prompt_eval_count": 400, "prompt_eval_duration": 1_000_000_000})
+    stats.record_first_chunk("tool_selection", 0.5)
+    stages = stats.snapshot()["prompt_eval_by_stage"]
+    assert stages == {"tool_selection": {
+        "requests": 2,
+        "mean_prompt_tokens": 465.0,
+        "mean_prompt_eval_seconds": 1.55,
+        "mean_seconds_to_first_chunk": 0.5
+    }}
+
+def test_warm_model_is_not_a_cold_load():
+    stats = OllamaStats()
+    stats.record({"load_duration": 5_000_000, "eval_count": 1, "eval_duration": 1_000_000_000})
+    assert stats.cold_loads == 0
+
+if __name__ == "__main__":
+    print("Testing Ollama client...")
+    print("=" * 50)
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"[OK] {name}")
+    print("[SUCCESS] Ollama client working correctly!")
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test multi-tool planning and concurrent execution (offline - Ollama and tools faked)
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import mcp_gateway
+from mcp_gateway import handle_chat, run_tool_calls, select_tool, tool_call_schema
+
+USERS = {1: "Leanne Graham", 2: "Ervin Howell"}
+
+def fake_ollama(gateway, decision):
+    """Tool selection answers with decision; the answer stage echoes how many results it was given"""
+    prompts = {"tool_selection": 0, "answer": []}
+
+    async def fake_chat_stream(messages, tools=None, format=None, stage=None):
+        if stage.startswith("tool_selection"):
+            prompts["tool_selection"] += 1
+            yield {"message": {"role": "assistant", "content": json.dumps(decision)}, "done": True}
+        else:
+            prompts["answer"].append(messages[-1]["content"])
+            yield {"message": {"role": "assistant", "content": "Compared."}, "done": True}
+
+    gateway(chat_stream=fake_chat_stream)
+    return prompts
+
+def fake_tools(gateway, delay=0.2):
+    running = {"now": 0, "most": 0}
+
+    async def fake_user_tool(user_id):
+        running["now"] += 1
+        running["most"] = max(running["most"], running["now"])
+        await asyncio.sleep(delay)
+        running["now"] -= 1
+        return {"id": user_id, "name": USERS.get(user_id, f"User {user_id}")}
+
+    async def fake_comments_tool(post_id):
+        raise RuntimeError("upstream timed out")
+
+    gateway(tools={"get_user_info": fake_user_tool, "get_post_comments": fake_comments_tool})
+    return running
+
+def calls(*pairs):
+    return [{"tool": tool, "parameters": parameters} for tool, parameters in pairs]
+
+def test_schema_allows_a_bounded_list_of_calls():
+    several = [option for option in tool_call_schema()["anyOf"] if "tool_calls" in option["properties"]]
+    assert len(several) == 1
+    assert several[0]["properties"]["tool_calls"]["maxItems"] == mcp_gateway.TOOL_CALLS_MAX
+
+def test_select_tool_reads_a_list_of_calls(gateway):
+    gateway(OLLAMA_TOOL_CALLING="format")
+    planned = calls(("get_user_info", {"user_id": 1}), ("delete_everything", {}), ("get_post_comments", {"post_id": 5}))
+    fake_ollama(gateway, {"use_tool": True, "tool_calls": planned})
+    assert asyncio.run(select_tool([])) == (calls(("get_user_info", {"user_id": 1}), ("get_post_comments", {"post_id": 5})), None)
+
+def test_compound_question_runs_tools_concurrently_and_answers_once(gateway):
+    running = fake_tools(gateway)
+    planned = calls(("get_user_info", {"user_id": 1}), ("get_user_info", {"user_id": 2}), ("get_post_comments", {"post_id": 5}))
+    prompts = fake_ollama(gateway, {"use_tool": True, "tool_calls": planned})
+
+    started = time.monotonic()
+    payload, status = asyncio.run(handle_chat({"message": "compare user 1 and user 2 and show post 5's comments"}))
+    elapsed = time.monotonic() - started
+
+    assert status == 200 and payload["message"] == "Compared."
+    assert elapsed < 0.35 and running["most"] == 2  # Both lookups overlapped
+    assert prompts["tool_selection"] == 1 and len(prompts["answer"]) == 1
+    assert "Leanne Graham" in prompts["answer"][0] and "Ervin Howell" in prompts["answer"][0]
+    assert "The tool failed: upstream timed out" in prompts["answer"][0]
+    assert payload["tool_used"] == "get_user_info, get_post_comments"
+    assert [call.get("error") for call in payload["tool_result"]] == [None, None, "upstream timed out"]
+
+def test_fan_out_is_bounded_and_duplicates_run_once(gateway):
+    running = fake_tools(gateway, delay=0.05)
+    planned = calls(*[("get_user_info", {"user_id": user_id}) for user_id in (1, 2, 3, 4, 5, 1)])
+    finished = asyncio.run(run_tool_calls(planned))
+    assert running["most"] == mcp_gateway.TOOL_FANOUT_LIMIT
+    assert [call["result"]["id"] for call in finished] == [1, 2, 3, 4, 5, 1]
+
+def test_session_replays_every_call_of_a_compound_turn(gateway):
+    fake_tools(gateway, delay=0)
+    fake_ollama(gateway, {"use_tool": True, "tool_calls": calls(("get_user_info", {"user_id": 1}), ("get_user_info", {"user_id": 2}))})
+    first, _ = asyncio.run(handle_chat({"message": "compare user 1 and user 2"}))
+    turn = mcp_gateway.sessions.get(first["session_id"]).turns[0]
+    assert turn["tool"] is None and len(turn["tool_calls"]) == 2
+
+    replayed = mcp_gateway.tool_selection_messages("and their posts?", False, [turn])
+    assert json.loads(replayed[2]["content"])["tool_calls"] == turn["tool_calls"]
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test query_posts planner and predicate language (offline, no API calls)
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+from mcp_server import PostIndex, parse_query_filter
+
+POSTS = [
+    {"id": i, "userId": (i - 1) // 10 + 1, "title": f"title {i} dolor" if i % 3 == 0 else f"title {i}", "body": "body " * 30}
+    for i in range(1, 101)
+]
+COMMENTS = [{"id": i, "postId": i % 20 + 1} for i in range(1, 201)]
+
+INDEX = PostIndex(POSTS, COMMENTS)
+
+def run(filter=None, sort=None, limit=10, offset=0, aggregate=None):
+    return INDEX.query(parse_query_filter(filter), sort, limit, offset, aggregate)
+
+def test_user_index_is_used():
+    result = run({"user_id": {"in": [2, 3]}}, limit=100)
+    print(f"   plan: {result['plan']}")
+    assert result["plan"]["index"] == "user_id"
+    assert result["plan"]["scanned"] == 20
+    assert result["total"] == 20
+    assert all(post["user_id"] in (2, 3) for post in result["posts"])
+
+def test_most_selective_index_wins():
+    result = run({"user_id": {"eq": 1}, "id": {"gte": 5, "lte": 6}})
+    assert result["plan"]["index"] == "id"
+    assert [post["id"] for post in result["posts"]] == [5, 6]
+
+def test_title_trigram_index():
+    result = run({"title": {"contains": "DOLOR"}}, limit=100)
+    assert result["plan"]["index"] == "title"
+    assert result["total"] == 33
+    assert result["plan"]["scanned"] == 33
+
+def test_short_title_falls_back_to_scan():
+    result = run({"title": "1"}, limit=100)
+    assert result["plan"]["index"] == "full_scan"
+    assert result["plan"]["scanned"] == 100
+    assert all("1" in post["title"] for post in result["posts"])
+
+def test_comments_count_sort_and_page():
+    result = run({"comments_count": {"gte": 10}}, sort="-id", limit=5, offset=5)
+    assert result["plan"]["index"] == "comments_count"
+    assert result["total"] == 20
+    assert [post["id"] for post in result["posts"]] == [15, 14, 13, 12, 11]
+
+def test_aggregate_count_by_user():
+    result = run({"id": {"lte": 25}}, aggregate="count_by_user")
+    assert result["count"] == 25
+    assert result["by_user"] == {1: 10, 2: 10, 3: 5}
+
+def test_invalid_filters_rejected():
+    for bad in ({"body": "x"}, {"title": {"eq": "x"}}, {"user_id": {"in": "1"}}, {"id": {"gte": "5"}}):
+        try:
+            parse_query_filter(bad)
+        except ValueError as e:
+            print(f"   rejected {bad}: {e}")
+        else:
+            raise AssertionError(f"Filter should be rejected: {bad}")
+
+if __name__ == "__main__":
+    print("Testing query_posts planner...")
+    print("=" * 50)
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"[OK] {name}")
+    print("[SUCCESS] query_posts planner working correctly!")
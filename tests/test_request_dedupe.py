@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Test idempotency keys and in-flight deduplication of /api/chat (offline - Ollama and tools faked)
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+from starlette.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import mcp_gateway
+from mcp_gateway import chat_stream, deduplicated_chat
+
+seen = {"selections": 0, "closed": 0}
+
+async def slow_chat_stream(messages, tools=None, format=None, stage=None):
+    """Counts tool selections; the answer takes a moment so duplicates overlap"""
+    if stage.startswith("tool_selection"):
+        seen["selections"] += 1
+        decision = {"use_tool": True, "tool": "get_user_info", "parameters": {"user_id": 1}}
+        yield {"message": {"role": "assistant", "content": json.dumps(decision)}, "done": True}
+        return
+    try:
+        await asyncio.sleep(0.2)
+        yield {"message": {"role": "assistant", "content": "Leanne Graham."}, "done": True}
+    finally:
+        seen["closed"] += 1
+
+async def fake_get_user_info(user_id):
+    return {"id": user_id, "name": "Leanne Graham"}
+
+@pytest.fixture
+def fakes(gateway):
+    gateway(chat_stream=slow_chat_stream, tools={"get_user_info": fake_get_user_info})
+    seen.update(selections=0, closed=0)
+    return gateway
+
+def test_duplicate_requests_share_one_generation(fakes):
+    async def scenario():
+        request = {"message": "Who is user 1?"}
+        return await asyncio.gather(*(deduplicated_chat(dict(request), "10.0.0.1", "click-1") for _ in range(3)))
+
+    results = asyncio.run(scenario())
+    assert seen["selections"] == 1
+    assert all(status == 200 for _, status in results)
+    assert len({payload["session_id"] for payload, _ in results}) == 1  # One turn, one session
+    assert mcp_gateway.chat_dedupe.snapshot()["attached"] == 2
+
+def test_late_retry_is_replayed(fakes):
+    first = asyncio.run(deduplicated_chat({"message": "Who is user 1?"}, "10.0.0.1", "retry-1"))
+    retry = asyncio.run(deduplicated_chat({"message": "Who is user 1?"}, "10.0.0.1", "retry-1"))
+    assert seen["selections"] == 1 and retry == first
+    assert mcp_gateway.chat_dedupe.snapshot()["replayed"] == 1
+
+    # Another client's key is its own
+    asyncio.run(deduplicated_chat({"message": "Who is user 1?"}, "10.0.0.2", "retry-1"))
+    assert seen["selections"] == 2
+
+def test_key_reused_for_another_request_is_refused(fakes):
+    asyncio.run(deduplicated_chat({"message": "Who is user 1?"}, "10.0.0.1", "reused"))
+    payload, status = asyncio.run(deduplicated_chat({"message": "Who is user 2?"}, "10.0.0.1", "reused"))
+    assert status == 422 and "Idempotency-Key" in payload["error"]
+    assert seen["selections"] == 1
+
+def test_same_message_in_session_is_deduplicated(fakes):
+    session_id, _ = mcp_gateway.sessions.create()
+
+    async def scenario():
+        return await asyncio.gather(deduplicated_chat({"message": "Who is user 1?", "session_id": session_id}),
+                                    deduplicated_chat({"message": "who is user 1", "session_id": session_id}))
+
+    (first, _), (second, _) = asyncio.run(scenario())
+    assert seen["selections"] == 1 and first == second
+    assert len(mcp_gateway.sessions.get(session_id).turns) == 1
+
+    # Once the short replay window is over, asking again is a new question
+    mcp_gateway.chat_dedupe.results.clear()
+    asyncio.run(deduplicated_chat({"message": "Who is user 1?", "session_id": session_id}))
+    assert seen["selections"] == 2
+
+def test_different_ids_in_session_are_separate_questions(fakes):
+    session_id, _ = mcp_gateway.sessions.create()
+
+    async def scenario():
+        return await asyncio.gather(deduplicated_chat({"message": "Who is user 3?", "session_id": session_id}),
+                                    deduplicated_chat({"message": "Who is user 4?", "session_id": session_id}))
+
+    asyncio.run(scenario())
+    asyncio.run(deduplicated_chat({"message": "Who is user 5?", "session_id": session_id}))  # Within the replay window
+    assert seen["selections"] == 3
+    assert mcp_gateway.chat_dedupe.snapshot()["attached"] == mcp_gateway.chat_dedupe.snapshot()["replayed"] == 0
+
+def test_run_survives_until_every_caller_is_gone(fakes):
+    async def scenario():
+        callers = [asyncio.ensure_future(deduplicated_chat({"message": "Who is user 1?"}, "10.0.0.1", "shared"))
+                   for _ in range(2)]
+        await asyncio.sleep(0.05)
+        callers[0].cancel()
+        payload, status = await callers[1]
+        assert status == 200 and payload["message"] == "Leanne Graham."
+
+        callers = [asyncio.ensure_future(deduplicated_chat({"message": "Who is user 1?"}, "10.0.0.1", "abandoned"))
+                   for _ in range(2)]
+        await asyncio.sleep(0.05)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert seen["closed"] == 2  # The abandoned run's generation was stopped too
+    assert mcp_gateway.chat_dedupe.snapshot()["in_flight"] == 0
+    assert ("key", "10.0.0.1", "abandoned") not in mcp_gateway.chat_dedupe.results
+
+async def stream_events(*args, **kwargs):
+    """(event, payload) pairs of a chat_stream"""
+    events = []
+    async for message in chat_stream(*args, **kwargs):
+        event, data = message.strip().split("\n")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+def test_duplicate_streams_share_one_generation(fakes):
+    request = {"message": "Who is user 1?"}
+
+    async def scenario():
+        first = asyncio.ensure_future(stream_events(dict(request), "10.0.0.1", idempotency_key="stream-1"))
+        await asyncio.sleep(0.1)  # Halfway through the answer
+        second = asyncio.ensure_future(stream_events(dict(request), "10.0.0.1", idempotency_key="stream-1"))
+        return await first, await second
+
+    first, second = asyncio.run(scenario())
+    assert seen["selections"] == 1 and first == second  # The late caller also got the events before it came
+    assert first[-1][0] == "done" and first[-1][1]["message"] == "Leanne Graham."
+
+    # A retry after the answer is replayed, a different request under the key is refused
+    retry = asyncio.run(stream_events(dict(request), "10.0.0.1", idempotency_key="stream-1"))
+    refused = asyncio.run(stream_events({"message": "Who is user 2?"}, "10.0.0.1", idempotency_key="stream-1"))
+    assert retry == first and seen["selections"] == 1
+    assert refused == [("error", {"error": "Idempotency-Key was already used for a different request", "status": 422})]
+    assert mcp_gateway.chat_dedupe.snapshot()["attached"] == mcp_gateway.chat_dedupe.snapshot()["replayed"] == 1
+
+def test_stream_survives_until_every_caller_is_gone(fakes):
+    async def scenario():
+        request = {"message": "Who is user 1?"}
+        callers = [asyncio.ensure_future(stream_events(dict(request), "10.0.0.1", idempotency_key="shared-stream"))
+                   for _ in range(2)]
+        await asyncio.sleep(0.05)
+        callers[0].cancel()
+        events = await callers[1]
+        assert events[-1][1]["message"] == "Leanne Graham."
+
+        callers = [asyncio.ensure_future(stream_events(dict(request), "10.0.0.1", idempotency_key="gone-stream"))
+                   for _ in range(2)]
+        await asyncio.sleep(0.05)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert seen["closed"] == 2
+    assert mcp_gateway.chat_dedupe.snapshot()["in_flight"] == 0
+
+def test_stream_endpoint_reads_idempotency_header(fakes):
+    client = TestClient(mcp_gateway.asgi_app)
+    headers = {"Idempotency-Key": "endpoint-stream"}
+    first = client.post("/api/chat/stream", json={"message": "Who is user 1?"}, headers=headers)
+    second = client.post("/api/chat/stream", json={"message": "Who is user 1?"}, headers=headers)
+    assert first.status_code == second.status_code == 200 and first.text == second.text
+    assert seen["selections"] == 1
+
+    too_long = client.post("/api/chat/stream", json={"message": "Who is user 1?"}, headers={"Idempotency-Key": "k" * 300})
+    assert '"status": 400' in too_long.text
+
+def test_endpoint_reads_idempotency_header(fakes):
+    client = mcp_gateway.app.test_client()
+    headers = {"Idempotency-Key": "endpoint-1"}
+    first = client.post("/api/chat", json={"message": "Who is user 1?"}, headers=headers)
+    second = client.post("/api/chat", json={"message": "Who is user 1?"}, headers=headers)
+    assert first.status_code == second.status_code == 200 and first.json == second.json
+    assert seen["selections"] == 1
+
+    too_long = client.post("/api/chat", json={"message": "Who is user 1?"}, headers={"Idempotency-Key": "k" * 300})
+    assert too_long.status_code == 400
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test paged fetching and progress notifications of tool results (offline - upstream API faked)
+"""
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+import pytest
+from mcp.shared.memory import create_connected_server_and_client_session
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import mcp_server
+from mcp_server import iter_pages, mcp
+
+USER = {"id": 1, "name": "Leanne Graham", "email": "Sincere@april.biz"}
+POSTS = [{"id": i, "userId": 1 if i <= 45 else 2, "title": f"title {i}", "body": "body " * 30} for i in range(1, 49)]
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Fake JSONPlaceholder honouring userId/_page/_limit; returns the requests it served"""
+    requests = []
+
+    def handler(request):
+        requests.append(request.url)
+        if request.url.path.startswith("/users/"):
+            return httpx.Response(200, json=USER)
+        params = request.url.params
+        posts = [post for post in POSTS if "userId" not in params or post["userId"] == int(params["userId"])]
+        if "_page" in params:
+            size = int(params["_limit"])
+            start = (int(params["_page"]) - 1) * size
+            return httpx.Response(200, json=posts[start:start + size], headers={"x-total-count": str(len(posts))})
+        return httpx.Response(200, json=posts)
+
+    transport = httpx.MockTransport(handler)
+    client = httpx.AsyncClient
+    monkeypatch.setattr(mcp_server.httpx, "AsyncClient", lambda **kwargs: client(transport=transport, **kwargs))
+    return requests
+
+def call_tool(name, arguments):
+    """Call a tool through an in-memory MCP session, collecting its progress notifications"""
+    progress = []
+
+    async def on_progress(done, total, message):
+        progress.append((done, total, message))
+
+    async def run():
+        async with create_connected_server_and_client_session(mcp) as session:
+            return await session.call_tool(name, arguments, progress_callback=on_progress)
+
+    return asyncio.run(run()), progress
+
+def test_iter_pages_stops_at_the_last_page(upstream):
+    async def run():
+        async with httpx.AsyncClient() as client:
+            return [(len(items), total) async for items, total in iter_pages(client, "/posts")]
+
+    assert asyncio.run(run()) == [(20, 48), (20, 48), (8, 48)]
+    assert len(upstream) == 3
+
+def test_iter_pages_max_items(upstream):
+    async def run():
+        async with httpx.AsyncClient() as client:
+            return [[item["id"] for item in items] async for items, _ in iter_pages(client, "/posts", page_size=4, max_items=6)]
+
+    assert asyncio.run(run()) == [[1, 2, 3, 4], [5, 6]]
+
+def test_get_posts_is_one_request_with_structured_output(upstream):
+    result, progress = call_tool("get_posts", {"limit": 30})
+
+    assert len(upstream) == 1 and not progress
+    assert not result.isError
+    posts = result.structuredContent["result"]
+    assert [post["id"] for post in posts] == list(range(1, 31))
+    assert json.loads(result.content[0].text) == posts[0]
+
+def test_search_posts_streams_pages_ahead_of_the_result(upstream):
+    result, progress = call_tool("search_posts_by_user", {"user_id": 1})
+
+    assert not result.isError
+    posts = result.structuredContent["result"]
+    assert posts["posts_count"] == 45
+    assert [post["id"] for post in posts["posts"]] == list(range(1, 46))
+
+    # Every page reached the client as partial data before the result
+    assert [(done, total) for done, total, _ in progress] == [(20, 45), (40, 45), (45, 45)]
+    assert len(upstream) == 4  # The user, then three pages
+    pages = [json.loads(message) for _, _, message in progress]
+    assert [post["id"] for page in pages for post in page["posts"]] == list(range(1, 46))
+    assert pages[-1]["fetched"] == 45
+
+def test_result_shape_does_not_depend_on_size(upstream):
+    few, _ = call_tool("search_posts_by_user", {"user_id": 2})
+    many, _ = call_tool("search_posts_by_user", {"user_id": 1})
+
+    assert few.structuredContent["result"]["posts_count"] == 3
+    assert few.structuredContent["result"].keys() == many.structuredContent["result"].keys()
+    assert len(few.content) == len(many.content) == 1
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Test template-rendered answers for lookup tools (offline - Ollama and tools faked)
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import mcp_gateway
+from mcp_gateway import render_answer, template_answer_allowed
+
+USER = {
+    "id": 1,
+    "name": "Leanne Graham",
+    "username": "Bret",
+    "email": "Sincere@april.biz",
+    "phone": "1-770-736-8031 x56442",
+    "website": "hildegard.org",
+    "company": "Romaguera-Crona",
+    "city": "Gwenborough"
+}
+
+POST = {
+    "post": {"id": 1, "title": "sunt aut facere", "content": "quia et suscipit"},
+    "comments_count": 2,
+    "comments": [
+        {"id": 1, "author_name": "id labore", "author_email": "Eliseo@gardner.biz", "content": "laudantium"},
+        {"id": 2, "author_name": "quo vero", "author_email": "Jayne_Kuhic@sydney.com", "content": "est natus"}
+    ]
+}
+
+def test_english_user_template():
+    answer = render_answer("get_user_info", USER, False)
+    print(f"   {answer.splitlines()[0]}")
+    assert answer.startswith("User 1 is Leanne Graham (username: Bret).")
+    assert "Email: Sincere@april.biz" in answer and "⁨" not in answer
+
+def test_hebrew_templates_isolate_left_to_right_values():
+    answer = render_answer("get_user_info", USER, True)
+    assert answer.startswith("משתמש 1 הוא ⁨Leanne Graham⁩")
+    assert "אימייל: ⁨Sincere@april.biz⁩" in answer
+
+    post = render_answer("get_post_comments", POST, True)
+    assert post.splitlines()[0] == 'פוסט 1: "⁨sunt aut facere⁩"'
+    assert post.count("\n- ") == 2 and "תגובות (2):" in post
+
+def test_tools_without_templates_and_unexpected_results():
+    assert render_answer("get_posts", [{"id": 1}], False) is None
+    assert render_answer("get_user_info", {"id": 1}, False) is None
+
+def test_reasoning_questions_go_to_the_model(gateway):
+    gateway(TEMPLATE_ANSWERS_ENABLED=True)
+    assert template_answer_allowed("Who is user 1?", {})
+    assert template_answer_allowed("מי זה משתמש 1?", {})
+    assert not template_answer_allowed("Explain what user 1 does", {})
+    assert not template_answer_allowed("למה משתמש 1 כותב על זה?", {})
+    assert not template_answer_allowed("Who is user 1?", {"detailed": True})
+
+def test_lookup_skips_the_second_generation(gateway):
+    stages = []
+
+    async def fake_chat_stream(messages, tools=None, format=None, stage=None):
+        stages.append(stage)
+        yield {"message": {"role": "assistant", "content": "Model answer."}, "done": True}
+
+    async def fake_user_tool(user_id):
+        return dict(USER, id=user_id)
+
+    gateway(chat_stream=fake_chat_stream, tools={"get_user_info": fake_user_tool},
+            INTENT_ROUTER_ENABLED=True, TEMPLATE_ANSWERS_ENABLED=True)
+
+    lookup, _ = asyncio.run(mcp_gateway.handle_chat({"message": "Who is user 4?"}))
+    detailed, _ = asyncio.run(mcp_gateway.handle_chat({"message": "Who is user 4?", "detailed": True}))
+
+    assert lookup["templated"] and lookup["message"].startswith("User 4 is Leanne Graham")
+    assert "templated" not in detailed and detailed["message"] == "Model answer."
+    assert stages == ["answer"]  # Routed + templated: no Ollama call at all for the lookup
+
+def test_detailed_request_bypasses_the_answer_cache(gateway):
+    stages = []
+
+    async def fake_chat_stream(messages, tools=None, format=None, stage=None):
+        stages.append(stage)
+        yield {"message": {"role": "assistant", "content": "Model answer."}, "done": True}
+
+    async def fake_user_tool(user_id):
+        return dict(USER, id=user_id)
+
+    gateway(chat_stream=fake_chat_stream, tools={"get_user_info": fake_user_tool},
+            INTENT_ROUTER_ENABLED=True, TEMPLATE_ANSWERS_ENABLED=True, ANSWER_CACHE_ENABLED=True)
+
+    lookup, _ = asyncio.run(mcp_gateway.handle_chat({"message": "Who is user 1?"}))
+    detailed, _ = asyncio.run(mcp_gateway.handle_chat({"message": "Who is user 1?", "detailed": True}))
+
+    assert lookup["templated"]
+    assert "cached" not in detailed and detailed["message"] == "Model answer."
+    assert stages == ["answer"]
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test structured tool selection (offline - Ollama chat replaced by canned streams)
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+from mcp_gateway import (TOOL_REGISTRY, JsonObjectScanner, answer_messages, run_tool, select_tool,
+                         tool_call_schema, tool_selection_messages)
+
+QUESTION = [{"role": "user", "content": "question"}]
+
+def reply_with(gateway, pieces, tool_calls=None):
+    """Fake Ollama chat stream sending content pieces (and tool calls); records what was sent and generated"""
+    seen = {"requests": [], "sent": 0, "closed": False}
+
+    async def fake_chat_stream(messages, tools=None, format=None, stage=None):
+        seen["requests"].append({"tools": tools, "format": format})
+        try:
+            if tool_calls:
+                seen["sent"] += 1
+                yield {"message": {"role": "assistant", "content": "", "tool_calls": tool_calls}, "done": False}
+            for piece in pieces:
+                seen["sent"] += 1
+                yield {"message": {"role": "assistant", "content": piece}, "done": False}
+            yield {"message": {"role": "assistant", "content": ""}, "done": True}
+        finally:
+            seen["closed"] = True
+
+    gateway(chat_stream=fake_chat_stream)
+    return seen
+
+def test_schema_covers_every_tool_and_a_plain_answer():
+    options = tool_call_schema()["anyOf"]
+    tools = [option["properties"]["tool"]["const"] for option in options if "tool" in option["properties"]]
+    assert tools == list(TOOL_REGISTRY)
+    assert options[-1]["required"] == ["use_tool", "answer"]
+
+def test_scanner_handles_braces_and_quotes_inside_strings():
+    scanner = JsonObjectScanner()
+    pieces = ['Sure: {"use_tool": false, ', '"answer": "a } brace and a \\"quoted {\\" word"', '} and then more', '}']
+    results = [scanner.feed(piece) for piece in pieces]
+    assert results[:2] == [None, None]
+    assert json.loads(results[2])["answer"] == 'a } brace and a "quoted {" word'
+
+def test_constrained_tool_call_stops_when_object_closes(gateway):
+    gateway(OLLAMA_TOOL_CALLING="format")
+    decision = json.dumps({"use_tool": True, "tool": "get_post_comments", "parameters": {"post_id": 4}})
+    pieces = [decision[:10], decision[10:30], decision[30:]] + ["\n"] * 50  # Trailing whitespace never read
+    seen = reply_with(gateway, pieces)
+
+    assert asyncio.run(select_tool(QUESTION)) == ([{"tool": "get_post_comments", "parameters": {"post_id": 4}}], None)
+    assert seen["sent"] == 3 and seen["closed"]
+    assert seen["requests"][0]["format"] == tool_call_schema() and seen["requests"][0]["tools"] is None
+
+def test_constrained_plain_answer(gateway):
+    gateway(OLLAMA_TOOL_CALLING="format")
+    reply_with(gateway, [json.dumps({"use_tool": False, "answer": "Hello!"})])
+    assert asyncio.run(select_tool(QUESTION)) == ([], "Hello!")
+
+def test_native_tool_calls(gateway):
+    gateway(OLLAMA_TOOL_CALLING="tools")
+    seen = reply_with(gateway, ["never generated"], tool_calls=[{"function": {"name": "get_user_info", "arguments": {"user_id": 2}}}])
+    assert asyncio.run(select_tool(QUESTION)) == ([{"tool": "get_user_info", "parameters": {"user_id": 2}}], None)
+    assert len(seen["requests"][0]["tools"]) == len(TOOL_REGISTRY)
+    assert seen["sent"] == 1 and seen["closed"]
+
+def test_prompt_prefix_is_identical_across_requests():
+    english = tool_selection_messages("Who is user 1?", False)
+    hebrew = tool_selection_messages("מי זה משתמש 2?", True)
+    assert english[0] == hebrew[0]  # Cacheable system prefix
+    assert "Who is user 1?" in english[1]["content"] and "Hebrew" in hebrew[1]["content"]
+
+    first = answer_messages("Who is user 1?", False, "get_user_info", {"user_id": 1}, {"name": "Leanne"})
+    second = answer_messages("posts", False, "get_posts", {}, [{"id": 1}])
+    assert first[0] == second[0] and '"name": "Leanne"' in first[1]["content"]
+
+def test_run_tool_requires_registered_arguments():
+    assert asyncio.run(run_tool("get_user_info", {})) is None
+    assert asyncio.run(run_tool("delete_everything", {"user_id": 1})) is None
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
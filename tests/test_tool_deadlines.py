@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Test tool deadlines and cancelled-work metrics (offline, no API calls)
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import mcp_server
+from mcp_server import ToolMetrics, cancellable
+
+@cancellable
+async def slow_tool(delay: float):
+    await asyncio.sleep(delay)
+    return "done"
+
+@pytest.fixture
+def metrics(monkeypatch):
+    """Fresh tool metrics for each test"""
+    monkeypatch.setattr(mcp_server, "tool_metrics", ToolMetrics())
+    return mcp_server.tool_metrics
+
+def test_deadline_cancels_tool(metrics, monkeypatch):
+    monkeypatch.setattr(mcp_server, "TOOL_DEFAULT_TIMEOUT_SECONDS", 0.05)
+    with pytest.raises(TimeoutError) as error:
+        asyncio.run(slow_tool(1))
+    print(f"   {error.value}")
+
+    assert metrics.deadline_exceeded["slow_tool"] == 1
+    assert metrics.in_flight == 0
+    assert metrics.abandoned_seconds >= 0.05
+
+def test_client_cancel_is_counted(metrics):
+    async def cancel_midway():
+        task = asyncio.create_task(slow_tool(1))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(cancel_midway())
+    assert metrics.cancelled["slow_tool"] == 1
+    assert metrics.in_flight == 0
+
+def test_completed_call(metrics):
+    assert asyncio.run(slow_tool(0)) == "done"
+    assert metrics.completed["slow_tool"] == 1
+    assert metrics.snapshot()["deadline_exceeded"] == {}
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))